@@ -0,0 +1,342 @@
+"""Agregados materializados de la tabla de estudiantes.
+
+Por cada dimensión (y para el total, ``dimension = '*'``) se guardan conteo,
+suma, suma de cuadrados, mínimo y máximo de cada columna numérica, además de
+las sumas de productos cruzados entre pares de columnas. Son estadísticos
+suficientes y sumables: init_db.py los construye al cargar y los actualiza de
+forma incremental al anexar filas, y la API calcula medias, desviaciones y
+correlaciones en O(grupos) en lugar de O(filas).
+
+Para medianas, percentiles e histogramas se guarda además un *sketch*
+mergeable por grupo y columna: el conteo de filas por cubeta de ancho fijo
+(``10**-DECIMALS[columna]``, la precisión con la que vienen los datos). Como
+los conteos se suman igual que el resto de agregados, el sketch se mantiene al
+anexar filas, y los cuantiles salen de unos cientos de cubetas. El error es
+como mucho media cubeta, y es nulo si los datos no traen más decimales.
+"""
+from itertools import combinations
+
+import numpy as np
+
+from .schema import NUMERIC_COLUMNS, DIMENSIONS
+
+TOTAL = "*"
+# columna especial de stats_summary con el número de filas del grupo
+ROWS = "*"
+STATS_TABLE = "stats_summary"
+CROSS_TABLE = "stats_cross"
+SKETCH_TABLE = "stats_sketch"
+
+# Decimales de cada columna en el sketch (ancho de cubeta = 10**-decimales).
+# Cambiarlos exige reconstruir los agregados.
+DECIMALS = {**{c: 2 for c in NUMERIC_COLUMNS}, "Asistencia_%": 1, "Nivel_Preparación": 0}
+# Los bordes de histogramas y rejillas se redondean a estos decimales: así
+# ``lo + i * ancho`` no queda una fracción por encima de un valor exacto
+# (0.30000000000000004 frente a 0.3) y un valor sobre un borde cuenta en el
+# intervalo que empieza en él
+EDGE_DECIMALS = 9
+# Más celdas que esto en un lote (grupos × cubetas) se cuentan con np.unique
+_DENSE_LIMIT = 4_000_000
+
+PAIRS = list(combinations(range(len(NUMERIC_COLUMNS)), 2))
+
+DDL = [
+    f"""CREATE TABLE IF NOT EXISTS {STATS_TABLE} (
+      dimension TEXT NOT NULL, valor TEXT NOT NULL, columna TEXT NOT NULL,
+      n INTEGER NOT NULL, suma REAL, suma_cuadrados REAL, minimo REAL, maximo REAL,
+      PRIMARY KEY (dimension, valor, columna)
+    ) WITHOUT ROWID""",
+    f"""CREATE TABLE IF NOT EXISTS {CROSS_TABLE} (
+      dimension TEXT NOT NULL, valor TEXT NOT NULL, col_x TEXT NOT NULL, col_y TEXT NOT NULL,
+      n INTEGER NOT NULL, suma_x REAL, suma_y REAL, suma_xx REAL, suma_yy REAL, suma_xy REAL,
+      PRIMARY KEY (dimension, valor, col_x, col_y)
+    ) WITHOUT ROWID""",
+    f"""CREATE TABLE IF NOT EXISTS {SKETCH_TABLE} (
+      dimension TEXT NOT NULL, columna TEXT NOT NULL, valor TEXT NOT NULL, cubeta INTEGER NOT NULL,
+      n INTEGER NOT NULL,
+      PRIMARY KEY (dimension, columna, valor, cubeta)
+    ) WITHOUT ROWID""",
+]
+
+UPSERT_STATS = f"""
+INSERT INTO {STATS_TABLE} (dimension, valor, columna, n, suma, suma_cuadrados, minimo, maximo)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (dimension, valor, columna) DO UPDATE SET
+  n = n + excluded.n,
+  suma = suma + excluded.suma,
+  suma_cuadrados = suma_cuadrados + excluded.suma_cuadrados,
+  minimo = MIN(COALESCE(minimo, excluded.minimo), COALESCE(excluded.minimo, minimo)),
+  maximo = MAX(COALESCE(maximo, excluded.maximo), COALESCE(excluded.maximo, maximo))
+"""
+
+UPSERT_CROSS = f"""
+INSERT INTO {CROSS_TABLE} (dimension, valor, col_x, col_y, n, suma_x, suma_y, suma_xx, suma_yy, suma_xy)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (dimension, valor, col_x, col_y) DO UPDATE SET
+  n = n + excluded.n,
+  suma_x = suma_x + excluded.suma_x,
+  suma_y = suma_y + excluded.suma_y,
+  suma_xx = suma_xx + excluded.suma_xx,
+  suma_yy = suma_yy + excluded.suma_yy,
+  suma_xy = suma_xy + excluded.suma_xy
+"""
+
+UPSERT_SKETCH = f"""
+INSERT INTO {SKETCH_TABLE} (dimension, columna, valor, cubeta, n) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (dimension, columna, valor, cubeta) DO UPDATE SET n = n + excluded.n
+"""
+
+
+def create_tables(conn, drop=False):
+    if drop:
+        for table in (STATS_TABLE, CROSS_TABLE, SKETCH_TABLE):
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+    for ddl in DDL:
+        conn.execute(ddl)
+
+
+def exists(conn):
+    q = "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN (?, ?, ?)"
+    return conn.execute(q, (STATS_TABLE, CROSS_TABLE, SKETCH_TABLE)).fetchone()[0] == 3
+
+
+def label(value):
+    """Valor de dimensión como texto (``2.0`` -> ``'2'``)."""
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _moments(features):
+    """Conteos, sumas y productos cruzados por pares a partir de ``Aᵀ·A``.
+
+    ``features`` es ``[x | x² | válido]`` o, en lotes sin nulos, ``[x | 1]``
+    (mucho más estrecho). Devuelve matrices k×k: ``pair_n``, ``sum_x`` (suma de
+    x_i donde x_j es válido), ``sum_xx`` y ``sum_xy``.
+    """
+    k = len(NUMERIC_COLUMNS)
+    products = features.T @ features
+    if features.shape[1] == k + 1:
+        sums = products[:k, k]
+        sum_xy = products[:k, :k]
+        pair_n = np.full((k, k), products[k, k])
+        sum_x = np.repeat(sums[:, None], k, axis=1)
+        sum_xx = np.repeat(np.diag(sum_xy)[:, None], k, axis=1)
+        return pair_n, sum_x, sum_xx, sum_xy
+    return products[2 * k:, 2 * k:], products[:k, 2 * k:], products[k:2 * k, 2 * k:], products[:k, :k]
+
+
+def _group_rows(dimension, value, rows, features, mins, maxs):
+    """Filas de ambas tablas para un grupo."""
+    pair_n, sum_x, sum_xx, sum_xy = _moments(features)
+
+    stats = [(dimension, value, ROWS, int(rows), None, None, None, None)]
+    for i, col in enumerate(NUMERIC_COLUMNS):
+        n = int(pair_n[i, i])
+        stats.append((
+            dimension, value, col, n, float(sum_x[i, i]), float(sum_xx[i, i]),
+            float(mins[i]) if n else None,
+            float(maxs[i]) if n else None,
+        ))
+
+    # Sumas por pares solo sobre filas donde ambas columnas tienen valor
+    cross = [
+        (dimension, value, NUMERIC_COLUMNS[i], NUMERIC_COLUMNS[j], int(pair_n[i, j]),
+         float(sum_x[i, j]), float(sum_x[j, i]), float(sum_xx[i, j]), float(sum_xx[j, i]),
+         float(sum_xy[i, j]))
+        for i, j in PAIRS
+    ]
+    return stats, cross
+
+
+def _sketch_rows(dimension, labels, codes, values):
+    """Filas de stats_sketch: conteo por (grupo, columna, cubeta) de un lote."""
+    rows = []
+    for i, col in enumerate(NUMERIC_COLUMNS):
+        buckets = np.rint(values[:, i] * 10 ** DECIMALS[col])
+        valid = ~np.isnan(buckets) & (codes >= 0)
+        if not valid.any():
+            continue
+        b, g = buckets[valid].astype(np.int64), codes[valid]
+        low = int(b.min())
+        span = int(b.max()) - low + 1
+        keys = g * span + (b - low)
+        if span * len(labels) <= _DENSE_LIMIT:
+            counts = np.bincount(keys, minlength=span * len(labels))
+            keys = np.flatnonzero(counts)
+            counts = counts[keys]
+        else:
+            keys, counts = np.unique(keys, return_counts=True)
+        for key, n in zip(keys.tolist(), counts.tolist()):
+            group, offset = divmod(key, span)
+            rows.append((dimension, col, labels[group], low + offset, n))
+    return rows
+
+
+def partial_aggregates(df):
+    """Agregados parciales de un lote de filas, listos para sumarse a las tablas."""
+    import pandas as pd
+    k = len(NUMERIC_COLUMNS)
+    values = df.reindex(columns=NUMERIC_COLUMNS).apply(pd.to_numeric, errors="coerce").to_numpy(float)
+    missing = np.isnan(values)
+    complete = not missing.any()
+    if complete:
+        features = np.hstack([values, np.ones((len(values), 1))])
+    else:
+        x = np.where(missing, 0.0, values)
+        features = np.hstack([x, x * x, (~missing).astype(float)])
+
+    stats, cross = _group_rows(TOTAL, TOTAL, len(df), features,
+                               np.fmin.reduce(values, axis=0), np.fmax.reduce(values, axis=0))
+    sketch = _sketch_rows(TOTAL, [TOTAL], np.zeros(len(df), dtype=np.int64), values)
+    for dimension in DIMENSIONS:
+        if dimension not in df.columns:
+            continue
+        codes, uniques = pd.factorize(df[dimension])
+        if not len(uniques):
+            continue
+        sketch += _sketch_rows(dimension, [label(u) for u in uniques], codes, values)
+        # Ordenar por grupo para trabajar con tramos contiguos (sin valores nulos)
+        order = np.argsort(codes, kind="stable")
+        order = order[codes[order] >= 0]
+        starts = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        fs = features.take(order, axis=0)
+        # fmin/fmax ignoran NaN; en lotes completos x ya son los valores
+        vs = fs[:, :k] if complete else values.take(order, axis=0)
+        mins = np.fmin.reduceat(vs, starts[:-1])
+        maxs = np.fmax.reduceat(vs, starts[:-1])
+        for code, value in enumerate(uniques):
+            lo, hi = starts[code], starts[code + 1]
+            s, c = _group_rows(dimension, label(value), hi - lo, fs[lo:hi], mins[code], maxs[code])
+            stats += s
+            cross += c
+    return stats, cross, sketch
+
+
+def accumulate(conn, df):
+    """Suma los agregados de ``df`` (filas recién insertadas) a las tablas."""
+    if df.empty:
+        return
+    stats, cross, sketch = partial_aggregates(df)
+    conn.executemany(UPSERT_STATS, stats)
+    conn.executemany(UPSERT_CROSS, cross)
+    conn.executemany(UPSERT_SKETCH, sketch)
+
+
+def rebuild(conn, df):
+    """Recrea las tablas de agregados a partir de todas las filas de ``df``."""
+    create_tables(conn, drop=True)
+    accumulate(conn, df)
+
+
+def rebuild_from_table(conn, table, chunksize=200_000):
+    """Recrea los agregados leyendo la tabla por lotes (memoria acotada)."""
+    import pandas as pd
+    create_tables(conn, drop=True)
+    for chunk in pd.read_sql(f'SELECT * FROM "{table}"', conn, chunksize=chunksize):
+        accumulate(conn, chunk)
+
+
+# ----- Estadísticos derivados -----
+def mean(n, total):
+    return total / n if n else None
+
+
+def std(n, total, squares):
+    """Desviación estándar muestral a partir de conteo, suma y suma de cuadrados."""
+    if not n or n < 2:
+        return None
+    return (max(squares - total * total / n, 0.0) / (n - 1)) ** 0.5
+
+
+def pearson(n, sx, sy, sxx, syy, sxy):
+    if not n or n < 2:
+        return None
+    cov = sxy - sx * sy / n
+    var_x = sxx - sx * sx / n
+    var_y = syy - sy * sy / n
+    if var_x <= 0 or var_y <= 0:
+        return None
+    return cov / (var_x * var_y) ** 0.5
+
+
+def regression(n, sx, sy, sxx, syy, sxy):
+    """Recta de mínimos cuadrados ``y = intercepto + pendiente·x`` y su R²."""
+    if not n or n < 2:
+        return None
+    var_x = sxx - sx * sx / n
+    if var_x <= 0:
+        return None
+    slope = (sxy - sx * sy / n) / var_x
+    r = pearson(n, sx, sy, sxx, syy, sxy)
+    return slope, (sy - slope * sx) / n, None if r is None else r * r
+
+
+# ----- Cuantiles e histogramas a partir del sketch -----
+def sketch_values(column, buckets):
+    """Valor representado por cada cubeta."""
+    return np.asarray(buckets, dtype=float) / 10 ** DECIMALS[column]
+
+
+def quantiles(values, counts, qs):
+    """Cuantiles con interpolación lineal (como ``numpy.quantile``).
+
+    ``values`` son los valores de las cubetas en orden creciente y ``counts``
+    sus conteos: la fila de rango r está en la primera cubeta con acumulado > r.
+    """
+    cum = np.cumsum(counts)
+    pos = np.asarray(qs, dtype=float) * (cum[-1] - 1)
+    below, above = np.floor(pos), np.ceil(pos)
+    lo = values[np.searchsorted(cum, below, side="right")]
+    hi = values[np.searchsorted(cum, above, side="right")]
+    return lo + (hi - lo) * (pos - below)
+
+
+def histogram(values, counts, lo, hi, bins):
+    """Bordes y conteos de ``bins`` intervalos iguales entre ``lo`` y ``hi`` (el último incluye ``hi``).
+
+    Cada valor se compara con los bordes que se devuelven, no con un cociente
+    truncado: un valor sobre un borde interior cuenta en el intervalo de arriba.
+    """
+    width = (hi - lo) / bins or 1.0
+    edges = np.round(lo + np.arange(bins + 1) * width, EDGE_DECIMALS)
+    index = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, bins - 1)
+    return edges, np.bincount(index, weights=counts, minlength=bins)
+
+
+# ----- Combinación de agregados parciales (una base por escuela) -----
+def merge_sketch(a, b):
+    """Une dos sketches ``(valores, conteos)`` sumando los conteos de las cubetas comunes."""
+    values, index = np.unique(np.concatenate([a[0], b[0]]), return_inverse=True)
+    return values, np.bincount(index, weights=np.concatenate([a[1], b[1]]))
+
+
+def _merge_value(a, b, key=None):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if isinstance(a, dict):
+        return {k: _merge_value(a.get(k), b.get(k), k) for k in dict.fromkeys([*a, *b])}
+    if isinstance(a, tuple):
+        return merge_sketch(a, b)
+    if isinstance(a, list):
+        return a + b
+    if key == "minimo":
+        return min(a, b)
+    if key == "maximo":
+        return max(a, b)
+    return a + b
+
+
+def merge(parts):
+    """Combina agregados parciales con la misma forma calculados en bases distintas.
+
+    Los diccionarios se unen por clave; ``minimo`` y ``maximo`` se quedan con el
+    extremo, los sketches suman conteos por cubeta, las listas se concatenan y
+    el resto de números (conteos y sumas) se suman. None es un parcial vacío.
+    """
+    merged = None
+    for part in parts:
+        merged = _merge_value(merged, part)
+    return merged
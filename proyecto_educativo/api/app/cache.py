@@ -0,0 +1,85 @@
+"""Caché de resultados de la API en memoria del proceso.
+
+Los agregados solo cambian cuando init_db.py carga datos, y en cada carga se
+incrementa ``PRAGMA user_version``. Las respuestas se guardan ya serializadas,
+con clave (endpoint, parámetros normalizados), y la caché se vacía cuando cambia
+esa versión. Además de caducar a los ``TTL`` segundos, las entradas se descartan
+por LRU al superar ``MAX_ENTRIES``. La versión también forma parte del ETag, así
+que los clientes y proxies pueden revalidar con ``If-None-Match`` y recibir un
+304 sin que se ejecute ninguna consulta.
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "512"))
+TTL = float(os.environ.get("CACHE_TTL", "300"))
+# max-age para clientes: pasado ese tiempo revalidan con el ETag
+MAX_AGE = int(os.environ.get("CACHE_MAX_AGE", "60"))
+# cada cuántos segundos se vuelve a leer la versión de los datos
+VERSION_CHECK = float(os.environ.get("CACHE_VERSION_CHECK", "1.0"))
+
+
+def make_key(endpoint, args):
+    return f"{endpoint}:{args!r}"
+
+
+def etag(version, key):
+    return f'"{version}-{hashlib.sha1(key.encode()).hexdigest()[:16]}"'
+
+
+def matches(if_none_match, tag):
+    """True si la cabecera If-None-Match incluye ``tag`` (o es ``*``)."""
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or tag in tags
+
+
+class ResultCache:
+    """LRU con caducidad; solo se usa desde el bucle de eventos (sin bloqueos)."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL):
+        self.max_entries, self.ttl = max_entries, ttl
+        self.version = None
+        self.checked = float("-inf")
+        self._entries = OrderedDict()
+
+    def version_stale(self):
+        return time.monotonic() - self.checked >= VERSION_CHECK
+
+    def set_version(self, version):
+        self.checked = time.monotonic()
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value, version):
+        # Un resultado calculado con una versión anterior no se guarda
+        if version != self.version:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+results = ResultCache()
@@ -0,0 +1,246 @@
+"""Instantánea columnar de ``students`` en archivos .npy mapeados en memoria.
+
+init_db.py (con ``--columnar``, o siempre que ya exista una) escribe junto a
+la base un directorio ``<base>.columnas/v<versión>/`` con un archivo por
+columna: las numéricas en float32 (NaN = NULL) y las dimensiones
+(``schema.DIMENSIONS``) codificadas como enteros pequeños sobre un
+diccionario ordenado (-1 = NULL), guardado en ``meta.json``. El nombre y el
+resto de texto libre no se copian: la instantánea solo sirve filtros y
+agrupaciones.
+
+La API la abre con ``np.load(mmap_mode="r")``: los workers de uvicorn
+comparten las páginas de la caché del sistema en lugar de tener cada uno su
+copia. Las consultas con filtros combinados, que no cubren las tablas de
+agregados, se resuelven con máscaras y ``np.bincount`` sobre estos arreglos
+en lugar de recorrer la tabla (ver ``crud``). La instantánea solo se usa si su
+versión coincide con la de la base (``PRAGMA user_version``); si no, se
+vuelve a SQL. Publicar una nueva es atómico (se escribe aparte y el archivo
+``ACTUAL`` se sustituye con ``os.replace``) y cada conexión carga la nueva al
+ver que cambió la versión.
+
+``STUDENTS_COLUMNAR=0`` desactiva su uso en la API.
+"""
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from .aggregates import DECIMALS, TOTAL, label
+from .db import data_version
+from .schema import ALL_TYPES, DIMENSIONS, KEY, TABLE
+
+ENABLED = os.environ.get("STUDENTS_COLUMNAR", "1") != "0"
+CURRENT = "ACTUAL"
+META = "meta.json"
+
+
+def root(db_path):
+    db_path = Path(db_path)
+    return db_path.with_name(db_path.name + ".columnas")
+
+
+def exists(db_path):
+    return (root(db_path) / CURRENT).exists()
+
+
+# ----- ESCRITURA (init_db.py) -----
+def _codes_dtype(size):
+    return np.int8 if size < 127 else np.int16 if size < 32_767 else np.int32
+
+
+def write(conn, db_path):
+    """Escribe la instantánea de la versión actual de la base y la publica; devuelve su directorio."""
+    base = root(db_path)
+    version = data_version(conn)
+    n = conn.execute(f'SELECT COUNT(*) FROM "{TABLE}"').fetchone()[0]
+    columns = [r[1] for r in conn.execute(f'PRAGMA table_info("{TABLE}")').fetchall()]
+    tmp = base / f".tmp-{version}-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    meta = {"version": version, "filas": n, "valores": {}, "codigos": {}, "diccionarios": {}}
+    order = f'ORDER BY "{KEY}"'
+    for i, column in enumerate(columns):
+        kind = ALL_TYPES.get(column, "TEXT").split()[0]
+        if column in DIMENSIONS:
+            q = f'SELECT DISTINCT "{column}" FROM "{TABLE}" WHERE "{column}" IS NOT NULL ORDER BY 1'
+            values = [r[0] for r in conn.execute(q)]
+            codes = {v: code for code, v in enumerate(values)}
+            cur = conn.execute(f'SELECT "{column}" FROM "{TABLE}" {order}')
+            array = np.fromiter((codes.get(v, -1) for (v,) in cur), dtype=_codes_dtype(len(values)), count=n)
+            meta["diccionarios"][column] = [label(v) for v in values]
+            meta["codigos"][column] = _save(tmp, f"{i}.codigos.npy", array)
+        if kind in ("REAL", "INTEGER"):
+            dtype = np.int64 if column == KEY else np.float32
+            cur = conn.execute(f'SELECT "{column}" FROM "{TABLE}" {order}')
+            array = np.fromiter((np.nan if v is None else v for (v,) in cur), dtype=dtype, count=n)
+            meta["valores"][column] = _save(tmp, f"{i}.npy", array)
+    (tmp / META).write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+    # Publicar: directorio definitivo y puntero ACTUAL sustituido de una vez
+    final = base / f"v{version}"
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(tmp, final)
+    pointer = base / f".{CURRENT}.tmp"
+    pointer.write_text(final.name, encoding="utf-8")
+    os.replace(pointer, base / CURRENT)
+    # Las versiones anteriores ya no se publican; en POSIX los workers que aún
+    # las tengan mapeadas siguen leyéndolas hasta recargar. Lo que no se pueda
+    # borrar (archivos abiertos en Windows) se reintenta en la próxima carga.
+    for old in base.iterdir():
+        if old.is_dir() and old.name != final.name and not old.name.startswith(".tmp"):
+            shutil.rmtree(old, ignore_errors=True)
+    return final
+
+
+def _save(directory, name, array):
+    np.save(directory / name, array)
+    return name
+
+
+# ----- LECTURA (API) -----
+class Snapshot:
+    """Columnas mapeadas de una versión de la base, con filtros y agrupaciones vectorizados."""
+
+    def __init__(self, directory):
+        directory = Path(directory)
+        meta = json.loads((directory / META).read_text(encoding="utf-8"))
+        self.version, self.n = meta["version"], meta["filas"]
+        self.values = {c: np.load(directory / f, mmap_mode="r") for c, f in meta["valores"].items()}
+        self.codes = {c: np.load(directory / f, mmap_mode="r") for c, f in meta["codigos"].items()}
+        self.labels = meta["diccionarios"]
+        self._lookup = {c: {v: code for code, v in enumerate(vals)} for c, vals in self.labels.items()}
+
+    def mask(self, filters=None, *present):
+        """Filas con los valores de ``filters`` ({columna: valor}) y con valor en las columnas ``present``."""
+        mask = np.ones(self.n, dtype=bool)
+        for column, value in (filters or {}).items():
+            code = self._lookup[column].get(label(value))
+            if code is None:
+                return np.zeros(self.n, dtype=bool)
+            mask &= self.codes[column] == code
+        for column in present:
+            mask &= self.codes[column] >= 0 if column in self.codes else ~np.isnan(self.values[column])
+        return mask
+
+    def column(self, column, mask):
+        """Valores de las filas de ``mask`` en float64, con los decimales con que se cargaron."""
+        values = self.values[column][mask].astype(np.float64)
+        return np.round(values, DECIMALS[column]) if column in DECIMALS else values
+
+    def _groups(self, by, mask):
+        """Código de segmento de cada fila de ``mask`` y etiquetas (sin ``by``, un único total)."""
+        if by is None:
+            return np.zeros(int(mask.sum()), dtype=np.intp), [TOTAL]
+        return self.codes[by][mask].astype(np.intp), self.labels[by]
+
+    def summary(self, column, filters=None):
+        """Como crud._rows_summary: conteo, sumas y extremos de las filas con valor."""
+        v = self.column(column, self.mask(filters, column))
+        if not v.size:
+            return {"n": 0, "suma": None, "suma_cuadrados": None, "minimo": None, "maximo": None}
+        return {"n": int(v.size), "suma": float(v.sum()), "suma_cuadrados": float(v @ v),
+                "minimo": float(v.min()), "maximo": float(v.max())}
+
+    def groups(self, by, column, filters=None):
+        """{segmento: {n, suma}} de ``column`` por valor de ``by``."""
+        mask = self.mask(filters, by, column)
+        codes, labels = self._groups(by, mask)
+        n = np.bincount(codes, minlength=len(labels))
+        suma = np.bincount(codes, weights=self.column(column, mask), minlength=len(labels))
+        return {labels[i]: {"n": int(n[i]), "suma": float(suma[i])} for i in np.flatnonzero(n)}
+
+    def sketch(self, by, column, filters=None):
+        """Como crud._rows_sketch: {segmento: (valores, conteos)} con un solo bincount de segmento × cubeta."""
+        mask = self.mask(filters, column, *([by] if by else []))
+        codes, labels = self._groups(by, mask)
+        if not codes.size:
+            return {}
+        buckets = np.rint(self.column(column, mask) * 10 ** DECIMALS[column]).astype(np.int64)
+        lo = int(buckets.min())
+        width = int(buckets.max()) - lo + 1
+        counts = np.bincount(codes * width + (buckets - lo), minlength=len(labels) * width)
+        result = {}
+        for code, row in enumerate(counts.reshape(len(labels), width)):
+            filled = np.flatnonzero(row)
+            if filled.size:
+                result[labels[code]] = (
+                    (filled + lo).astype(float) / 10 ** DECIMALS[column], row[filled].astype(float)
+                )
+        return result
+
+    def pair_sums(self, pairs, by=None, filters=None):
+        """Como crud._pair_sums: sumas cruzadas de cada par por segmento, solo con filas con ambos valores."""
+        mask = self.mask(filters, *([by] if by else []))
+        codes, labels = self._groups(by, mask)
+        segments = np.flatnonzero(np.bincount(codes, minlength=len(labels)))
+        result = {labels[i]: {} for i in segments}
+        columns = {c: self.column(c, mask) for c in dict.fromkeys(c for pair in pairs for c in pair)}
+        for x, y in pairs:
+            vx, vy = columns[x], columns[y]
+            both = ~(np.isnan(vx) | np.isnan(vy))
+            c, vx, vy = codes[both], vx[both], vy[both]
+            n = np.bincount(c, minlength=len(labels))
+            sums = [np.bincount(c, weights=w, minlength=len(labels)) for w in (vx, vy, vx * vx, vy * vy, vx * vy)]
+            for i in segments:
+                values = [float(s[i]) if n[i] else None for s in sums]
+                result[labels[i]][(x, y)] = dict(zip(
+                    ["n", "suma_x", "suma_y", "suma_xx", "suma_yy", "suma_xy"], [int(n[i])] + values
+                ))
+        return result
+
+    def count_below(self, thresholds, filters=None):
+        """Filas con cada columna de ``thresholds`` por debajo de su umbral."""
+        mask = self.mask(filters)
+        for column, threshold in thresholds.items():
+            # Se compara en float32, como están guardados los valores
+            mask &= self.values[column] < np.float32(threshold)
+        return int(np.count_nonzero(mask))
+
+    def bounds(self, x, y, filters=None):
+        """Filas con ambos valores y extremos de cada eje (primera pasada de la dispersión)."""
+        mask = self.mask(filters, x, y)
+        n = int(np.count_nonzero(mask))
+        axes = {}
+        for name, column in (("x", x), ("y", y)):
+            v = self.column(column, mask)
+            axes[name] = {"minimo": float(v.min()) if n else None, "maximo": float(v.max()) if n else None}
+        return n, axes
+
+
+_snapshots = {}
+_lock = threading.Lock()
+
+
+def load(db_path, version):
+    """Instantánea publicada de ``version``, o None si la publicada es otra (o no hay ninguna)."""
+    base = root(db_path)
+    try:
+        published = (base / CURRENT).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    return Snapshot(base / published) if published == f"v{version}" else None
+
+
+def current(conn):
+    """Instantánea de la base de ``conn`` si está al día con sus datos; si no, None (se usa SQL).
+
+    Se recarga al cambiar la versión de la base; mientras, las peticiones en
+    curso siguen con la que ya tenían. Hasta que init_db.py publique la de la
+    nueva versión solo se relee el puntero ``ACTUAL``.
+    """
+    path = getattr(conn, "path", None)
+    if not ENABLED or path is None:
+        return None
+    version = data_version(conn)
+    snapshot = _snapshots.get(path)
+    if snapshot is None or snapshot.version != version:
+        with _lock:
+            snapshot = _snapshots.get(path)
+            if snapshot is None or snapshot.version != version:
+                snapshot = load(path, version)
+                if snapshot is not None:
+                    _snapshots[path] = snapshot
+    return snapshot
@@ -1,20 +1,842 @@
-from .db import engine
-import pandas as pd
+import json
+from contextlib import closing
+
+from .db import DB_FILE, read_connection
+from . import aggregates, columnar, history, risk, search
+from .schema import TABLE, KEY, GRADE_COLUMNS, NUMERIC_COLUMNS, DIMENSIONS, SCORE_COLUMN
+import numpy as np
+
+STREAM_BATCH = 1000
+
+# Filtros de igualdad que acepta el dashboard (parámetro -> columna)
+FILTERS = {"profesor": "Profesor", "grupo": "Grupo"}
+
+# Columnas reales de la tabla por base (una por escuela)
+_columns = {}
+
+def get_columns(path=DB_FILE):
+    """Columnas reales de la tabla (cacheadas tras la primera consulta)."""
+    if path not in _columns:
+        conn = read_connection(path)
+        try:
+            _columns[path] = table_columns(conn)
+        finally:
+            conn.close()
+    return _columns[path]
+
+def table_columns(conn):
+    return [r[1] for r in conn.execute(f'PRAGMA table_info("{TABLE}")').fetchall()]
+
+def resolve_fields(fields=None, columns=None):
+    """Valida la proyección pedida; la clave de paginación siempre va primero."""
+    columns = columns or get_columns()
+    if not fields:
+        return columns
+    unknown = [f for f in fields if f not in columns]
+    if unknown:
+        raise KeyError(", ".join(unknown))
+    return [KEY] + [f for f in dict.fromkeys(fields) if f != KEY]
+
+def student_batches(after=None, limit=None, fields=None, path=DB_FILE, filters=None):
+    """Columnas y generador de lotes de filas leídos directamente del cursor de SQLite.
+
+    Paginación por clave (keyset): devuelve filas con ``ID_Estudiante > after``
+    ordenadas por ``ID_Estudiante``; el cliente pide la siguiente página con el
+    último ID recibido. Con ``filters`` (profesor, grupo) se recorre su índice,
+    que ya está en orden de ID dentro de cada valor. Las columnas se validan
+    antes de abrir la conexión. ``path`` es la base de la escuela (ver shards.py).
+    """
+    cols, q, params = students_query(after, limit, fields, path, filters)
+    return cols, _fetch_batches(q, params, path)
+
+def students_query(after=None, limit=None, fields=None, path=DB_FILE, filters=None):
+    """Columnas, SQL y parámetros de una página de ``student_batches``."""
+    cols = resolve_fields(fields, get_columns(path))
+    select = ", ".join(f'"{c}"' for c in cols)
+    where, params = _where(filters, *([f'"{KEY}" > ?'] if after is not None else []))
+    if after is not None:
+        params.insert(0, after)
+    q = f'SELECT {select} FROM {TABLE}{where} ORDER BY "{KEY}"'
+    if limit is not None:
+        q += " LIMIT ?"
+        params.append(limit)
+    return cols, q, params
+
+def export_batches(filters=None, promedio=None, asistencia=None, q=None, fields=None, path=DB_FILE):
+    """Columnas y lotes de /export: todas las filas que cumplen los filtros del dashboard.
+
+    Mismos filtros que las vistas (profesor, grupo, umbrales de riesgo y
+    búsqueda por nombre o ID exacto), sin límite de filas. Con umbrales se
+    ordena como /at-risk (los casos más críticos primero); si no, por ID.
+    """
+    cols, q, params = export_query(filters, promedio, asistencia, q, fields, path)
+    return cols, _fetch_batches(q, params, path, label="export_batches")
+
+def export_query(filters=None, promedio=None, asistencia=None, q=None, fields=None, path=DB_FILE):
+    """Columnas, SQL y parámetros de ``export_batches``."""
+    cols = resolve_fields(fields, get_columns(path))
+    source, key, conditions, params = f"{TABLE} s", f's."{KEY}"', [], []
+    for column, threshold in (("Promedio_General", promedio), ("Asistencia_%", asistencia)):
+        if threshold is not None:
+            conditions.append(f's."{column}" < ?')
+            params.append(threshold)
+    text = (q or "").strip()
+    if text.isdigit():
+        conditions.append(f's."{KEY}" = ?')
+        params.append(int(text))
+    elif text:
+        # Como en /students/search: el índice FTS5 recorre las coincidencias en orden de ID
+        source = f'{search.FTS_TABLE} JOIN {TABLE} s ON s."{KEY}" = {search.FTS_TABLE}.rowid'
+        key = f"{search.FTS_TABLE}.rowid"
+        conditions.append(f"{search.FTS_TABLE} MATCH ?")
+        # Sin palabras no hay coincidencias
+        params.append(search.match_query(text) or '""')
+    where, filter_params = _where(filters, *conditions)
+    risk_order = promedio is not None or asistencia is not None
+    order = ", ".join(f's."{c}"' for c in RISK_ORDER) if risk_order else key
+    select = ", ".join(f's."{c}"' for c in cols)
+    sql = f"SELECT {select} FROM {source}{where} ORDER BY {order}"
+    return cols, sql, params + filter_params
+
+def _fetch_batches(q, params, path, label="student_batches"):
+    conn = read_connection(path)
+    conn.label = label
+    try:
+        # conn.execute (y no un cursor) para que la consulta quede medida en metrics.py
+        cur = conn.execute(q, params)
+        while True:
+            rows = cur.fetchmany(STREAM_BATCH)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+# Las consultas de aquí en adelante reciben la conexión como primer argumento:
+# la API les pasa una del pool de solo lectura de la escuela (shards.py) y los
+# scripts la suya.
+
+# ----- ESTUDIANTES EN RIESGO -----
+RISK_ORDER = ["Promedio_General", "Asistencia_%", KEY]
+RISK_FIELDS = [KEY, "Nombre", "Género", "Grupo", "Profesor", "Promedio_General", "Asistencia_%", "En_Riesgo"]
+
+def encode_cursor(row):
+    return ":".join(repr(row[c]) for c in RISK_ORDER)
+
+def decode_cursor(cursor: str):
+    promedio, asistencia, key = cursor.split(":")
+    return [float(promedio), float(asistencia), int(key)]
+
+def get_at_risk(conn, promedio: float, asistencia: float, filters=None, limit: int = 100,
+                cursor=None, fields=None, count_only=False):
+    """Estudiantes con promedio y asistencia bajo los umbrales.
+
+    Se recorren en el orden del índice (Promedio_General, Asistencia_%, ID) y se
+    pagina por clave: ``cursor`` es el valor de ``next`` de la página anterior.
+    """
+    if count_only:
+        return count_at_risk(conn, promedio, asistencia, filters)
+    where, params = _where(filters, '"Promedio_General" < ?', '"Asistencia_%" < ?')
+    params = [promedio, asistencia] + params
+    cols = list(dict.fromkeys(resolve_fields(fields or RISK_FIELDS, table_columns(conn)) + RISK_ORDER))
+    if cursor:
+        where += ' AND ("Promedio_General", "Asistencia_%", "ID_Estudiante") > (?, ?, ?)'
+        params += decode_cursor(cursor)
+    order = ", ".join(f'"{c}"' for c in RISK_ORDER)
+    select = ", ".join(f'"{c}"' for c in cols)
+    q = f"SELECT {select} FROM {TABLE}{where} ORDER BY {order} LIMIT ?"
+    rows = _records(conn, q, params + [limit])
+    return {"columns": cols, "rows": rows, "next": encode_cursor(rows[-1]) if len(rows) == limit else None}
+
+def count_at_risk(conn, promedio: float, asistencia: float, filters=None):
+    snapshot = columnar.current(conn)
+    if snapshot:
+        thresholds = {"Promedio_General": promedio, "Asistencia_%": asistencia}
+        return {"total": snapshot.count_below(thresholds, _active(filters))}
+    where, params = _where(filters, '"Promedio_General" < ?', '"Asistencia_%" < ?')
+    q = f"SELECT COUNT(*) AS total FROM {TABLE}{where}"
+    return _records(conn, q, [promedio, asistencia] + params)[0]
+
+def count_students(conn, filters=None):
+    """Total de estudiantes con los filtros de /students."""
+    snapshot = columnar.current(conn)
+    if snapshot:
+        return {"total": snapshot.count_below({}, _active(filters))}
+    where, params = _where(filters)
+    return _records(conn, f"SELECT COUNT(*) AS total FROM {TABLE}{where}", params)[0]
+
+# ----- BÚSQUEDA -----
+SEARCH_FIELDS = [KEY, "Nombre", "Género", "Etnia", "Grupo", "Profesor", "Promedio_General", "Asistencia_%", "En_Riesgo"]
+
+def search_students(conn, q: str, limit: int = 20, after=None, filters=None):
+    """Estudiantes cuyo nombre contiene palabras que empiezan por las de ``q``.
+
+    Un ``q`` solo con dígitos es un ID exacto (búsqueda por clave primaria). Sin
+    distinguir mayúsculas ni tildes, en orden de ID y paginado por clave:
+    ``after`` es el valor de ``next`` de la página anterior.
+    """
+    select = ", ".join(f's."{c}"' for c in SEARCH_FIELDS)
+    q = q.strip()
+    if q.isdigit():
+        where, params = _where(filters, f's."{KEY}" = ?')
+        rows = _records(conn, f"SELECT {select} FROM {TABLE} s{where}", [int(q)] + params)
+        return {"rows": rows, "next": None}
+
+    expr = search.match_query(q)
+    if not expr:
+        return {"rows": [], "next": None}
+    conditions, start = [f"{search.FTS_TABLE} MATCH ?"], [expr]
+    if after is not None:
+        conditions.append(f"{search.FTS_TABLE}.rowid > ?")
+        start.append(after)
+    where, params = _where(filters, *conditions)
+    sql = (f"SELECT {select} FROM {search.FTS_TABLE} JOIN {TABLE} s ON s.\"{KEY}\" = {search.FTS_TABLE}.rowid"
+           f"{where} ORDER BY {search.FTS_TABLE}.rowid LIMIT ?")
+    rows = _records(conn, sql, start + params + [limit])
+    return {"rows": rows, "next": rows[-1][KEY] if len(rows) == limit else None}
+
+# ----- PUNTAJE DE RIESGO -----
+def get_risk_score(conn, student_id: int):
+    """Puntaje guardado de un estudiante con el déficit y el peso de cada variable."""
+    select = ", ".join(f'"{c}"' for c in [KEY, "Nombre", SCORE_COLUMN] + risk.FEATURES)
+    rows = _records(conn, f'SELECT {select} FROM {TABLE} WHERE "{KEY}" = ?', [student_id])
+    if not rows:
+        return None
+    r = rows[0]
+    # Pesos y umbral con que se calculó el puntaje guardado (score_risk.py)
+    weights, threshold = risk.load_config(conn)
+    values = np.array([[r[c] for c in risk.FEATURES]], dtype=float)
+    deficits = risk.deficits(values)[0]
+    puntaje = r[SCORE_COLUMN]
+    if puntaje is None:
+        # Fila aún sin puntuar: se calcula al vuelo
+        puntaje = risk.score(values, weights)[0]
+        puntaje = None if np.isnan(puntaje) else float(puntaje)
+    return {
+        KEY: r[KEY],
+        "Nombre": r["Nombre"],
+        "puntaje": puntaje,
+        "en_riesgo": None if puntaje is None else puntaje >= threshold,
+        "componentes": [
+            {"variable": c, "valor": r[c], "deficit": None if np.isnan(d) else float(d), "peso": weights[c]}
+            for c, d in zip(risk.FEATURES, deficits)
+        ],
+    }
+
+def score_students(conn, ids, weights=None):
+    """Puntajes de varios estudiantes en una pasada, opcionalmente con otros pesos."""
+    weights = {**risk.load_config(conn)[0], **(weights or {})}
+    risk.weights_vector(weights)
+    select = ", ".join(f'"{c}"' for c in [KEY] + risk.FEATURES)
+    q = f'SELECT {select} FROM {TABLE} WHERE "{KEY}" IN (SELECT value FROM json_each(?))'
+    rows = conn.execute(q, (json.dumps(list(ids)),)).fetchall()
+    if not rows:
+        return []
+    data = np.array(rows, dtype=float)
+    scores = risk.score(data[:, 1:], weights)
+    return [
+        {KEY: r[0], "puntaje": None if np.isnan(s) else float(s)}
+        for r, s in zip(rows, scores)
+    ]
+
+def get_risk_ranking(conn, limit: int = 100, minimo: float = 0.0, filters=None):
+    """Estudiantes con mayor puntaje de riesgo (recorre el índice del puntaje)."""
+    where, params = _where(filters, f'"{SCORE_COLUMN}" >= ?')
+    select = ", ".join(f'"{c}"' for c in [KEY, "Nombre", "Grupo", "Profesor", SCORE_COLUMN])
+    q = f'SELECT {select} FROM {TABLE}{where} ORDER BY "{SCORE_COLUMN}" DESC, "{KEY}" LIMIT ?'
+    return _records(conn, q, [minimo] + params + [limit])
 
 def get_preview(limit: int = 100):
-    q = f"SELECT * FROM students LIMIT {limit}"
-    return pd.read_sql(q, engine).to_dict(orient="records")
-
-def get_summary_by_gender():
-    q = "SELECT gender, COUNT(*) as count FROM students GROUP BY gender"
-    return pd.read_sql(q, engine).to_dict(orient="records")
-
-def get_subjects_averages():
-    q = """
-    SELECT 
-      AVG(math_score) as avg_math,
-      AVG(reading_score) as avg_reading,
-      AVG(writing_score) as avg_writing
-    FROM students
-    """
-    return pd.read_sql(q, engine).to_dict(orient="records")[0]
+    with closing(read_connection()) as conn:
+        return _records(conn, f"SELECT * FROM {TABLE} LIMIT ?", [limit])
+
+# ----- AGREGADOS -----
+def _check(column, allowed):
+    if column not in allowed:
+        raise KeyError(column)
+    return f'"{column}"'
+
+def _active(filters):
+    return {FILTERS[k]: v for k, v in (filters or {}).items() if v is not None}
+
+def _where(filters=None, *conditions):
+    """WHERE con las condiciones dadas y los filtros de igualdad no vacíos."""
+    clauses, params = list(conditions), []
+    for column, value in _active(filters).items():
+        clauses.append(f'"{column}" = ?')
+        params.append(value)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+def _records(conn, q, params=None):
+    """Filas como diccionarios leídas directamente del cursor (sin pandas)."""
+    cur = conn.execute(q, tuple(params or ()))
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, r)) for r in cur.fetchall()]
+
+def _scalar(conn, q, params=None):
+    return conn.execute(q, tuple(params or ())).fetchone()
+
+def _segment(filters):
+    """Dimensión/valor de las tablas de agregados que corresponde a los filtros.
+
+    Sin filtros es el total; con un único filtro, el grupo de esa dimensión.
+    Devuelve None si hay que recurrir a la tabla base (filtros combinados).
+    """
+    active = _active(filters)
+    if not active:
+        return aggregates.TOTAL, aggregates.TOTAL
+    if len(active) == 1:
+        return next(iter(active.items()))
+    return None
+
+def _summary(conn, dimension, value, columns):
+    q = f"""
+    SELECT columna, n, suma, suma_cuadrados, minimo, maximo FROM {aggregates.STATS_TABLE}
+    WHERE dimension = ? AND valor = ? AND columna IN ({", ".join("?" * len(columns))})
+    """
+    rows = _records(conn, q, [dimension, value] + list(columns))
+    return {r.pop("columna"): r for r in rows}
+
+def _sketch(conn, dimension, column, value=None):
+    """Cubetas del sketch por valor de la dimensión: {valor: (valores, conteos)}."""
+    q = f"SELECT valor, cubeta, n FROM {aggregates.SKETCH_TABLE} WHERE dimension = ? AND columna = ?"
+    params = [dimension, column]
+    if value is not None:
+        q += " AND valor = ?"
+        params.append(value)
+    groups = {}
+    for valor, cubeta, n in conn.execute(q + " ORDER BY valor, cubeta", params):
+        groups.setdefault(valor, ([], []))
+        groups[valor][0].append(cubeta)
+        groups[valor][1].append(n)
+    return {
+        k: (aggregates.sketch_values(column, b), np.array(n, dtype=float))
+        for k, (b, n) in groups.items()
+    }
+
+def _rows_sketch(conn, g, v, column, where, params):
+    """Mismo formato que ``_sketch`` a partir de la tabla base (filtros combinados).
+
+    Las filas se cuentan por cubeta en SQL: de cada segmento llegan unos cientos de conteos.
+    """
+    scale = 10 ** aggregates.DECIMALS[column]
+    q = f"SELECT {g}, CAST(ROUND({v} * {scale}) AS INTEGER), COUNT(*) FROM {TABLE}{where} GROUP BY 1, 2 ORDER BY 1, 2"
+    groups = {}
+    for key, cubeta, n in conn.execute(q, params):
+        buckets, counts = groups.setdefault(aggregates.label(key), ([], []))
+        buckets.append(cubeta)
+        counts.append(n)
+    return {
+        k: (aggregates.sketch_values(column, b), np.array(n, dtype=float))
+        for k, (b, n) in groups.items()
+    }
+
+def _rows_summary(conn, v, where, params):
+    """Conteo, sumas y extremos de una columna sobre la tabla base."""
+    q = f"""
+    SELECT COUNT(*) AS n, SUM({v}) AS suma, SUM({v} * {v}) AS suma_cuadrados,
+           MIN({v}) AS minimo, MAX({v}) AS maximo
+    FROM {TABLE}{where}
+    """
+    return _records(conn, q, params)[0]
+
+# Cada agregado se calcula en dos pasos: ``_X_parts(conn, ...)`` lee conteos,
+# sumas y sketches de una base y ``_X_result(parciales, ...)`` deriva la
+# respuesta. Con varias escuelas los parciales de cada base se combinan antes
+# del segundo paso (ver PARTIALS al final).
+def _kpis_parts(conn):
+    return _summary(conn, aggregates.TOTAL, aggregates.TOTAL, [aggregates.ROWS, "Asistencia_%", "Promedio_General"])
+
+def _kpis_result(s):
+    empty = {"n": 0, "suma": None}
+    asistencia = s.get("Asistencia_%", empty)
+    promedio = s.get("Promedio_General", empty)
+    return {
+        "total_estudiantes": s.get(aggregates.ROWS, empty)["n"],
+        "asistencia_promedio": aggregates.mean(asistencia["n"], asistencia["suma"]),
+        "promedio_general": aggregates.mean(promedio["n"], promedio["suma"]),
+    }
+
+def get_kpis(conn):
+    return _kpis_result(_kpis_parts(conn))
+
+def _distribution_parts(conn, column: str):
+    _check(column, DIMENSIONS)
+    q = f"SELECT valor, n FROM {aggregates.STATS_TABLE} WHERE dimension = ? AND columna = ?"
+    return dict(conn.execute(q, [column, aggregates.ROWS]).fetchall())
+
+def _distribution_result(counts, column: str):
+    total = sum(counts.values())
+    rows = [{"valor": k, "conteo": n, "porcentaje": 100.0 * n / total} for k, n in counts.items()]
+    return sorted(rows, key=lambda r: r["conteo"], reverse=True)
+
+def get_distribution(conn, column: str):
+    return _distribution_result(_distribution_parts(conn, column), column)
+
+def get_summary_by_gender(conn):
+    return get_distribution(conn, "Género")
+
+def _subjects_parts(conn):
+    return _summary(conn, aggregates.TOTAL, aggregates.TOTAL, GRADE_COLUMNS)
+
+def _subjects_result(s):
+    return [
+        {"materia": c, "promedio": aggregates.mean(s[c]["n"], s[c]["suma"]) if c in s else None}
+        for c in GRADE_COLUMNS
+    ]
+
+def get_subjects_averages(conn):
+    return _subjects_result(_subjects_parts(conn))
+
+def _breakdown_parts(conn, by: str, column: str, filters=None):
+    g = _check(by, DIMENSIONS)
+    v = _check(column, NUMERIC_COLUMNS)
+    snapshot = columnar.current(conn) if _active(filters) else None
+    if snapshot:
+        groups = snapshot.groups(by, column, _active(filters))
+        sketches = snapshot.sketch(by, column, _active(filters))
+    elif _active(filters):
+        where, params = _where(filters, f"{g} IS NOT NULL", f"{v} IS NOT NULL")
+        q = f"SELECT {g} AS segmento, COUNT(*) AS n, SUM({v}) AS suma FROM {TABLE}{where} GROUP BY {g}"
+        groups = {aggregates.label(r.pop("segmento")): r for r in _records(conn, q, params)}
+        sketches = _rows_sketch(conn, g, v, column, where, params)
+    else:
+        q = f"""
+        SELECT valor AS segmento, n, suma FROM {aggregates.STATS_TABLE}
+        WHERE dimension = ? AND columna = ? AND n > 0
+        """
+        groups = {r.pop("segmento"): r for r in _records(conn, q, [by, column])}
+        sketches = _sketch(conn, by, column)
+    return {"grupos": groups, "sketch": sketches}
+
+def _breakdown_result(parts, by: str, column: str, filters=None):
+    rows = []
+    for segmento, s in parts["grupos"].items():
+        sketch = parts["sketch"].get(segmento)
+        rows.append({
+            "segmento": segmento,
+            "conteo": s["n"],
+            "media": aggregates.mean(s["n"], s["suma"]),
+            "mediana": None if sketch is None else float(aggregates.quantiles(*sketch, [0.5])[0]),
+        })
+    return sorted(rows, key=lambda r: r["media"], reverse=True)
+
+def get_breakdown(conn, by: str, column: str, filters=None):
+    """Conteo, media y mediana de ``column`` por cada valor de ``by``."""
+    return _breakdown_result(_breakdown_parts(conn, by, column, filters), by, column, filters)
+
+def _column_parts(conn, column: str, filters=None):
+    """Resumen (conteo, sumas y extremos) y sketch de ``column`` con los filtros dados."""
+    v = _check(column, NUMERIC_COLUMNS)
+    segment = _segment(filters)
+    if segment:
+        return {
+            "resumen": _summary(conn, *segment, [column]).get(column),
+            "sketch": _sketch(conn, segment[0], column, segment[1]).get(segment[1]),
+        }
+    snapshot = columnar.current(conn)
+    if snapshot:
+        return {
+            "resumen": snapshot.summary(column, _active(filters)),
+            "sketch": snapshot.sketch(None, column, _active(filters)).get(aggregates.TOTAL),
+        }
+    where, params = _where(filters, f"{v} IS NOT NULL")
+    return {
+        "resumen": _rows_summary(conn, v, where, params),
+        "sketch": _rows_sketch(conn, f"'{aggregates.TOTAL}'", v, column, where, params).get(aggregates.TOTAL),
+    }
+
+def _histogram_parts(conn, column: str, bins: int = 20, filters=None):
+    return _column_parts(conn, column, filters)
+
+def _histogram_result(parts, column: str, bins: int = 20, filters=None):
+    s, sketch = parts["resumen"], parts["sketch"]
+    if not s or s["minimo"] is None or sketch is None:
+        return []
+    # Conteos desde el sketch: unos cientos de cubetas en lugar de las filas
+    lo, hi = s["minimo"], s["maximo"]
+    edges, hist = aggregates.histogram(*sketch, lo, hi, bins)
+    edges = edges.tolist()
+    return [
+        {"desde": edges[i], "hasta": edges[i + 1], "conteo": int(c)}
+        for i, c in enumerate(hist.tolist())
+    ]
+
+def get_histogram(conn, column: str, bins: int = 20, filters=None):
+    return _histogram_result(_histogram_parts(conn, column, bins, filters), column, bins, filters)
+
+def _describe_parts(conn, column: str, filters=None):
+    return _column_parts(conn, column, filters)
+
+def _describe_result(parts, column: str, filters=None):
+    s, sketch = parts["resumen"], parts["sketch"]
+    n = s["n"] if s else 0
+    return {
+        "n": n,
+        "media": aggregates.mean(n, s and s["suma"]),
+        "desviacion": aggregates.std(n, s and s["suma"], s and s["suma_cuadrados"]),
+        "minimo": s and s["minimo"],
+        "maximo": s and s["maximo"],
+        "mediana": float(aggregates.quantiles(*sketch, [0.5])[0]) if n and sketch is not None else None,
+    }
+
+def get_describe(conn, column: str, filters=None):
+    return _describe_result(_describe_parts(conn, column, filters), column, filters)
+
+QUANTILES = {"p10": 0.10, "q1": 0.25, "mediana": 0.50, "q3": 0.75, "p90": 0.90}
+
+def _box(values, counts):
+    """Cuantiles y bigotes de Tukey (1,5 × IQR) de un sketch."""
+    q = dict(zip(QUANTILES, aggregates.quantiles(values, counts, list(QUANTILES.values())).tolist()))
+    iqr = q["q3"] - q["q1"]
+    inside = values[(values >= q["q1"] - 1.5 * iqr) & (values <= q["q3"] + 1.5 * iqr)]
+    return {
+        "n": int(counts.sum()),
+        "minimo": float(values[0]),
+        **q,
+        "maximo": float(values[-1]),
+        "iqr": iqr,
+        "bigote_inferior": float(inside[0]),
+        "bigote_superior": float(inside[-1]),
+    }
+
+def _quantiles_parts(conn, column: str, by=None, filters=None, bins: int = 0):
+    v = _check(column, NUMERIC_COLUMNS)
+    g = _check(by, DIMENSIONS) if by else f"'{aggregates.TOTAL}'"
+    segment = _segment(filters)
+    if by and not _active(filters):
+        return _sketch(conn, by, column)
+    if not by and segment:
+        found = _sketch(conn, segment[0], column, segment[1]).get(segment[1])
+        return {aggregates.TOTAL: found} if found is not None else {}
+    snapshot = columnar.current(conn)
+    if snapshot:
+        return snapshot.sketch(by, column, _active(filters))
+    where, params = _where(filters, f"{g} IS NOT NULL", f"{v} IS NOT NULL")
+    return _rows_sketch(conn, g, v, column, where, params)
+
+def _quantiles_result(sketches, column: str, by=None, filters=None, bins: int = 0):
+    rows = [{"segmento": k, **_box(values, counts)} for k, (values, counts) in sorted(sketches.items())]
+    if bins and rows:
+        lo, hi = min(r["minimo"] for r in rows), max(r["maximo"] for r in rows)
+        for r in rows:
+            edges, hist = aggregates.histogram(*sketches[r["segmento"]], lo, hi, bins)
+            edges = edges.tolist()
+            r["histograma"] = [
+                {"desde": edges[i], "hasta": edges[i + 1], "conteo": int(c)}
+                for i, c in enumerate(hist.tolist())
+            ]
+    return rows
+
+def get_quantiles(conn, column: str, by=None, filters=None, bins: int = 0):
+    """Percentiles (p10, cuartiles, mediana, p90), IQR y bigotes por segmento.
+
+    Sale del sketch de agregados sin tocar la tabla de estudiantes, salvo con
+    filtros combinados (o ``by`` más filtros), que se resuelven sobre las filas
+    ya seleccionadas por índice. Con ``bins`` cada segmento incluye además un
+    histograma con intervalos comunes, para dibujar violines.
+    """
+    return _quantiles_result(_quantiles_parts(conn, column, by, filters, bins), column, by, filters, bins)
+
+# ----- DISPERSIÓN SUBMUESTREADA -----
+SCATTER_FIELDS = [KEY, "Nombre"]
+
+def _grid_expr(col, bins):
+    # Cociente redondeado antes de truncar, como los bordes de aggregates.histogram:
+    # un valor sobre el borde de una celda cae en la de arriba
+    return f'MIN(CAST(ROUND(("{col}" - ?) / ?, {aggregates.EDGE_DECIMALS}) AS INTEGER), {bins - 1})'
+
+def _scatter_fields(x, y, color):
+    _check(x, NUMERIC_COLUMNS)
+    _check(y, NUMERIC_COLUMNS)
+    if color:
+        _check(color, DIMENSIONS)
+    return list(dict.fromkeys(SCATTER_FIELDS + [x, y] + ([color] if color else [])))
+
+def _scatter_grid(bounds, bins):
+    """Origen y ancho de las celdas en cada eje."""
+    x, y = bounds["x"], bounds["y"]
+    wx = (x["maximo"] - x["minimo"]) / bins or 1.0
+    wy = (y["maximo"] - y["minimo"]) / bins or 1.0
+    return x["minimo"], wx, y["minimo"], wy
+
+def _scatter_bounds(conn, x: str = "Asistencia_%", y: str = "Promedio_General", filters=None,
+                    budget: int = 2000, bins: int = 40, color=None):
+    """Primera pasada: filas con ambos valores y extremos de cada eje."""
+    _scatter_fields(x, y, color)
+    snapshot = columnar.current(conn)
+    if snapshot:
+        n, axes = snapshot.bounds(x, y, _active(filters))
+        return {"n": n, "escuelas": 1, **axes}
+    where, params = _where(filters, f'"{x}" IS NOT NULL', f'"{y}" IS NOT NULL')
+    q = f'SELECT COUNT(*), MIN("{x}"), MAX("{x}"), MIN("{y}"), MAX("{y}") FROM {TABLE}{where}'
+    n, lo_x, hi_x, lo_y, hi_y = _scalar(conn, q, params)
+    return {"n": n, "escuelas": 1, "x": {"minimo": lo_x, "maximo": hi_x}, "y": {"minimo": lo_y, "maximo": hi_y}}
+
+def _scatter_parts(conn, x, y, filters, budget, bins, color, bounds):
+    """Celdas y puntos de una base con la rejilla común de ``bounds``.
+
+    Si no caben todas las filas, cada una de las ``bounds["escuelas"]`` bases
+    elige sus puntos con su parte del presupuesto.
+    """
+    fields = _scatter_fields(x, y, color)
+    where, params = _where(filters, f'"{x}" IS NOT NULL', f'"{y}" IS NOT NULL')
+    select = ", ".join(f'"{c}"' for c in fields)
+    if bounds["x"]["minimo"] is None or bounds["n"] <= budget:
+        return {"muestra": 0, "celdas": {}, "puntos": _records(conn, f"SELECT {select} FROM {TABLE}{where}", params)}
+
+    budget //= bounds["escuelas"]
+    grid_params = list(_scatter_grid(bounds, bins))
+    q = f"SELECT {_grid_expr(x, bins)} AS bx, {_grid_expr(y, bins)} AS by, COUNT(*) FROM {TABLE}{where} GROUP BY bx, by"
+    cells = conn.execute(q, grid_params + params).fetchall()
+
+    # Puntos en riesgo por el índice del puntaje
+    risk_where, risk_params = _where(filters, f'"{SCORE_COLUMN}" >= ?', f'"{x}" IS NOT NULL', f'"{y}" IS NOT NULL')
+    q = f'SELECT {select} FROM {TABLE}{risk_where} ORDER BY "{SCORE_COLUMN}" DESC LIMIT ?'
+    threshold = risk.load_config(conn)[1]
+    puntos = [{**r, "tipo": "riesgo"} for r in _records(conn, q, [threshold] + risk_params + [budget // 2])]
+
+    # Celdas menos pobladas completas mientras quepan en el presupuesto
+    sparse, room = [], budget - len(puntos)
+    for bx, by, count in sorted(cells, key=lambda c: c[2]):
+        if count > room:
+            break
+        sparse.append(bx * bins + by)
+        room -= count
+    if sparse:
+        seen = {p[KEY] for p in puntos}
+        cell = f"({_grid_expr(x, bins)} * {bins} + {_grid_expr(y, bins)})"
+        q = f"SELECT {select} FROM {TABLE}{where} AND {cell} IN (SELECT value FROM json_each(?))"
+        rows = _records(conn, q, params + grid_params + [json.dumps(sparse)])
+        puntos += [{**r, "tipo": "atipico"} for r in rows if r[KEY] not in seen]
+    return {"muestra": 1, "celdas": {(bx, by): count for bx, by, count in cells}, "puntos": puntos}
+
+def _scatter_result(parts, x, y, filters, budget, bins, color, bounds):
+    if not parts["muestra"]:
+        return {"n": bounds["n"], "celdas": [], "puntos": parts["puntos"]}
+    lo_x, wx, lo_y, wy = _scatter_grid(bounds, bins)
+    return {
+        "n": bounds["n"],
+        "ancho_x": wx,
+        "ancho_y": wy,
+        "celdas": [
+            {"x": lo_x + (bx + 0.5) * wx, "y": lo_y + (by + 0.5) * wy, "conteo": count}
+            for (bx, by), count in sorted(parts["celdas"].items())
+        ],
+        "puntos": parts["puntos"],
+    }
+
+def get_scatter(conn, x: str = "Asistencia_%", y: str = "Promedio_General", filters=None,
+                budget: int = 2000, bins: int = 40, color=None):
+    """Dispersión de ``y`` frente a ``x`` con coste acotado por ``budget`` puntos.
+
+    Si las filas caben en el presupuesto se devuelven todas. Si no, se devuelve
+    una rejilla ``bins``×``bins`` con el conteo de cada celda (conserva la
+    densidad) y, como puntos individuales, los estudiantes con mayor puntaje de
+    riesgo (hasta la mitad del presupuesto) y todos los de las celdas menos
+    pobladas (los atípicos), empezando por las más vacías hasta agotarlo.
+    """
+    args = (x, y, filters, budget, bins, color)
+    bounds = _scatter_bounds(conn, *args)
+    return _scatter_result(_scatter_parts(conn, *args, bounds), *args, bounds)
+
+CROSS_FIELDS = ["n", "suma_x", "suma_y", "suma_xx", "suma_yy", "suma_xy"]
+
+def _cross(conn, pairs, dimension, value=None):
+    """Sumas cruzadas guardadas de cada par, por valor de la dimensión y orientadas como se piden."""
+    q = f"SELECT valor, col_x, col_y, {', '.join(CROSS_FIELDS)} FROM {aggregates.CROSS_TABLE} WHERE dimension = ?"
+    params = [dimension]
+    if value is not None:
+        q += " AND valor = ?"
+        params.append(value)
+    wanted = set(pairs)
+    result = {}
+    for r in _records(conn, q, params):
+        valor = r.pop("valor")
+        pair = (r.pop("col_x"), r.pop("col_y"))
+        if pair not in wanted:
+            pair = pair[::-1]
+            if pair not in wanted:
+                continue
+            r["suma_x"], r["suma_y"] = r["suma_y"], r["suma_x"]
+            r["suma_xx"], r["suma_yy"] = r["suma_yy"], r["suma_xx"]
+        result.setdefault(valor, {})[pair] = r
+    return result
+
+def _pair_sums(conn, pairs, g, where, params):
+    """Las mismas sumas calculadas sobre la tabla base en una sola pasada.
+
+    ``x + 0 * y`` es NULL si falta cualquiera de los dos, así que cada suma
+    cuenta solo las filas con ambos valores (como en stats_cross).
+    """
+    exprs = []
+    for x, y in pairs:
+        qx, qy = f'"{x}"', f'"{y}"'
+        exprs += [
+            f"COUNT({qx} + {qy})", f"SUM({qx} + 0 * {qy})", f"SUM({qy} + 0 * {qx})",
+            f"SUM({qx} * {qx} + 0 * {qy})", f"SUM({qy} * {qy} + 0 * {qx})", f"SUM({qx} * {qy})",
+        ]
+    q = f"SELECT {g}, {', '.join(exprs)} FROM {TABLE}{where} GROUP BY 1"
+    result = {}
+    for row in conn.execute(q, params):
+        sums = row[1:]
+        result[aggregates.label(row[0])] = {
+            pair: dict(zip(CROSS_FIELDS, sums[6 * i:6 * i + 6])) for i, pair in enumerate(pairs)
+        }
+    return result
+
+def _pairs_by_segment(conn, pairs, by=None, filters=None):
+    """{segmento: {(x, y): sumas}} desde stats_cross o, con filtros combinados, desde la tabla."""
+    segment = _segment(filters)
+    if by and not _active(filters):
+        return _cross(conn, pairs, by)
+    if not by and segment:
+        found = _cross(conn, pairs, *segment).get(segment[1])
+        return {aggregates.TOTAL: found} if found else {}
+    snapshot = columnar.current(conn)
+    if snapshot:
+        return snapshot.pair_sums(pairs, by, _active(filters))
+    g = _check(by, DIMENSIONS) if by else f"'{aggregates.TOTAL}'"
+    where, params = _where(filters, *([f"{g} IS NOT NULL"] if by else []))
+    return _pair_sums(conn, pairs, g, where, params)
+
+def _correlation_pairs(columns=None):
+    cols = columns or GRADE_COLUMNS
+    for c in cols:
+        _check(c, NUMERIC_COLUMNS)
+    return cols, [(x, y) for i, x in enumerate(cols) for y in cols[i + 1:] if x != y]
+
+def _correlation_parts(conn, columns=None, filters=None):
+    _, pairs = _correlation_pairs(columns)
+    return _pairs_by_segment(conn, pairs, None, filters).get(aggregates.TOTAL, {})
+
+def _correlation_result(cross, columns=None, filters=None):
+    cols, _ = _correlation_pairs(columns)
+    matrix = [[None] * len(cols) for _ in cols]
+    for i, x in enumerate(cols):
+        for j, y in enumerate(cols):
+            if x == y:
+                matrix[i][j] = 1.0
+                continue
+            # Pearson es simétrico: vale el par en cualquier orden
+            r = cross.get((x, y)) or cross.get((y, x))
+            if r is None:
+                continue
+            matrix[i][j] = aggregates.pearson(*(r[f] for f in CROSS_FIELDS))
+    return {"columnas": cols, "matriz": matrix}
+
+def get_correlation(conn, columns=None, filters=None):
+    """Matriz de Pearson a partir de las sumas de productos cruzados precalculadas."""
+    return _correlation_result(_correlation_parts(conn, columns, filters), columns, filters)
+
+def _regression_parts(conn, y: str, x: str = "Asistencia_%", by=None, filters=None):
+    _check(x, NUMERIC_COLUMNS)
+    _check(y, NUMERIC_COLUMNS)
+    if x == y:
+        raise KeyError(y)
+    return _pairs_by_segment(conn, [(x, y)], by, filters)
+
+def _regression_result(segments, y: str, x: str = "Asistencia_%", by=None, filters=None):
+    rows = []
+    for segmento, sums in sorted(segments.items()):
+        r = sums[(x, y)]
+        fit = aggregates.regression(r["n"], r["suma_x"], r["suma_y"], r["suma_xx"], r["suma_yy"], r["suma_xy"])
+        pendiente, intercepto, r2 = fit or (None, None, None)
+        rows.append({"segmento": segmento, "n": r["n"], "pendiente": pendiente, "intercepto": intercepto, "r2": r2})
+    return rows
+
+def get_regression(conn, y: str, x: str = "Asistencia_%", by=None, filters=None):
+    """Pendiente, intercepto y R² de ``y`` frente a ``x`` (por segmento si se indica ``by``)."""
+    return _regression_result(_regression_parts(conn, y, x, by, filters), y, x, by, filters)
+
+# ----- TENDENCIAS (historial por periodo) -----
+def _trends_parts(conn, column: str = "Asistencia_%", scale: str = "mensual", desde=None, hasta=None,
+                  by=None, filters=None):
+    _check(column, history.COLUMNS)
+    expr = history.SCALES[scale]
+    if by:
+        _check(by, history.DIMENSIONS)
+    # Sin historial cargado (init_db.py --historial) no hay serie
+    if not history.exists(conn):
+        return {}
+    # (condición, mes) de cada extremo del rango dado
+    bounds = [(op, m) for op, m in zip((">=", "<="), history.expand(desde, hasta, scale)) if m]
+    segment = _segment(filters)
+    if segment and not (by and _active(filters)):
+        dimension, value = (by, None) if by else segment
+        q = f"""
+        SELECT valor AS segmento, periodo, n, suma, suma_cuadrados, minimo, maximo FROM {history.ROLLUP_TABLE}
+        WHERE escala = ? AND dimension = ? AND columna = ?{" AND valor = ?" if value is not None else ""}
+        """
+        params = [scale, dimension, column] + ([value] if value is not None else [])
+        q += "".join(f" AND periodo {op} ?" for op, _ in bounds)
+        rows = _records(conn, q, params + [history.bucket(m, scale) for _, m in bounds])
+    else:
+        v = f'"{column}"'
+        g = f'"{by}"' if by else f"'{aggregates.TOTAL}'"
+        # Rango sobre el mes (prefijo de la clave primaria)
+        months = [f'"{history.PERIOD}" {op} ?' for op, _ in bounds]
+        where, params = _where(filters, *months, f"{v} IS NOT NULL", *([f"{g} IS NOT NULL"] if by else []))
+        params = [m for _, m in bounds] + params
+        # GROUP BY por posición: "periodo" como nombre se resolvería a la columna "Periodo"
+        q = f"""
+        SELECT {g} AS segmento, {expr.format(p=f'"{history.PERIOD}"')} AS periodo, COUNT(*) AS n,
+               SUM({v}) AS suma, SUM({v} * {v}) AS suma_cuadrados, MIN({v}) AS minimo, MAX({v}) AS maximo
+        FROM {history.HISTORY_TABLE}{where}
+        GROUP BY 1, 2
+        """
+        rows = _records(conn, q, params)
+    return {(aggregates.label(r.pop("segmento")), r.pop("periodo")): r for r in rows}
+
+def _trends_result(periods, column: str = "Asistencia_%", scale: str = "mensual", desde=None, hasta=None,
+                   by=None, filters=None):
+    return [
+        {
+            "segmento": segmento,
+            "periodo": periodo,
+            "n": r["n"],
+            "media": aggregates.mean(r["n"], r["suma"]),
+            "desviacion": aggregates.std(r["n"], r["suma"], r["suma_cuadrados"]),
+            "minimo": r["minimo"],
+            "maximo": r["maximo"],
+        }
+        for (segmento, periodo), r in sorted(periods.items())
+    ]
+
+def get_trends(conn, column: str = "Asistencia_%", scale: str = "mensual", desde=None, hasta=None,
+               by=None, filters=None):
+    """Serie por periodo (mes, trimestre o año) de ``column``, por segmento si se indica ``by``.
+
+    Sale de history_rollup; con filtros combinados, o desglosando por una
+    dimensión y filtrando por otra, se agrega el historial de los meses del rango.
+    El rango se amplía a periodos completos de la escala.
+    """
+    args = (column, scale, desde, hasta, by, filters)
+    return _trends_result(_trends_parts(conn, *args), *args)
+
+# ----- AGREGADOS PARCIALES (varias escuelas) -----
+def _as_is(parts, *args):
+    return parts
+
+# Funciones que la API puede repartir entre las bases de las escuelas
+# (shards.py): (previo, parcial, resultado). ``parcial(conn, *args)`` devuelve
+# conteos, sumas y sketches de una base, aggregates.merge los combina y
+# ``resultado(combinado, *args)`` da la misma respuesta que la función sobre
+# una sola base. ``previo``, si lo hay, es una primera pasada cuyo resultado
+# combinado se añade como último argumento de las otras dos (los extremos
+# comunes de la rejilla de dispersión).
+PARTIALS = {
+    get_kpis: (None, _kpis_parts, _kpis_result),
+    get_distribution: (None, _distribution_parts, _distribution_result),
+    get_subjects_averages: (None, _subjects_parts, _subjects_result),
+    get_breakdown: (None, _breakdown_parts, _breakdown_result),
+    get_histogram: (None, _histogram_parts, _histogram_result),
+    get_describe: (None, _describe_parts, _describe_result),
+    get_quantiles: (None, _quantiles_parts, _quantiles_result),
+    get_scatter: (_scatter_bounds, _scatter_parts, _scatter_result),
+    get_correlation: (None, _correlation_parts, _correlation_result),
+    get_regression: (None, _regression_parts, _regression_result),
+    get_trends: (None, _trends_parts, _trends_result),
+    count_at_risk: (None, count_at_risk, _as_is),
+    count_students: (None, count_students, _as_is),
+}
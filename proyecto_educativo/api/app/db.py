@@ -1,7 +1,114 @@
-from sqlalchemy import create_engine
+import asyncio
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import time
+from contextlib import contextmanager
+from functools import cache
 from pathlib import Path
 
-DB_FILE = Path(__file__).resolve().parents[2] / "data" / "students.db"
+from . import metrics
+
+# STUDENTS_DB permite apuntar la API y los scripts a otra base (p. ej. en benchmark.py)
+DB_FILE = Path(os.environ.get("STUDENTS_DB") or Path(__file__).resolve().parents[2] / "data" / "students.db")
 DATABASE_URL = f"sqlite:///{DB_FILE}"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+@cache
+def get_engine():
+    """Engine de SQLAlchemy para scripts (check_db.py); la API usa el pool de lectura.
+
+    Se crea al pedirlo: importar SQLAlchemy retrasa el arranque de cada worker.
+    Sus conexiones, como las del pool, miden sus consultas (ver metrics.py).
+    """
+    from sqlalchemy import create_engine
+    return create_engine(DATABASE_URL, connect_args={"check_same_thread": False, "factory": metrics.TimedConnection})
+
+# ----- POOL DE LECTURA -----
+# Cada worker de uvicorn (proceso) abre su propio pool de conexiones de solo
+# lectura. Con DB_IMMUTABLE=1 SQLite omite bloqueos y comprobaciones de cambios:
+# usarlo solo si la base no se modifica mientras la API está en marcha (p. ej.
+# cuando viene dentro de la imagen y se recarga con un nuevo despliegue).
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "4"))
+MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+IMMUTABLE = os.environ.get("DB_IMMUTABLE", "0") == "1"
+
+
+def read_connection(path=DB_FILE):
+    """Conexión SQLite de solo lectura ajustada para consultas analíticas."""
+    uri = f"file:{path}?mode=ro" + ("&immutable=1" if IMMUTABLE else "")
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=metrics.TimedConnection)
+    # Base de la conexión, para encontrar su instantánea columnar (columnar.current)
+    conn.path = path
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute("PRAGMA query_only = ON")
+    conn.execute("PRAGMA cache_size = -16384")
+    return conn
+
+
+def data_version(conn):
+    """Versión de los datos; init_db.py la incrementa en cada carga."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def bump_data_version(conn):
+    conn.execute(f"PRAGMA user_version = {data_version(conn) + 1}")
+
+
+class ReadPool:
+    """Pool asíncrono de conexiones de solo lectura (al estilo de aiosqlite).
+
+    Las consultas se ejecutan en hilos propios del pool, uno por conexión, sin
+    pasar por el threadpool de FastAPI; el bucle de eventos solo espera el
+    resultado.
+    """
+
+    def __init__(self, size=POOL_SIZE, path=DB_FILE):
+        self.size, self.path = size, path
+        self._idle = None
+        self._executor = None
+
+    async def open(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="sqlite-ro")
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            self._idle.put_nowait(read_connection(self.path))
+
+    async def close(self):
+        while self._idle is not None and not self._idle.empty():
+            self._idle.get_nowait().close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    async def run(self, fn, *args):
+        """Ejecuta ``fn(conn, *args)`` con una conexión libre del pool."""
+        if self._idle is None:
+            await self.open()
+        start = time.perf_counter()
+        conn = await self._idle.get()
+        metrics.POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+        try:
+            call = metrics.profiled(fn)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, _timed, call, conn, *args)
+        finally:
+            self._idle.put_nowait(conn)
+
+
+def _timed(fn, conn, *args):
+    """Ejecuta ``fn`` en el hilo del pool; sus consultas quedan etiquetadas con su nombre."""
+    conn.label = fn.__name__
+    start = time.perf_counter()
+    try:
+        return fn(conn, *args)
+    finally:
+        metrics.CALL_SECONDS.observe(time.perf_counter() - start, function=fn.__name__)
+
+
+@contextmanager
+def connection():
+    """Conexión de lectura para uso síncrono (scripts, comprobaciones)."""
+    conn = read_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
@@ -0,0 +1,218 @@
+"""Codificación de respuestas de datos según la cabecera ``Accept``.
+
+Además de JSON/NDJSON, los endpoints de datos pueden responder en Arrow IPC
+(stream) o Parquet: las columnas viajan tipadas y el cliente las carga en
+pandas sin volver a interpretar texto. pyarrow se importa solo cuando se pide
+uno de estos formatos; si no está instalado se responde en el formato por defecto.
+
+Las descargas de /export se generan también por lotes: CSV en gzip, Parquet o
+un XLSX escrito a mano (una hoja con celdas en línea, sin dependencias).
+"""
+import csv
+import io
+import json
+import math
+import zipfile
+import zlib
+from importlib.util import find_spec
+from xml.sax.saxutils import escape
+
+from .schema import ALL_TYPES
+
+NDJSON = "application/x-ndjson"
+JSON = "application/json"
+ARROW = "application/vnd.apache.arrow.stream"
+PARQUET = "application/vnd.apache.parquet"
+CSV_GZIP = "application/gzip"
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_ALIASES = {
+    ARROW: ARROW,
+    "application/vnd.apache.arrow.file": ARROW,
+    PARQUET: PARQUET,
+    "application/x-parquet": PARQUET,
+}
+_HAS_ARROW = find_spec("pyarrow") is not None
+
+
+def negotiate(accept, default):
+    """Primer formato columnar aceptado por el cliente, o ``default``."""
+    if accept and _HAS_ARROW:
+        for part in accept.split(","):
+            media = _ALIASES.get(part.split(";")[0].strip().lower())
+            if media:
+                return media
+    return default
+
+
+def arrow_schema(columns):
+    import pyarrow as pa
+
+    types = {"INTEGER": pa.int64(), "REAL": pa.float64(), "TEXT": pa.string(), "BOOLEAN": pa.bool_()}
+    return pa.schema([(c, types.get(ALL_TYPES.get(c, "TEXT").split()[0], pa.string())) for c in columns])
+
+
+def _record_batch(schema, rows):
+    """Lote Arrow a partir de tuplas de SQLite (columna a columna, sin pandas)."""
+    import pyarrow as pa
+
+    arrays = []
+    for field, values in zip(schema, zip(*rows)):
+        if pa.types.is_boolean(field.type):
+            values = [None if v is None else bool(v) for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _Sink(io.RawIOBase):
+    """Destino de escritura que acumula bytes para entregarlos por tramos."""
+
+    def __init__(self):
+        self.chunks, self.position = [], 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def ndjson(columns, batches):
+    dumps = json.JSONEncoder(ensure_ascii=False).encode
+    for rows in batches:
+        yield "".join(dumps(dict(zip(columns, r))) + "\n" for r in rows).encode()
+
+
+def arrow_stream(columns, batches):
+    import pyarrow as pa
+
+    schema = arrow_schema(columns)
+    sink = _Sink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for rows in batches:
+            writer.write_batch(_record_batch(schema, rows))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def parquet_stream(columns, batches):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(columns)
+    sink = _Sink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for rows in batches:
+            # Un row group por lote: el cliente recibe datos mientras se generan
+            writer.write_table(pa.Table.from_batches([_record_batch(schema, rows)]))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def csv_gzip(columns, batches):
+    """CSV comprimido tramo a tramo: cada lote sale en cuanto lo entrega el compresor."""
+    gz = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)  # cabecera y cola gzip
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        data = gz.compress(buf.getvalue().encode())
+        buf.seek(0)
+        buf.truncate()
+        if data:
+            yield data
+    yield gz.compress(buf.getvalue().encode()) + gz.flush()
+
+
+_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+_RELS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_DOC_RELS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_SHEET_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_OOXML = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+# Partes fijas de un libro con una sola hoja
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        f'{_XML}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        f'<Override PartName="/xl/workbook.xml" ContentType="{_OOXML}.sheet.main+xml"/>'
+        f'<Override PartName="/xl/worksheets/sheet1.xml" ContentType="{_OOXML}.worksheet+xml"/></Types>'
+    ),
+    "_rels/.rels": (
+        f'{_XML}<Relationships xmlns="{_RELS}">'
+        f'<Relationship Id="rId1" Type="{_DOC_RELS}/officeDocument" Target="xl/workbook.xml"/></Relationships>'
+    ),
+    "xl/workbook.xml": (
+        f'{_XML}<workbook xmlns="{_SHEET_NS}" xmlns:r="{_DOC_RELS}">'
+        '<sheets><sheet name="Estudiantes" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        f'{_XML}<Relationships xmlns="{_RELS}">'
+        f'<Relationship Id="rId1" Type="{_DOC_RELS}/worksheet" Target="worksheets/sheet1.xml"/></Relationships>'
+    ),
+}
+
+
+def _xlsx_cell(value):
+    if value is None or (isinstance(value, float) and not math.isfinite(value)):
+        # Excel no tiene NaN ni infinitos: celda vacía, como un nulo
+        return "<c/>"
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f"<c><v>{value!r}</v></c>"
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>'
+
+
+def _xlsx_rows(rows, flags=()):
+    """Filas de la hoja; las columnas marcadas en ``flags`` (BOOLEAN, 0/1 en SQLite) salen como VERDADERO/FALSO."""
+    if any(flags):
+        rows = (tuple(bool(v) if f and v is not None else v for v, f in zip(r, flags)) for r in rows)
+    return "".join(f"<row>{''.join(_xlsx_cell(v) for v in r)}</row>" for r in rows).encode()
+
+
+def xlsx_stream(columns, batches):
+    """Hoja de cálculo escrita lote a lote; el zip va sin posicionamiento (descriptores de datos)."""
+    flags = [ALL_TYPES.get(c, "") == "BOOLEAN" for c in columns]
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as book:
+        for name, xml in _XLSX_PARTS.items():
+            book.writestr(name, xml)
+        # Tamaño desconocido de antemano: ZIP64 para que la hoja pueda pasar de 2 GiB
+        with book.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(f'{_XML}<worksheet xmlns="{_SHEET_NS}"><sheetData>'.encode() + _xlsx_rows([columns]))
+            for rows in batches:
+                sheet.write(_xlsx_rows(rows, flags))
+                yield sink.drain()
+            sheet.write(b"</sheetData></worksheet>")
+    yield sink.drain()
+
+
+ENCODERS = {NDJSON: ndjson, ARROW: arrow_stream, PARQUET: parquet_stream, CSV_GZIP: csv_gzip, XLSX: xlsx_stream}
+# Formatos de /export: tipo MIME y extensión del archivo
+EXPORTS = {"csv": (CSV_GZIP, "csv.gz"), "parquet": (PARQUET, "parquet"), "xlsx": (XLSX, "xlsx")}
+
+
+def available(media):
+    """Si el formato puede generarse (los columnares necesitan pyarrow)."""
+    return media not in (ARROW, PARQUET) or _HAS_ARROW
+
+
+def encode(media, columns, batches):
+    return ENCODERS[media](columns, batches)
+
+
+def encode_records(media, columns, records):
+    """Codifica una lista de diccionarios (respuestas paginadas ya materializadas)."""
+    rows = [tuple(r[c] for c in columns) for r in records]
+    return b"".join(encode(media, columns, [rows] if rows else []))
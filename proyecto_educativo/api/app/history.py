@@ -0,0 +1,171 @@
+"""Historial por periodo de asistencia y calificaciones.
+
+``student_history`` guarda una fila por mes y estudiante (clave primaria
+``(Periodo, ID_Estudiante)``) con la asistencia y cada ``Calificación_*`` de ese
+mes, además del grupo y profesor que tenía entonces. Solo crece: init_db.py
+anexa meses nuevos y las filas de un (periodo, estudiante) ya cargado se
+ignoran.
+
+``history_rollup`` guarda, por escala (mensual, trimestral, anual), periodo,
+columna y grupo (total, ``Grupo`` o ``Profesor``), los mismos estadísticos
+sumables que stats_summary: conteo, suma, suma de cuadrados, mínimo y máximo.
+Al cargar se recalculan solo los meses afectados y los trimestres y años que
+los contienen, y /trends responde una serie de varios años en O(periodos).
+Los trimestres y años promedian todos los registros mensuales que incluyen.
+"""
+import json
+import re
+
+from .aggregates import TOTAL, label
+from .schema import GRADE_COLUMNS, KEY
+
+HISTORY_TABLE = "student_history"
+ROLLUP_TABLE = "history_rollup"
+PERIOD = "Periodo"
+COLUMNS = ["Asistencia_%"] + GRADE_COLUMNS
+DIMENSIONS = ["Grupo", "Profesor"]
+
+MONTH = re.compile(r"\d{4}-(0[1-9]|1[0-2])")
+# Expresión SQL del periodo de cada escala a partir de un mes 'AAAA-MM'
+SCALES = {
+    "mensual": "{p}",
+    "trimestral": "substr({p}, 1, 4) || '-T' || ((CAST(substr({p}, 6, 2) AS INTEGER) + 2) / 3)",
+    "anual": "substr({p}, 1, 4)",
+}
+
+DDL = [
+    f"""CREATE TABLE IF NOT EXISTS {HISTORY_TABLE} (
+      "{PERIOD}" TEXT NOT NULL, "{KEY}" INTEGER NOT NULL, "Grupo" TEXT, "Profesor" TEXT,
+      {", ".join(f'"{c}" REAL' for c in COLUMNS)},
+      PRIMARY KEY ("{PERIOD}", "{KEY}")
+    ) WITHOUT ROWID""",
+    f"""CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+      escala TEXT NOT NULL, dimension TEXT NOT NULL, columna TEXT NOT NULL, valor TEXT NOT NULL,
+      periodo TEXT NOT NULL,
+      n INTEGER NOT NULL, suma REAL, suma_cuadrados REAL, minimo REAL, maximo REAL,
+      PRIMARY KEY (escala, dimension, columna, valor, periodo)
+    ) WITHOUT ROWID""",
+]
+
+FIELDS = [PERIOD, KEY] + DIMENSIONS + COLUMNS
+_QUOTED = ", ".join(f'"{c}"' for c in FIELDS)
+INSERT = f'INSERT INTO {HISTORY_TABLE} ({_QUOTED}) VALUES ({", ".join("?" * len(FIELDS))}) ON CONFLICT DO NOTHING'
+
+
+def create_tables(conn):
+    for ddl in DDL:
+        conn.execute(ddl)
+
+
+def exists(conn):
+    q = "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN (?, ?)"
+    return conn.execute(q, (HISTORY_TABLE, ROLLUP_TABLE)).fetchone()[0] == 2
+
+
+def month(value):
+    """Mes 'AAAA-MM' de un periodo o una fecha ('2024-03', '2024-03-15'); ValueError si no lo es."""
+    value = str(value).strip()[:7]
+    if not MONTH.fullmatch(value):
+        raise ValueError(f"Periodo inválido: {value!r} (se espera AAAA-MM)")
+    return value
+
+
+def months(values):
+    """Versión vectorizada de ``month`` para una columna de periodos."""
+    values = values.astype(str).str.strip().str[:7]
+    invalid = ~values.str.fullmatch(MONTH.pattern)
+    if invalid.any():
+        raise ValueError(f"Periodo inválido: {values[invalid].iloc[0]!r} (se espera AAAA-MM)")
+    return values
+
+
+def bucket(value, scale):
+    """Periodo de ``scale`` que contiene el mes ``value`` (mismo resultado que ``SCALES``)."""
+    if scale == "trimestral":
+        return f"{value[:4]}-T{(int(value[5:7]) + 2) // 3}"
+    return value[:4] if scale == "anual" else value
+
+
+def expand(desde, hasta, scale):
+    """Primer y último mes de los periodos de ``scale`` que contienen ``desde`` y ``hasta``."""
+    if desde is not None:
+        desde = month(desde)
+        if scale != "mensual":
+            first = 1 if scale == "anual" else (int(desde[5:7]) - 1) // 3 * 3 + 1
+            desde = f"{desde[:4]}-{first:02d}"
+    if hasta is not None:
+        hasta = month(hasta)
+        if scale != "mensual":
+            last = 12 if scale == "anual" else (int(hasta[5:7]) + 2) // 3 * 3
+            hasta = f"{hasta[:4]}-{last:02d}"
+    return desde, hasta
+
+
+# ----- Carga -----
+def _with_groups(conn, chunk):
+    """Completa Grupo y Profesor con los actuales de ``students`` si el CSV no los trae."""
+    missing = [d for d in DIMENSIONS if d not in chunk.columns]
+    if not missing:
+        return chunk
+    import pandas as pd
+    q = f'SELECT s."{KEY}", s."Grupo", s."Profesor" FROM json_each(?) j JOIN students s ON s."{KEY}" = j.value'
+    ids = chunk[KEY].unique().tolist()
+    current = pd.DataFrame(conn.execute(q, (json.dumps(ids),)).fetchall(), columns=[KEY] + DIMENSIONS)
+    return chunk.merge(current[[KEY] + missing], on=KEY, how="left")
+
+
+def append(conn, chunk):
+    """Anexa un lote; devuelve (filas insertadas, meses del lote)."""
+    periods = months(chunk[PERIOD])
+    # Los NaN (notas o grupo sin valor) se guardan como NULL
+    chunk = _with_groups(conn, chunk.assign(**{PERIOD: periods})).reindex(columns=FIELDS)
+    # En el orden de la clave primaria las inserciones recorren el árbol de la tabla en secuencia
+    chunk = chunk.sort_values([PERIOD, KEY], kind="stable")
+    before = conn.total_changes
+    conn.executemany(INSERT, zip(*(chunk[c].to_numpy().tolist() for c in FIELDS)))
+    return conn.total_changes - before, set(periods.unique().tolist())
+
+
+def _month_rows(conn, period):
+    """Filas mensuales de history_rollup para un mes, con una sola lectura de sus filas."""
+    stats = ", ".join(f'COUNT("{c}"), SUM("{c}"), SUM("{c}" * "{c}"), MIN("{c}"), MAX("{c}")' for c in COLUMNS)
+    q = f'SELECT "Grupo", "Profesor", {stats} FROM {HISTORY_TABLE} WHERE "{PERIOD}" = ? GROUP BY "Grupo", "Profesor"'
+    acc = {}
+    for grupo, profesor, *values in conn.execute(q, (period,)).fetchall():
+        for dimension, valor in ((TOTAL, TOTAL), ("Grupo", grupo), ("Profesor", profesor)):
+            if valor is None:
+                continue
+            for i, column in enumerate(COLUMNS):
+                part = values[5 * i:5 * i + 5]
+                key = (dimension, column, label(valor))
+                acc[key] = _merge(acc[key], part) if key in acc else part
+    return [("mensual", d, c, v, period, *s) for (d, c, v), s in acc.items() if s[0]]
+
+
+def _merge(a, b):
+    """Suma dos parciales (n, suma, suma_cuadrados, mínimo, máximo); las sumas vacías son None."""
+    add = lambda x, y: y if x is None else x if y is None else x + y
+    pick = lambda f, x, y: y if x is None else x if y is None else f(x, y)
+    return a[0] + b[0], add(a[1], b[1]), add(a[2], b[2]), pick(min, a[3], b[3]), pick(max, a[4], b[4])
+
+
+def refresh_rollups(conn, months):
+    """Recalcula los agregados de ``months`` y de los trimestres y años que los contienen."""
+    months = sorted(months)
+    conn.executemany(f"DELETE FROM {ROLLUP_TABLE} WHERE escala = 'mensual' AND periodo = ?", [(m,) for m in months])
+    for period in months:
+        conn.executemany(f"INSERT INTO {ROLLUP_TABLE} VALUES ({', '.join('?' * 10)})", _month_rows(conn, period))
+    for scale, expr in SCALES.items():
+        if scale == "mensual":
+            continue
+        expr = expr.format(p="periodo")
+        periods = json.dumps(sorted({bucket(m, scale) for m in months}))
+        conn.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE escala = ? AND periodo IN (SELECT value FROM json_each(?))",
+                     (scale, periods))
+        conn.execute(f"""
+        INSERT INTO {ROLLUP_TABLE}
+        SELECT ?, dimension, columna, valor, {expr}, SUM(n), SUM(suma), SUM(suma_cuadrados), MIN(minimo), MAX(maximo)
+        FROM {ROLLUP_TABLE}
+        WHERE escala = 'mensual' AND {expr} IN (SELECT value FROM json_each(?))
+        GROUP BY dimension, columna, valor, {expr}
+        """, (scale, periods))
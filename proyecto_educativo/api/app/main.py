@@ -1,8 +1,63 @@
-from fastapi import FastAPI, Query
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Literal, Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from . import crud
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+from starlette.datastructures import Headers
+from . import aggregates, cache, columnar, crud, formats, metrics
+from .cache import results
+from .shards import shards
+
+log = logging.getLogger(__name__)
+
+# API_WARMUP=0 desactiva el precalentamiento al arrancar cada worker
+WARMUP = os.environ.get("API_WARMUP", "1") != "0"
+
+@asynccontextmanager
+async def lifespan(app):
+    # Un pool de conexiones de solo lectura por escuela y proceso worker
+    await shards.open()
+    task = asyncio.create_task(warm_up()) if WARMUP else None
+    yield
+    if task:
+        task.cancel()
+    await shards.close()
+
+async def warm_up():
+    """Deja listas en la caché las respuestas de la vista inicial del dashboard.
 
-app = FastAPI(title="Students Analytics API")
+    Corre en segundo plano: el worker ya atiende peticiones mientras tanto. Las
+    consultas también traen a memoria las páginas de SQLite de los agregados,
+    y cada base abre su instantánea columnar (ver ``columnar``).
+    """
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(pool.run(columnar.current) for pool in shards.pools.values()))
+        filters = {"profesor": None, "grupo": None}
+        # Mismos argumentos que los endpoints sin parámetros, para que coincida la clave de la caché
+        for fn, *args in [
+            (crud.get_kpis,),
+            (crud.get_distribution, "Nivel_Socioeconómico"),
+            (crud.get_histogram, "Promedio_General", 20, filters),
+            (crud.get_subjects_averages,),
+            (crud.get_correlation, None, filters),
+        ]:
+            await cached(None, fn, *args)
+    except Exception:
+        # Sin precalentar, la primera petición de cada vista calcula su respuesta como siempre
+        log.exception("No se pudo precalentar la caché")
+        return
+    log.info("Caché precalentada en %.2f s", time.perf_counter() - start)
+
+app = FastAPI(title="Students Analytics API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -10,19 +65,356 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+class TextGZipMiddleware(GZipMiddleware):
+    """GZip salvo en /export (csv.gz, parquet y xlsx ya van comprimidos) y en respuestas Arrow/Parquet."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and (
+            scope["path"] == "/export" or formats.negotiate(Headers(scope=scope).get("accept"), None)
+        ):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+# Respuestas comprimidas para los clientes que envían Accept-Encoding: gzip (JSON de agregados,
+# páginas NDJSON); nivel moderado para no cargar la CPU en las respuestas grandes
+app.add_middleware(TextGZipMiddleware, minimum_size=1024, compresslevel=5)
+# El último middleware añadido es el más externo: mide la petición completa y los bytes ya comprimidos
+app.add_middleware(metrics.MetricsMiddleware)
+
+def parse_fields(fields: Optional[str]):
+    return [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+ESCUELA = Query(None, description="Escuela del catálogo (/schools); sin ella, todas")
+
+def school_pool(escuela: Optional[str]):
+    """Pool de la escuela pedida; sin escuela solo vale si el catálogo tiene una."""
+    if escuela is None and not shards.single:
+        raise HTTPException(status_code=400, detail="Indica la escuela: el catálogo tiene varias (/schools)")
+    try:
+        return shards.pool(escuela)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Escuela desconocida: {escuela}")
+
+async def run(escuela: Optional[str], fn, *args):
+    """``fn(conn, *args)`` en la base de la escuela o, sin escuela, combinado de todas."""
+    if escuela is not None or shards.single or fn not in crud.PARTIALS:
+        return await school_pool(escuela).run(fn, *args)
+    prepare, parts, result = crud.PARTIALS[fn]
+    if prepare:
+        args += (aggregates.merge(await shards.fan_out(prepare, *args)),)
+    return result(aggregates.merge(await shards.fan_out(parts, *args)), *args)
 
 @app.get("/health")
-def health():
-    return {"status": "ok"}
+async def health():
+    # La versión de los datos cambia con cada carga: los clientes la usan para invalidar sus cachés
+    return {"status": "ok", "version": await data_version()}
+
+@app.get("/schools")
+async def schools():
+    return {"data": [{"escuela": name} for name in shards.names]}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    # Formato de texto de Prometheus; cada worker de uvicorn expone sus propios contadores (etiqueta pid)
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/students")
+async def students(
+    request: Request,
+    after: Optional[int] = Query(None, description="Último ID_Estudiante recibido (paginación por clave)"),
+    limit: Optional[int] = Query(None, ge=1, description="Máximo de filas; sin límite exporta todo"),
+    fields: Optional[str] = Query(None, description="Columnas separadas por comas"),
+    profesor: Optional[str] = None,
+    grupo: Optional[str] = None,
+    count: bool = Query(False, description="Solo devolver el total"),
+    escuela: Optional[str] = ESCUELA,
+):
+    filters = {"profesor": profesor, "grupo": grupo}
+    if count:
+        # El total sí se suma entre escuelas
+        return {"data": await run(escuela, crud.count_students, filters)}
+    path = school_pool(escuela).path
+    try:
+        cols, batches = crud.student_batches(after, limit, parse_fields(fields), path, filters)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Columnas desconocidas: {e.args[0]}")
+    # NDJSON por defecto; Arrow IPC o Parquet si el cliente los acepta
+    media = formats.negotiate(request.headers.get("accept"), formats.NDJSON)
+    return StreamingResponse(formats.encode(media, cols, batches), media_type=media, headers={"Vary": "Accept"})
+
+@app.get("/export")
+def export(
+    formato: Literal["csv", "parquet", "xlsx"] = Query("csv", description="csv (gzip), parquet o xlsx"),
+    profesor: Optional[str] = None,
+    grupo: Optional[str] = None,
+    promedio: Optional[float] = Query(None, description="Solo estudiantes con promedio bajo este umbral"),
+    asistencia: Optional[float] = Query(None, description="Solo estudiantes con asistencia (%) bajo este umbral"),
+    q: Optional[str] = Query(None, description="Inicio de palabras del nombre, o un ID exacto"),
+    fields: Optional[str] = Query(None, description="Columnas separadas por comas"),
+    escuela: Optional[str] = ESCUELA,
+):
+    media, ext = formats.EXPORTS[formato]
+    if not formats.available(media):
+        raise HTTPException(status_code=400, detail=f"Formato no disponible en este servidor: {formato}")
+    path = school_pool(escuela).path
+    filters = {"profesor": profesor, "grupo": grupo}
+    try:
+        cols, batches = crud.export_batches(filters, promedio, asistencia, q, parse_fields(fields), path)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Columnas desconocidas: {e.args[0]}")
+    # Se genera lote a lote desde el cursor (memoria constante), en el pool de hilos de la petición
+    name = "estudiantes_en_riesgo" if promedio is not None or asistencia is not None else "estudiantes"
+    headers = {"Content-Disposition": f'attachment; filename="{name}.{ext}"'}
+    return StreamingResponse(formats.encode(media, cols, batches), media_type=media, headers=headers)
+
+@app.get("/students/search")
+async def students_search(
+    q: str = Query(..., min_length=1, description="Inicio de palabras del nombre, o un ID exacto"),
+    limit: int = Query(20, ge=1, le=100),
+    after: Optional[int] = Query(None, description="Valor de 'next' de la página anterior"),
+    profesor: Optional[str] = None,
+    grupo: Optional[str] = None,
+    escuela: Optional[str] = ESCUELA,
+):
+    filters = {"profesor": profesor, "grupo": grupo}
+    result = await school_pool(escuela).run(crud.search_students, q, limit, after, filters)
+    return {"data": result["rows"], "next": result["next"]}
+
+@app.get("/at-risk")
+async def at_risk(
+    request: Request,
+    promedio: float = Query(3.0, description="Umbral de calificación mínima"),
+    asistencia: float = Query(75.0, description="Umbral mínimo de asistencia (%)"),
+    profesor: Optional[str] = None,
+    grupo: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Valor de 'next' de la página anterior"),
+    fields: Optional[str] = Query(None, description="Columnas separadas por comas"),
+    count: bool = Query(False, description="Solo devolver el total"),
+    escuela: Optional[str] = ESCUELA,
+):
+    filters = {"profesor": profesor, "grupo": grupo}
+    if count:
+        # El total sí se suma entre escuelas
+        return {"data": await run(escuela, crud.count_at_risk, promedio, asistencia, filters)}
+    try:
+        result = await school_pool(escuela).run(
+            crud.get_at_risk, promedio, asistencia, filters, limit, cursor, parse_fields(fields)
+        )
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Columnas desconocidas: {e.args[0]}")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    media = formats.negotiate(request.headers.get("accept"), formats.JSON)
+    if media != formats.JSON:
+        # Formato columnar: el cursor de la siguiente página va en una cabecera
+        body = formats.encode_records(media, result["columns"], result["rows"])
+        headers = {"Vary": "Accept", "X-Next-Cursor": result["next"] or ""}
+        return Response(body, media_type=media, headers=headers)
+    return {"data": result["rows"], "next": result["next"]}
+
+# ----- PUNTAJE DE RIESGO -----
+MAX_SCORE_IDS = 10_000
 
-@app.get("/preview")
+class ScoreRequest(BaseModel):
+    ids: List[int]
+    pesos: Optional[Dict[str, float]] = None
+
+@app.get("/risk/score/{student_id}")
+async def risk_score(student_id: int, escuela: Optional[str] = ESCUELA):
+    result = await school_pool(escuela).run(crud.get_risk_score, student_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Estudiante no encontrado")
+    return {"data": result}
+
+@app.post("/risk/score")
+async def risk_score_bulk(body: ScoreRequest, escuela: Optional[str] = ESCUELA):
+    if len(body.ids) > MAX_SCORE_IDS:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_SCORE_IDS} IDs por petición")
+    pool = school_pool(escuela)
+    try:
+        return {"data": await pool.run(crud.score_students, body.ids, body.pesos)}
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Variables desconocidas: {e.args[0]}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/preview", deprecated=True)
 def preview(limit: int = Query(100, le=1000)):
     return {"data": crud.get_preview(limit)}
 
+# ----- ANALÍTICA (agregados calculados en SQL, cacheados por versión de datos) -----
+async def data_version():
+    if results.version_stale():
+        results.set_version(await shards.data_version())
+    return results.version
+
+async def aggregate(request: Request, escuela: Optional[str], fn, *args):
+    """Respuesta ``{"data": fn(*args)}`` desde la caché, con ETag y 304.
+
+    Sin escuela y con varias en el catálogo, el agregado combina todas.
+    """
+    version = await data_version()
+    key = cache.make_key(fn.__name__, (escuela,) + args)
+    tag = cache.etag(version, key)
+    headers = {"ETag": tag, "Cache-Control": f"public, max-age={cache.MAX_AGE}"}
+    if cache.matches(request.headers.get("if-none-match"), tag):
+        metrics.CACHE.inc(result="not_modified")
+        return Response(status_code=304, headers=headers)
+    body = results.get(key)
+    metrics.CACHE.inc(result="miss" if body is None else "hit")
+    if body is None:
+        try:
+            body = await cached(escuela, fn, *args, version=version)
+        except KeyError as e:
+            raise HTTPException(status_code=400, detail=f"Columna no permitida: {e.args[0]}")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return Response(body, media_type="application/json", headers=headers)
+
+async def cached(escuela: Optional[str], fn, *args, version=None):
+    """Calcula ``{"data": fn(*args)}`` ya serializado y lo guarda en la caché de resultados."""
+    version = version if version is not None else await data_version()
+    data = await run(escuela, fn, *args)
+    start = time.perf_counter()
+    body = json.dumps({"data": data}, ensure_ascii=False, separators=(",", ":")).encode()
+    metrics.SERIALIZE_SECONDS.observe(time.perf_counter() - start, function=fn.__name__)
+    results.put(cache.make_key(fn.__name__, (escuela,) + args), body, version)
+    return body
+
 @app.get("/summary/gender")
-def summary_gender():
-    return {"data": crud.get_summary_by_gender()}
+async def summary_gender(request: Request, escuela: Optional[str] = ESCUELA):
+    return await aggregate(request, escuela, crud.get_distribution, "Género")
 
 @app.get("/summary/subjects")
-def subjects_summary():
-    return {"data": crud.get_subjects_averages()}
+async def subjects_summary(request: Request, escuela: Optional[str] = ESCUELA):
+    return await aggregate(request, escuela, crud.get_subjects_averages)
+
+@app.get("/stats/kpis")
+async def stats_kpis(request: Request, escuela: Optional[str] = ESCUELA):
+    return await aggregate(request, escuela, crud.get_kpis)
+
+@app.get("/stats/distribution")
+async def stats_distribution(
+    request: Request, column: str = "Nivel_Socioeconómico", escuela: Optional[str] = ESCUELA
+):
+    return await aggregate(request, escuela, crud.get_distribution, column)
+
+@app.get("/stats/subjects")
+async def stats_subjects(request: Request, escuela: Optional[str] = ESCUELA):
+    return await aggregate(request, escuela, crud.get_subjects_averages)
+
+@app.get("/stats/breakdown")
+async def stats_breakdown(
+    request: Request,
+    by: str,
+    column: str,
+    profesor: Optional[str] = None,
+    grupo: Optional[str] = None,
+    escuela: Optional[str] = ESCUELA,
+):
+    filters = {"profesor": profesor, "grupo": grupo}
+    return await aggregate(request, escuela, crud.get_breakdown, by, column, filters)
+
+@app.get("/stats/histogram")
+async def stats_histogram(
+    request: Request,
+    column: str,
+    bins: int = Query(20, ge=1, le=200),
+    profesor: Optional[str] = None,
+    grupo: Optional[str] = None,
+    escuela: Optional[str] = ESCUELA,
+):
+    filters = {"profesor": profesor, "grupo": grupo}
+    return await aggregate(request, escuela, crud.get_histogram, column, bins, filters)
+
+@app.get("/stats/describe")
+async def stats_describe(
+    request: Request,
+    column: str,
+    profesor: Optional[str] = None,
+    grupo: Optional[str] = None,
+    escuela: Optional[str] = ESCUELA,
+):
+    filters = {"profesor": profesor, "grupo": grupo}
+    return await aggregate(request, escuela, crud.get_describe, column, filters)
+
+@app.get("/stats/quantiles")
+async def stats_quantiles(
+    request: Request,
+    column: str,
+    by: Optional[str] = Query(None, description="Dimensión para desglosar (un resultado por valor)"),
+    bins: int = Query(0, ge=0, le=200, description="Intervalos del histograma por segmento (0 = sin histograma)"),
+    profesor: Optional[str] = None,
+    grupo: Optional[str] = None,
+    escuela: Optional[str] = ESCUELA,
+):
+    filters = {"profesor": profesor, "grupo": grupo}
+    return await aggregate(request, escuela, crud.get_quantiles, column, by, filters, bins)
+
+@app.get("/stats/scatter")
+async def stats_scatter(
+    request: Request,
+    x: str = "Asistencia_%",
+    y: str = "Promedio_General",
+    color: Optional[str] = Query(None, description="Dimensión que se incluye en cada punto"),
+    budget: int = Query(2000, ge=100, le=20000, description="Máximo de puntos individuales"),
+    bins: int = Query(40, ge=5, le=200, description="Celdas por eje de la rejilla de densidad"),
+    profesor: Optional[str] = None,
+    grupo: Optional[str] = None,
+    escuela: Optional[str] = ESCUELA,
+):
+    filters = {"profesor": profesor, "grupo": grupo}
+    return await aggregate(request, escuela, crud.get_scatter, x, y, filters, budget, bins, color)
+
+@app.get("/stats/correlation")
+async def stats_correlation(
+    request: Request,
+    columns: Optional[str] = Query(None, description="Columnas separadas por comas"),
+    profesor: Optional[str] = None,
+    grupo: Optional[str] = None,
+    escuela: Optional[str] = ESCUELA,
+):
+    filters = {"profesor": profesor, "grupo": grupo}
+    return await aggregate(request, escuela, crud.get_correlation, parse_fields(columns), filters)
+
+@app.get("/stats/regression")
+async def stats_regression(
+    request: Request,
+    y: str = Query(..., description="Columna dependiente (p. ej. una calificación)"),
+    x: str = Query("Asistencia_%", description="Columna explicativa"),
+    by: Optional[str] = Query(None, description="Dimensión para ajustar una recta por segmento"),
+    profesor: Optional[str] = None,
+    grupo: Optional[str] = None,
+    escuela: Optional[str] = ESCUELA,
+):
+    filters = {"profesor": profesor, "grupo": grupo}
+    return await aggregate(request, escuela, crud.get_regression, y, x, by, filters)
+
+@app.get("/trends")
+async def trends(
+    request: Request,
+    column: str = Query("Asistencia_%", description="Asistencia_% o una Calificación_*"),
+    escala: Literal["mensual", "trimestral", "anual"] = "mensual",
+    desde: Optional[str] = Query(None, description="Primer mes del rango (AAAA-MM)"),
+    hasta: Optional[str] = Query(None, description="Último mes del rango (AAAA-MM)"),
+    by: Optional[str] = Query(None, description="Grupo o Profesor: una serie por valor"),
+    profesor: Optional[str] = None,
+    grupo: Optional[str] = None,
+    escuela: Optional[str] = ESCUELA,
+):
+    filters = {"profesor": profesor, "grupo": grupo}
+    return await aggregate(request, escuela, crud.get_trends, column, escala, desde, hasta, by, filters)
+
+@app.get("/risk/ranking")
+async def risk_ranking(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    minimo: float = Query(0.0, ge=0.0, le=1.0, description="Puntaje mínimo"),
+    profesor: Optional[str] = None,
+    grupo: Optional[str] = None,
+    escuela: Optional[str] = ESCUELA,
+):
+    filters = {"profesor": profesor, "grupo": grupo}
+    return await aggregate(request, escuela, crud.get_risk_ranking, limit, minimo, filters)
@@ -0,0 +1,328 @@
+"""Métricas de la API en formato de texto de Prometheus (``GET /metrics``).
+
+- ``MetricsMiddleware`` mide cada petición HTTP: latencia por ruta, código de
+  estado y bytes enviados (ya comprimidos).
+- ``TimedConnection`` es la fábrica de conexiones sqlite3 del pool y del
+  engine: de cada consulta se suma el tiempo dentro de SQLite (execute y
+  lecturas hasta la última fila, sin las esperas entre lotes), se cuentan las filas
+  devueltas y las que superan ``SLOW_QUERY_MS`` se registran en el log con su
+  ``EXPLAIN QUERY PLAN``. Se etiquetan con la función de crud.py que las lanza.
+- Con ``PROFILING=1``, una petición con la cabecera ``X-Profile`` devuelve en
+  texto el perfil de cProfile (hilo del bucle de eventos y consultas del pool)
+  en lugar de su respuesta.
+
+Sin dependencias: cada worker de uvicorn lleva sus propios contadores y los
+expone con la etiqueta ``pid``.
+"""
+import contextvars
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sqlite3
+import threading
+import time
+
+SLOW_QUERY = float(os.environ.get("SLOW_QUERY_MS", "200")) / 1000
+PROFILING = os.environ.get("PROFILING", "0") == "1"
+PROFILE_LINES = 40
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+log = logging.getLogger(__name__)
+_PID = str(os.getpid())
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = [("pid", _PID), *zip(names, values), *extra]
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_labels(self.labelnames, key)} {value:g}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # conteos por cubeta (no acumulados), suma, total
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self, key, state):
+        counts, total, n = state
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', f'{bound:g}')])} {cumulative}")
+        lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', '+Inf')])} {n}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total:g}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+REQUESTS = Counter("api_requests_total", "Peticiones HTTP atendidas.", ["method", "route", "status"])
+REQUEST_SECONDS = Histogram("api_request_duration_seconds", "Latencia de las peticiones HTTP.", ["method", "route"])
+RESPONSE_BYTES = Counter("api_response_bytes_total", "Bytes enviados en el cuerpo de las respuestas.", ["route"])
+IN_PROGRESS = Gauge("api_requests_in_progress", "Peticiones HTTP en curso.")
+CACHE = Counter("api_cache_requests_total", "Consultas a la caché de agregados.", ["result"])
+SERIALIZE_SECONDS = Histogram("api_serialize_duration_seconds", "Tiempo de serializar a JSON.", ["function"])
+POOL_WAIT_SECONDS = Histogram("db_pool_wait_seconds", "Espera hasta obtener una conexión libre del pool.")
+CALL_SECONDS = Histogram("db_call_duration_seconds",
+                         "Tiempo de cada función de crud.py en el pool (SQL y cálculo en Python).", ["function"])
+QUERY_SECONDS = Histogram("db_query_duration_seconds",
+                          "Tiempo de cada consulta SQL dentro de SQLite (execute y lecturas de filas).",
+                          ["function"])
+ROWS = Counter("db_rows_returned_total", "Filas leídas de SQLite.", ["function"])
+SLOW_QUERIES = Counter("db_slow_queries_total", "Consultas por encima de SLOW_QUERY_MS.", ["function"])
+
+
+def render():
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# ----- CONSULTAS -----
+class TimedConnection(sqlite3.Connection):
+    """Conexión que mide el tiempo de cada ``execute`` y de las lecturas de su cursor."""
+
+    # Función de crud.py en curso; ReadPool.run la fija antes de cada llamada
+    label = "engine"
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        cursor = super().execute(sql, parameters)
+        return _TimedCursor(self, cursor, sql, parameters, time.perf_counter() - start)
+
+    def explain(self, sql, parameters=()):
+        rows = super().execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+        return " | ".join(r[3] for r in rows)
+
+
+class _TimedCursor:
+    """Cursor que registra la consulta al leer su última fila (fetchall, iteración o fetchmany).
+
+    Solo suma el tiempo pasado dentro de SQLite: en los endpoints que transmiten
+    las filas por lotes (/students, /export) queda fuera la espera entre lotes
+    mientras el cliente las descarga.
+    """
+
+    def __init__(self, conn, cursor, sql, parameters, elapsed):
+        self._conn, self._cursor = conn, cursor
+        self._sql, self._parameters, self._elapsed = sql, parameters, elapsed
+        self._rows, self._done = 0, False
+
+    def _timed(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self._elapsed += time.perf_counter() - start
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._finish(len(rows))
+        return rows
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        self._finish(row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(self._cursor.fetchmany, size or self._cursor.arraysize)
+        self._rows += len(rows)
+        if not rows:
+            self._finish(0)
+        return rows
+
+    def __iter__(self):
+        while True:
+            rows = self._timed(self._cursor.fetchmany, 1000)
+            if not rows:
+                self._finish(0)
+                return
+            self._rows += len(rows)
+            yield from rows
+
+    def close(self):
+        self._cursor.close()
+
+    def _finish(self, rows):
+        if self._done:
+            return
+        self._done = True
+        elapsed = self._elapsed
+        rows += self._rows
+        label = self._conn.label
+        QUERY_SECONDS.observe(elapsed, function=label)
+        ROWS.inc(rows, function=label)
+        if elapsed >= SLOW_QUERY and self._sql.lstrip()[:6].upper() in ("SELECT", "WITH"):
+            SLOW_QUERIES.inc(function=label)
+            try:
+                plan = self._conn.explain(self._sql, self._parameters)
+            except sqlite3.Error as e:
+                plan = f"(sin plan: {e})"
+            log.warning("Consulta lenta en %s: %.0f ms, %d filas\n  %s\n  plan: %s",
+                        label, elapsed * 1000, rows, " ".join(self._sql.split()), plan)
+
+
+# ----- PERFILADO -----
+_profiles = contextvars.ContextVar("profiles", default=None)
+
+
+def profiled(fn):
+    """Envuelve ``fn`` para perfilarla en el hilo del pool si la petición en curso se está perfilando."""
+    collected = _profiles.get()
+    if collected is None:
+        return fn
+
+    def wrapper(*args):
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(fn, *args)
+        finally:
+            collected.append(profile)
+
+    wrapper.__name__ = fn.__name__
+    return wrapper
+
+
+def _profile_report(profile, collected):
+    out = io.StringIO()
+    stats = pstats.Stats(profile, stream=out)
+    for p in collected:
+        stats.add(p)
+    stats.sort_stats("cumulative").print_stats(PROFILE_LINES)
+    return out.getvalue().encode()
+
+
+# ----- MIDDLEWARE -----
+def _route(scope):
+    """Plantilla de la ruta (``/risk/score/{student_id}``) para no crear una serie por URL."""
+    endpoint = scope.get("endpoint")
+    for route in getattr(scope.get("app"), "routes", ()):
+        if getattr(route, "endpoint", None) is endpoint:
+            return route.path
+    return "(sin ruta)"
+
+
+class MetricsMiddleware:
+    """Middleware ASGI puro: no bufferiza las respuestas en streaming."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if PROFILING and b"x-profile" in headers:
+            return await self._profile(scope, receive, send)
+
+        status, size = 500, 0
+
+        async def send_counted(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_counted)
+        finally:
+            IN_PROGRESS.inc(-1)
+            route, method = _route(scope), scope["method"]
+            REQUEST_SECONDS.observe(time.perf_counter() - start, method=method, route=route)
+            REQUESTS.inc(method=method, route=route, status=str(status))
+            RESPONSE_BYTES.inc(size, route=route)
+
+    async def _profile(self, scope, receive, send):
+        """Ejecuta la petición con cProfile y responde con el informe en texto."""
+        collected = []
+        token = _profiles.set(collected)
+        status = 500
+
+        async def discard(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            profile.disable()
+            _profiles.reset(token)
+        body = _profile_report(profile, collected)
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/plain; charset=utf-8"),
+            (b"content-length", str(len(body)).encode()),
+            (b"x-profile-status", str(status).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,139 @@
+"""Puntaje de riesgo académico continuo, calculado en bloque con NumPy.
+
+Cada variable aporta un déficit normalizado en [0, 1]: una calificación de 1
+vale 1 y una de 5 vale 0, una asistencia de 0 % vale 1 y una de 100 % vale 0,
+y lo mismo con el Nivel_Preparación. El puntaje es la media ponderada de los
+déficits que tienen valor, así que un dato faltante no cuenta como riesgo. Los
+pesos por defecto se pueden cambiar con la variable de entorno ``RISK_WEIGHTS``
+(JSON ``{"columna": peso}``), y puede pasarse otro juego de pesos en cada llamada.
+
+init_db.py puntúa cada lote al insertarlo; ``rescore`` reescribe la columna
+``Puntaje_Riesgo`` (indexada) de toda la tabla, p. ej. tras cambiar los pesos,
+desde score_risk.py.
+
+Los pesos y el umbral con que está calculada la columna se guardan en la
+propia base (``risk_config``, en la misma transacción que la reescribe): las
+cargas posteriores puntúan las filas nuevas igual y la API explica cada
+puntaje con los pesos que lo produjeron. Sin esa tabla valen los de entorno.
+"""
+import json
+import os
+
+import numpy as np
+
+from .schema import TABLE, KEY, GRADE_COLUMNS, SCORE_COLUMN
+
+FEATURES = GRADE_COLUMNS + ["Asistencia_%", "Nivel_Preparación"]
+# (valor con riesgo máximo, valor sin riesgo) de cada variable
+SCALES = {
+    **{c: (1.0, 5.0) for c in GRADE_COLUMNS},
+    "Asistencia_%": (0.0, 100.0),
+    "Nivel_Preparación": (1.0, 5.0),
+}
+DEFAULT_WEIGHTS = {**{c: 1.0 for c in GRADE_COLUMNS}, "Asistencia_%": 4.0, "Nivel_Preparación": 2.0}
+WEIGHTS = {**DEFAULT_WEIGHTS, **json.loads(os.environ.get("RISK_WEIGHTS") or "{}")}
+# Puntaje a partir del cual se considera al estudiante en riesgo
+THRESHOLD = float(os.environ.get("RISK_THRESHOLD", "0.5"))
+
+CONFIG_TABLE = "risk_config"
+
+_LOW = np.array([SCALES[c][0] for c in FEATURES])
+_HIGH = np.array([SCALES[c][1] for c in FEATURES])
+
+
+def weights_vector(weights=None):
+    """Pesos en el orden de ``FEATURES``; ``weights`` sustituye a los configurados."""
+    merged = {**WEIGHTS, **(weights or {})}
+    unknown = [c for c in merged if c not in SCALES]
+    if unknown:
+        raise KeyError(", ".join(unknown))
+    w = np.array([float(merged[c]) for c in FEATURES])
+    if (w < 0).any() or not w.sum():
+        raise ValueError("Los pesos deben ser no negativos y no todos cero")
+    return w
+
+
+def load_config(conn):
+    """(pesos, umbral) con que está calculado ``Puntaje_Riesgo`` en la base de ``conn``."""
+    q = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+    row = None
+    if conn.execute(q, (CONFIG_TABLE,)).fetchone():
+        row = conn.execute(f"SELECT pesos, umbral FROM {CONFIG_TABLE}").fetchone()
+    if row is None:
+        return dict(WEIGHTS), THRESHOLD
+    return {**WEIGHTS, **json.loads(row[0])}, row[1]
+
+
+def save_config(conn, weights, threshold):
+    """Guarda los pesos (completos, en el orden de ``FEATURES``) y el umbral de la base."""
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {CONFIG_TABLE} "
+        "(id INTEGER PRIMARY KEY CHECK (id = 1), pesos TEXT NOT NULL, umbral REAL NOT NULL)"
+    )
+    pesos = dict(zip(FEATURES, weights_vector(weights).tolist()))
+    conn.execute(f"INSERT OR REPLACE INTO {CONFIG_TABLE} VALUES (1, ?, ?)",
+                 (json.dumps(pesos, ensure_ascii=False), float(threshold)))
+
+
+def deficits(values):
+    """Déficit normalizado de cada variable (NaN donde falta el dato)."""
+    return np.clip((_HIGH - values) / (_HIGH - _LOW), 0.0, 1.0)
+
+
+def score(values, weights=None):
+    """Puntajes de una matriz n×k (columnas en el orden de ``FEATURES``)."""
+    return _score(values, weights_vector(weights))
+
+
+def _score(values, w):
+    d = deficits(np.asarray(values, dtype=float))
+    valid = ~np.isnan(d)
+    total = np.where(valid, d, 0.0) @ w
+    weight = valid @ w
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(weight > 0, total / weight, np.nan)
+
+
+def ensure_column(conn, table=TABLE):
+    """Añade la columna del puntaje a tablas creadas antes de que existiera.
+
+    Devuelve True si la ha añadido (las filas existentes quedan sin puntaje).
+    """
+    columns = [r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')]
+    if SCORE_COLUMN in columns:
+        return False
+    conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{SCORE_COLUMN}" REAL')
+    return True
+
+
+def rescore(conn, table=TABLE, weights=None, chunksize=200_000, threshold=None):
+    """Recalcula ``Puntaje_Riesgo`` y devuelve el número de filas puntuadas.
+
+    Lee por lotes en orden de clave (cada lote se lee completo antes de
+    escribirlo). Con ``threshold`` también se reescribe ``En_Riesgo`` como ``puntaje >= threshold``; en ese caso hay que
+    recalcular los agregados.
+    """
+    ensure_column(conn, table)
+    select = ", ".join(f'"{c}"' for c in [KEY] + FEATURES)
+    q = f'SELECT {select} FROM "{table}" WHERE "{KEY}" > ? ORDER BY "{KEY}" LIMIT ?'
+    if threshold is None:
+        update = f'UPDATE "{table}" SET "{SCORE_COLUMN}" = ? WHERE "{KEY}" = ?'
+    else:
+        update = f'UPDATE "{table}" SET "{SCORE_COLUMN}" = ?, "En_Riesgo" = ? WHERE "{KEY}" = ?'
+    w = weights_vector(weights)
+    last, total = float("-inf"), 0
+    while True:
+        rows = conn.execute(q, (last, chunksize)).fetchall()
+        if not rows:
+            break
+        data = np.array(rows, dtype=float)
+        scores = _score(data[:, 1:], w)
+        ids = [r[0] for r in rows]
+        values = [None if np.isnan(s) else s for s in scores.tolist()]
+        if threshold is None:
+            conn.executemany(update, zip(values, ids))
+        else:
+            flags = [None if s is None else float(s >= threshold) for s in values]
+            conn.executemany(update, zip(values, flags, ids))
+        last, total = ids[-1], total + len(rows)
+    return total
@@ -0,0 +1,61 @@
+# Esquema de la tabla de estudiantes compartido por la API e init_db.py
+TABLE = "students"
+KEY = "ID_Estudiante"
+
+GRADE_COLUMNS = [
+    "Calificación_Matemáticas",
+    "Calificación_Lectura",
+    "Calificación_Ciencias",
+    "Calificación_Historia",
+    "Calificación_Arte",
+    "Calificación_Educación_Física",
+]
+NUMERIC_COLUMNS = GRADE_COLUMNS + ["Promedio_General", "Asistencia_%", "Nivel_Preparación"]
+DIMENSIONS = ["Género", "Etnia", "Nivel_Socioeconómico", "Grupo", "Profesor", "Nivel_Preparación", "En_Riesgo"]
+
+# Tipos de la tabla en SQLite (orden de las columnas del CSV)
+COLUMN_TYPES = {
+    "ID_Estudiante": "INTEGER PRIMARY KEY",
+    "Nombre": "TEXT",
+    "Género": "TEXT",
+    "Etnia": "TEXT",
+    "Nivel_Socioeconómico": "TEXT",
+    "Grupo": "TEXT",
+    "Profesor": "TEXT",
+    **{c: "REAL" for c in GRADE_COLUMNS},
+    "Promedio_General": "REAL",
+    "Asistencia_%": "REAL",
+    "En_Riesgo": "BOOLEAN",
+    "Nivel_Preparación": "INTEGER",
+}
+
+# Columnas calculadas después de la carga (no vienen en el CSV)
+SCORE_COLUMN = "Puntaje_Riesgo"
+DERIVED_TYPES = {SCORE_COLUMN: "REAL"}
+ALL_TYPES = {**COLUMN_TYPES, **DERIVED_TYPES}
+
+# Valores del CSV que se interpretan como verdadero en En_Riesgo
+TRUE_VALUES = {"sí", "si", "s", "yes", "true", "1"}
+
+def normalize_column(name: str) -> str:
+    """Nombre de columna tal como se guarda en la base (sin espacios ni paréntesis)."""
+    return name.strip().replace(" ", "_").replace("(", "").replace(")", "")
+
+def create_table_sql(table: str = TABLE) -> str:
+    cols = ",\n  ".join(f'"{c}" {t}' for c, t in ALL_TYPES.items())
+    return f'CREATE TABLE IF NOT EXISTS "{table}" (\n  {cols}\n)'
+
+# Índices secundarios para los accesos del dashboard (el ID ya es la clave primaria)
+INDEXES = {
+    "idx_students_profesor_grupo": ("Profesor", "Grupo"),
+    "idx_students_grupo": ("Grupo",),
+    "idx_students_riesgo": ("Promedio_General", "Asistencia_%"),
+    "idx_students_puntaje": (SCORE_COLUMN,),
+}
+
+def create_indexes_sql(table: str = TABLE):
+    statements = []
+    for name, cols in INDEXES.items():
+        quoted = ", ".join(f'"{c}"' for c in cols)
+        statements.append(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({quoted})')
+    return statements
@@ -0,0 +1,53 @@
+"""Índice de búsqueda de estudiantes por nombre (SQLite FTS5).
+
+Tabla FTS5 de contenido externo sobre ``students``: guarda solo el índice
+invertido y lee los nombres de la tabla base (``rowid`` = ``ID_Estudiante``).
+El tokenizador ``unicode61`` con ``remove_diacritics 2`` ignora mayúsculas y
+tildes ("maria" encuentra "María", "nunez" encuentra "Núñez"), y los índices de
+prefijo hacen que las búsquedas por inicio de palabra mientras se escribe no
+recorran el vocabulario. init_db.py reconstruye el índice al cargar y unos
+triggers lo mantienen al día en las cargas incrementales.
+"""
+import re
+
+from .schema import TABLE, KEY
+
+FTS_TABLE = "students_fts"
+
+DDL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+  "Nombre", content='{TABLE}', content_rowid='{KEY}',
+  tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+)"""
+
+TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLE}_fts_insert AFTER INSERT ON "{TABLE}" BEGIN
+      INSERT INTO {FTS_TABLE}(rowid, "Nombre") VALUES (new."{KEY}", new."Nombre");
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLE}_fts_delete AFTER DELETE ON "{TABLE}" BEGIN
+      INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, "Nombre") VALUES ('delete', old."{KEY}", old."Nombre");
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLE}_fts_update AFTER UPDATE OF "Nombre" ON "{TABLE}" BEGIN
+      INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, "Nombre") VALUES ('delete', old."{KEY}", old."Nombre");
+      INSERT INTO {FTS_TABLE}(rowid, "Nombre") VALUES (new."{KEY}", new."Nombre");
+    END""",
+]
+
+
+def exists(conn):
+    q = "SELECT COUNT(*) FROM sqlite_master WHERE name IN (?, ?)"
+    return conn.execute(q, (FTS_TABLE, f"{TABLE}_fts_insert")).fetchone()[0] == 2
+
+
+def rebuild(conn):
+    """Crea (si falta) y reconstruye el índice desde la tabla base, con sus triggers."""
+    conn.execute(DDL)
+    conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    for trigger in TRIGGERS:
+        conn.execute(trigger)
+
+
+def match_query(text):
+    """Expresión MATCH: cada palabra como prefijo y todas obligatorias ("mar gom" -> mar* gom*)."""
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{w}"*' for w in words)
@@ -0,0 +1,91 @@
+"""Una base SQLite por escuela (o por año), registradas en un catálogo.
+
+El catálogo es un JSON ``{"escuela": "ruta/a/su.db", ...}`` (rutas relativas
+al propio catálogo) en ``SCHOOLS_CATALOG``, por defecto ``escuelas.json`` junto
+a la base. Sin catálogo hay una única escuela con ``DB_FILE`` y todo funciona
+como con una sola base.
+
+Cada escuela tiene su propio pool de lectura (db.ReadPool). Una petición de
+una escuela solo toca su base; las que abarcan todas se reparten entre los
+pools a la vez (``fan_out``): cada consulta corre en un hilo de su pool y
+SQLite libera el GIL mientras lee, así que las bases se recorren en paralelo.
+La API combina después los agregados parciales (ver crud.PARTIALS).
+"""
+import asyncio
+import json
+import os
+from pathlib import Path
+
+from .db import DB_FILE, ReadPool, data_version
+
+CATALOG_FILE = Path(os.environ.get("SCHOOLS_CATALOG") or DB_FILE.parent / "escuelas.json")
+# Nombre de la escuela única cuando no hay catálogo
+DEFAULT = "principal"
+
+
+def load_catalog(path=CATALOG_FILE):
+    """{escuela: ruta de su base} en el orden del catálogo."""
+    path = Path(path)
+    if not path.exists():
+        return {DEFAULT: DB_FILE}
+    entries = json.loads(path.read_text(encoding="utf-8"))
+    return {name: (path.parent / db).resolve() for name, db in entries.items()}
+
+
+def register(name, db_path, path=CATALOG_FILE):
+    """Añade (o actualiza) una escuela en el catálogo; devuelve la ruta de su base."""
+    path = Path(path)
+    entries = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+    db_path = Path(db_path).resolve()
+    try:
+        entries[name] = str(db_path.relative_to(path.parent.resolve()))
+    except ValueError:
+        entries[name] = str(db_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(entries, ensure_ascii=False, indent=2), encoding="utf-8")
+    return db_path
+
+
+def db_path(name, path=CATALOG_FILE):
+    """Base de una escuela del catálogo o, si aún no está, ``<escuela>.db`` junto al catálogo."""
+    catalog = load_catalog(path) if Path(path).exists() else {}
+    return catalog.get(name) or Path(path).parent / f"{name}.db"
+
+
+class Shards:
+    """Pools de lectura de todas las escuelas del catálogo."""
+
+    def __init__(self, catalog=None):
+        self.catalog = catalog or load_catalog()
+        self.pools = {name: ReadPool(path=db) for name, db in self.catalog.items()}
+
+    @property
+    def names(self):
+        return list(self.pools)
+
+    @property
+    def single(self):
+        return len(self.pools) == 1
+
+    async def open(self):
+        await asyncio.gather(*(p.open() for p in self.pools.values()))
+
+    async def close(self):
+        await asyncio.gather(*(p.close() for p in self.pools.values()))
+
+    def pool(self, escuela=None):
+        """Pool de una escuela; sin escuela, el de la única del catálogo. KeyError si no existe."""
+        if escuela is None and self.single:
+            return next(iter(self.pools.values()))
+        return self.pools[escuela]
+
+    async def fan_out(self, fn, *args):
+        """``fn(conn, *args)`` en todas las escuelas a la vez; resultados en el orden del catálogo."""
+        return await asyncio.gather(*(p.run(fn, *args) for p in self.pools.values()))
+
+    async def data_version(self):
+        # Las versiones de cada base solo crecen: su suma cambia si cambia cualquiera
+        return sum(await self.fan_out(data_version))
+
+
+shards = Shards()
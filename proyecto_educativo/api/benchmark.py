@@ -0,0 +1,326 @@
+# api/benchmark.py
+# Mide la ingesta, el arranque y los endpoints de la API sobre datos sintéticos y guarda el resultado en JSON
+import argparse
+import ast
+import asyncio
+import json
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from generate_data import history_path
+
+API_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = API_DIR.parent
+FRONTEND_DIR = PROJECT_ROOT / "frontend"
+
+PROF = "Prof. Gómez"
+MAT = "Calificación_Matemáticas"
+# (nombre, método, ruta, parámetros, cuerpo JSON)
+ENDPOINTS = [
+    ("health", "GET", "/health", {}, None),
+    ("students?limit=10000", "GET", "/students", {"limit": 10_000}, None),
+    ("students/search", "GET", "/students/search", {"q": "mar gon"}, None),
+    ("students/search?id", "GET", "/students/search", {"q": "42"}, None),
+    ("at-risk", "GET", "/at-risk", {}, None),
+    ("at-risk?count", "GET", "/at-risk", {"count": "true"}, None),
+    ("at-risk?profesor", "GET", "/at-risk", {"profesor": PROF}, None),
+    ("risk/score/{id}", "GET", "/risk/score/42", {}, None),
+    ("risk/score (1000 ids)", "POST", "/risk/score", {}, {"ids": list(range(1, 1001))}),
+    ("risk/ranking", "GET", "/risk/ranking", {"limit": 100}, None),
+    ("summary/gender", "GET", "/summary/gender", {}, None),
+    ("stats/kpis", "GET", "/stats/kpis", {}, None),
+    ("stats/distribution", "GET", "/stats/distribution", {"column": "Profesor"}, None),
+    ("stats/subjects", "GET", "/stats/subjects", {}, None),
+    ("stats/breakdown", "GET", "/stats/breakdown", {"by": "Género", "column": MAT}, None),
+    ("stats/breakdown?profesor", "GET", "/stats/breakdown",
+     {"by": "Género", "column": MAT, "profesor": PROF}, None),
+    ("stats/histogram", "GET", "/stats/histogram", {"column": MAT}, None),
+    ("stats/histogram?profesor&grupo", "GET", "/stats/histogram",
+     {"column": MAT, "profesor": PROF, "grupo": "A"}, None),
+    ("stats/describe", "GET", "/stats/describe", {"column": MAT}, None),
+    ("stats/quantiles", "GET", "/stats/quantiles", {"column": MAT}, None),
+    ("stats/quantiles?by", "GET", "/stats/quantiles", {"column": MAT, "by": "Género", "bins": 30}, None),
+    ("stats/scatter", "GET", "/stats/scatter", {"color": "Grupo"}, None),
+    ("stats/scatter?profesor", "GET", "/stats/scatter", {"profesor": PROF}, None),
+    ("stats/correlation", "GET", "/stats/correlation", {}, None),
+    ("stats/regression?by", "GET", "/stats/regression", {"y": MAT, "by": "Grupo"}, None),
+    ("stats/regression?profesor&grupo", "GET", "/stats/regression",
+     {"y": MAT, "by": "Género", "profesor": PROF, "grupo": "A"}, None),
+    ("trends", "GET", "/trends", {}, None),
+    ("trends?by", "GET", "/trends", {"column": MAT, "escala": "trimestral", "by": "Grupo"}, None),
+    # Descargas en streaming (se miden hasta el último byte)
+    ("export?profesor", "GET", "/export", {"profesor": PROF}, None),
+    ("export?formato=parquet&profesor", "GET", "/export", {"formato": "parquet", "profesor": PROF}, None),
+]
+# Diferencia a partir de la cual --comparar marca una regresión
+TOLERANCE = 0.20
+# Módulos más lentos de importar que se guardan por servicio
+TOP_IMPORTS = 8
+
+
+def peak_rss_mb(usage=None):
+    """Memoria residente máxima (ru_maxrss viene en KB en Linux y en bytes en macOS)."""
+    rss = (usage or resource.getrusage(resource.RUSAGE_SELF)).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=API_DIR, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_script(args, env=None):
+    """Ejecuta un script de api/ en un proceso aparte; devuelve (segundos, memoria pico en MB)."""
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, *args], cwd=API_DIR, env=env, stdout=subprocess.DEVNULL)
+    # wait4 da el uso de recursos de ese hijo en concreto
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, args)
+    return time.perf_counter() - start, peak_rss_mb(usage)
+
+
+def ingest(csv, db, engine):
+    """Carga el CSV con init_db.py en ``db``; el pico de memoria es el del proceso hijo.
+
+    El historial junto al CSV (``<csv>_historial.csv``), si existe, se anexa después
+    y se mide aparte, para que /trends tenga datos.
+    """
+    env = {**os.environ, "STUDENTS_DB": str(db)}
+    seconds, peak = run_script(["init_db.py", str(csv), "--engine", engine], env)
+    history = history_path(csv)
+    history_seconds = None
+    if history.exists():
+        history_seconds, _ = run_script(["init_db.py", "--solo-historial", "--historial", str(history)], env)
+    rows = sqlite3.connect(db).execute("SELECT COUNT(*) FROM students").fetchone()[0]
+    return {
+        "segundos": round(seconds, 3),
+        "filas_por_s": round(rows / seconds),
+        "memoria_pico_mb": round(peak, 1),
+        "tamano_db_mb": round(db.stat().st_size / 1e6, 1),
+        "historial_s": None if history_seconds is None else round(history_seconds, 3),
+    }
+
+
+async def bench_api(requests, concurrency):
+    """Latencias y rendimiento de cada endpoint con un cliente ASGI en el mismo proceso (sin red)."""
+    # Dependencia de desarrollo (requirements-dev.txt)
+    import httpx
+
+    from app.cache import results
+    from app.main import app
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    out = {}
+    async with app.router.lifespan_context(app), client:
+        for name, method, path, params, body in ENDPOINTS:
+            async def call():
+                start = time.perf_counter()
+                r = await client.request(method, path, params=params, json=body)
+                if r.status_code != 200:
+                    raise RuntimeError(f"{name}: HTTP {r.status_code} {r.text[:200]}")
+                return time.perf_counter() - start, len(r.content)
+
+            # Primera petición sin resultados cacheados, luego secuenciales y concurrentes
+            results.clear()
+            cold, size = await call()
+            latencies = np.array([(await call())[0] for _ in range(requests)]) * 1000
+
+            async def worker(n):
+                for _ in range(n):
+                    await call()
+
+            per_worker = max(requests // concurrency, 1)
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(per_worker) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+
+            out[name] = {
+                "frio_ms": round(cold * 1000, 2),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+                "media_ms": round(float(latencies.mean()), 2),
+                "rps": round(per_worker * concurrency / elapsed, 1),
+                "bytes": size,
+            }
+            print(f"   {name:<34} p50 {out[name]['p50_ms']:>8.2f} ms  p99 {out[name]['p99_ms']:>8.2f} ms  "
+                  f"{out[name]['rps']:>8.1f} req/s")
+    return out
+
+
+def import_time(modules, cwd, env=None):
+    """Arranque en frío: importa ``modules`` en un proceso nuevo con ``python -X importtime``.
+
+    Devuelve el tiempo total y los paquetes externos que más tardan en
+    importarse (tiempo acumulado, con todo lo que importan a su vez, aunque
+    los importe un módulo del proyecto).
+    """
+    code = "; ".join(f"import {m}" for m in modules)
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                         cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    total, packages = 0, {}
+    for line in out.stderr.splitlines():
+        # import time: <propio µs> | <acumulado µs> | <módulo, sangrado según profundidad>
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        ms, package = int(cumulative) / 1000, name.strip().split(".")[0]
+        if not name[1:].startswith(" "):
+            total += ms
+        local = (Path(cwd) / package).is_dir() or (Path(cwd) / f"{package}.py").is_file()
+        if not local:
+            packages[package] = max(packages.get(package, 0), ms)
+    top = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:TOP_IMPORTS]
+    return {"total_ms": round(total, 1), "paquetes_ms": {p: round(ms, 1) for p, ms in top}}
+
+
+def frontend_imports(path=FRONTEND_DIR / "app.py"):
+    """Módulos que el dashboard importa al cargar (sentencias import de primer nivel de app.py).
+
+    La aplicación de Streamlit no se puede importar fuera de ``streamlit run``;
+    sus imports sí, y son lo que cuesta el arranque en frío de cada proceso.
+    """
+    modules = []
+    for node in ast.parse(path.read_text(encoding="utf-8")).body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def bench_startup(db=None):
+    """Tiempo de importación de la API (``app.main``) y del dashboard."""
+    env = {**os.environ, **({"STUDENTS_DB": str(db)} if db else {})}
+    out = {"api": import_time(["app.main"], API_DIR, env), "dashboard": import_time(frontend_imports(), FRONTEND_DIR)}
+    for name, r in out.items():
+        top = ", ".join(f"{m} {ms:.0f}" for m, ms in list(r["paquetes_ms"].items())[:4])
+        print(f"   {name:<10} {r['total_ms']:>8.1f} ms  ({top})")
+    return out
+
+
+def compare(current, previous):
+    """Imprime la variación respecto a un resultado anterior; devuelve cuántas regresiones hay."""
+    regressions = 0
+
+    def line(name, before, after, higher_is_better=False):
+        nonlocal regressions
+        if not before or after is None:
+            return
+        change = (after - before) / before
+        worse = -change if higher_is_better else change
+        mark = "⚠️ " if worse > TOLERANCE else "  "
+        regressions += worse > TOLERANCE
+        print(f"{mark}{name:<44} {before:>10.2f} -> {after:>10.2f} ({change:+.0%})")
+
+    filas = f" ({previous['filas']} filas)" if previous.get("filas") else ""
+    print(f"\n📊 Comparación con {previous.get('commit')}{filas}:")
+    for name, now in current.get("arranque", {}).items():
+        before = previous.get("arranque", {}).get(name)
+        if before:
+            line(f"arranque {name} (ms)", before["total_ms"], now["total_ms"])
+    if "ingesta" not in current:
+        return regressions
+    line("ingesta (s)", previous["ingesta"]["segundos"], current["ingesta"]["segundos"])
+    line("ingesta memoria pico (MB)", previous["ingesta"]["memoria_pico_mb"], current["ingesta"]["memoria_pico_mb"])
+    line("api memoria pico (MB)", previous["api"]["memoria_pico_mb"], current["api"]["memoria_pico_mb"])
+    for name, now in current["api"]["endpoints"].items():
+        before = previous["api"]["endpoints"].get(name)
+        if before:
+            line(f"{name} p50 (ms)", before["p50_ms"], now["p50_ms"])
+            line(f"{name} p99 (ms)", before["p99_ms"], now["p99_ms"])
+            line(f"{name} req/s", before["rps"], now["rps"], higher_is_better=True)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de ingesta y API sobre datos sintéticos.")
+    parser.add_argument("--filas", type=int, default=100_000, help="Estudiantes a generar (10000, 1000000, ...)")
+    parser.add_argument("--meses", type=int, default=12,
+                        help="Meses de historial a generar para /trends (0 = ninguno)")
+    parser.add_argument("--csv", type=Path, default=None, help="Usar este CSV en lugar de generar uno")
+    parser.add_argument("--engine", choices=["c", "pyarrow"], default="c", help="Lector de CSV de init_db.py")
+    parser.add_argument("--peticiones", type=int, default=100, help="Peticiones por endpoint")
+    parser.add_argument("--concurrencia", type=int, default=16, help="Clientes simultáneos")
+    parser.add_argument("--salida", type=Path, default=None,
+                        help="JSON de resultados (por defecto benchmarks/<commit>_<filas>.json)")
+    parser.add_argument("--comparar", type=Path, default=None, help="JSON de una ejecución anterior")
+    parser.add_argument("--arranque", action="store_true",
+                        help="Medir solo el arranque en frío (imports) de la API y el dashboard")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    if args.arranque:
+        print("➡️  Arranque en frío (python -X importtime)…")
+        result = {"commit": commit, "python": platform.python_version(), "arranque": bench_startup()}
+        if args.salida:
+            args.salida.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+            print(f"✅ Resultados guardados en {args.salida}")
+        if args.comparar and compare(result, json.loads(args.comparar.read_text(encoding="utf-8"))):
+            sys.exit(1)
+        sys.exit(0)
+    with tempfile.TemporaryDirectory(prefix="students-bench-") as tmp:
+        tmp = Path(tmp)
+        csv, generation = args.csv, None
+        if csv is None:
+            csv = tmp / "students.csv"
+            print(f"➡️  Generando {args.filas} estudiantes…")
+            generation, _ = run_script(["generate_data.py", str(args.filas), "--salida", str(csv),
+                                        "--meses", str(args.meses)])
+        db = tmp / "students.db"
+        print(f"➡️  Ingesta de {csv}…")
+        ingesta = ingest(csv, db, args.engine)
+        print(f"   {ingesta['segundos']}s, {ingesta['filas_por_s']} filas/s, pico {ingesta['memoria_pico_mb']} MB")
+
+        print("➡️  Arranque en frío (python -X importtime)…")
+        arranque = bench_startup(db)
+
+        # La API se importa después de fijar la base de datos; sin precalentar, para
+        # que la primera petición de cada endpoint se mida en frío
+        os.environ["STUDENTS_DB"] = str(db)
+        os.environ["API_WARMUP"] = "0"
+        sys.path.insert(0, str(API_DIR))
+        print(f"➡️  Endpoints ({args.peticiones} peticiones, {args.concurrencia} concurrentes)…")
+        endpoints = asyncio.run(bench_api(args.peticiones, args.concurrencia))
+        filas = sqlite3.connect(db).execute("SELECT COUNT(*) FROM students").fetchone()[0]
+
+    result = {
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "cpus": os.cpu_count(),
+        "filas": filas,
+        "peticiones": args.peticiones,
+        "concurrencia": args.concurrencia,
+        "generacion_s": None if generation is None else round(generation, 3),
+        "ingesta": ingesta,
+        "arranque": arranque,
+        "api": {"memoria_pico_mb": round(peak_rss_mb(), 1), "endpoints": endpoints},
+    }
+    salida = args.salida or PROJECT_ROOT / "benchmarks" / f"{commit or 'local'}_{filas}.json"
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    salida.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"✅ Resultados guardados en {salida}")
+
+    if args.comparar:
+        regressions = compare(result, json.loads(args.comparar.read_text(encoding="utf-8")))
+        if regressions:
+            print(f"\n⚠️  {regressions} métrica(s) empeoran más de un {TOLERANCE:.0%}.")
+            sys.exit(1)
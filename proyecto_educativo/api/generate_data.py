@@ -0,0 +1,192 @@
+# api/generate_data.py
+# Genera CSV sintéticos de estudiantes con el mismo formato que data/student_dataset1.csv
+import argparse
+import time
+from contextlib import contextmanager
+from importlib.util import find_spec
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+NOMBRES = ["Juan", "Valentina", "Fernando", "Paula", "Jorge", "Pedro", "Sofía", "José", "Ricardo", "Andrés",
+           "Carlos", "Ana", "Lucía", "María", "Luis", "Miguel", "Carmen", "Isabel", "Elena", "Laura"]
+APELLIDOS = ["Sánchez", "Morales", "Torres", "Ramos", "García", "Cruz", "González", "Pérez", "Flores",
+             "Ramírez", "Martínez", "Rivera", "Díaz", "Hernández", "Reyes", "Ortiz", "López", "Castillo",
+             "Jiménez", "Rodríguez"]
+GENEROS = ["Masculino", "Femenino", "Otro"]
+ETNIAS = ["Grupo 1", "Grupo 2", "Grupo 3", "Grupo 4"]
+NIVELES = ["Bajo", "Medio", "Alto"]
+GRUPOS = ["A", "B", "C", "D"]
+PROFESORES = ["Prof. Morales", "Prof. Torres", "Prof. Gómez", "Prof. Ruiz", "Prof. Pérez"]
+
+# Encabezado tal como viene en el CSV original (init_db.py normaliza los nombres)
+MATERIAS = ["Calificación_Matemáticas", "Calificación_Lectura", "Calificación_Ciencias",
+            "Calificación_Historia", "Calificación_Arte", "Calificación_Educación Física"]
+HEADER = (["ID_Estudiante", "Nombre", "Género", "Etnia", "Nivel_Socioeconómico", "Grupo", "Profesor"]
+          + MATERIAS + ["Promedio_General", "Asistencia_%", "En_Riesgo", "Nivel_Preparación"])
+# Historial mensual (init_db.py --historial); Grupo y Profesor se toman de la tabla de estudiantes
+HISTORY_HEADER = ["Periodo", "ID_Estudiante", "Asistencia_%"] + MATERIAS
+# Variación de la asistencia por mes del año (enero..diciembre): baja en invierno y a fin de curso
+SEASON = np.array([-1.5, -2.5, -1.0, 0.5, 1.0, 0.0, -3.0, -1.0, 1.5, 1.0, -0.5, -2.0])
+
+# El escritor CSV de pyarrow es varias veces más rápido que DataFrame.to_csv (dependencia opcional)
+_HAS_ARROW = find_spec("pyarrow") is not None
+
+
+def generate(n, start=1, rng=None, missing=0.0):
+    """Lote de ``n`` estudiantes con IDs desde ``start``.
+
+    Las distribuciones imitan las del dataset original: notas normales en torno
+    a 3.5 (escala 1-5), asistencia en torno al 90 % con un 11 % de asistencia
+    perfecta y En_Riesgo = promedio < 3 o asistencia < 70. Con ``missing`` se deja
+    vacía esa fracción de las notas y de la asistencia.
+    """
+    rng = rng or np.random.default_rng()
+    df = pd.DataFrame({
+        "ID_Estudiante": np.arange(start, start + n),
+        "Nombre": (pd.Series(np.array(NOMBRES, dtype=object)[rng.integers(0, len(NOMBRES), n)]) + " "
+                   + np.array(APELLIDOS, dtype=object)[rng.integers(0, len(APELLIDOS), n)]),
+        "Género": pd.Categorical.from_codes(rng.integers(0, 3, n), GENEROS),
+        "Etnia": pd.Categorical.from_codes(rng.integers(0, 4, n), ETNIAS),
+        "Nivel_Socioeconómico": pd.Categorical.from_codes(rng.choice(3, n, p=[0.3, 0.42, 0.28]), NIVELES),
+        "Grupo": pd.Categorical.from_codes(rng.integers(0, 4, n), GRUPOS),
+        "Profesor": pd.Categorical.from_codes(rng.integers(0, 5, n), PROFESORES),
+    })
+    notas = np.clip(rng.normal(3.5, 0.7, (n, len(MATERIAS))), 1.0, 5.0).round(2)
+    asistencia = np.minimum(rng.normal(90.0, 8.5, n), 100.0).clip(40.0).round(1)
+    if missing:
+        notas[rng.random(notas.shape) < missing] = np.nan
+        asistencia[rng.random(n) < missing] = np.nan
+    for i, materia in enumerate(MATERIAS):
+        df[materia] = notas[:, i]
+    with np.errstate(invalid="ignore"):
+        promedio = np.nanmean(notas, axis=1).round(2)
+    df["Promedio_General"] = promedio
+    df["Asistencia_%"] = asistencia
+    df["En_Riesgo"] = np.where((promedio < 3.0) | (asistencia < 70.0), "Sí", "No")
+    df["Nivel_Preparación"] = rng.choice(np.arange(1, 6), n, p=[0.07, 0.23, 0.4, 0.23, 0.07])
+    return df
+
+
+def generate_history(students, periods, rng=None):
+    """Historial mensual de ``students`` en los meses ``periods`` ('AAAA-MM', en orden).
+
+    Cada mes parte de la asistencia y las notas actuales del estudiante, con la
+    variación estacional de ``SEASON``, una deriva propia por estudiante y ruido.
+    """
+    rng = rng or np.random.default_rng()
+    n, m = len(students), len(periods)
+    season = SEASON[[int(p[5:7]) - 1 for p in periods]]
+    # Meses hasta el final del historial: el último mes coincide con el valor actual
+    elapsed = np.arange(m)[::-1]
+    asistencia = students["Asistencia_%"].to_numpy(float)[:, None] + season + rng.normal(0.0, 3.0, (n, m))
+    df = pd.DataFrame({
+        "Periodo": np.tile(np.asarray(periods, dtype=object), n),
+        "ID_Estudiante": np.repeat(students["ID_Estudiante"].to_numpy(), m),
+        "Asistencia_%": np.clip(asistencia, 40.0, 100.0).round(1).ravel(),
+    })
+    drift = rng.normal(0.0, 0.02, (n, 1))
+    for materia in MATERIAS:
+        notas = students[materia].to_numpy(float)[:, None] - drift * elapsed + rng.normal(0.0, 0.25, (n, m))
+        df[materia] = np.clip(notas, 1.0, 5.0).round(2).ravel()
+    return df
+
+
+def history_path(path):
+    return Path(path).with_name(f"{Path(path).stem}_historial.csv")
+
+
+def write(path, rows, seed=0, chunksize=500_000, missing=0.0, periods=()):
+    """Escribe ``rows`` estudiantes por lotes (memoria acotada por ``chunksize``).
+
+    Con ``periods`` escribe además su historial mensual junto al CSV (``history_path``).
+    """
+    rng = np.random.default_rng(seed)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f, _history_file(path, periods) as h:
+        f.write((",".join(HEADER) + "\n").encode("utf-8-sig"))
+        for start in range(0, rows, chunksize):
+            chunk = generate(min(chunksize, rows - start), start + 1, rng, missing)
+            _write_chunk(f, chunk[HEADER])
+            if h is not None:
+                _write_history(h, chunk, periods, rng, chunksize)
+    return path
+
+
+def write_history(path, students, periods, seed=0, chunksize=500_000):
+    """Historial mensual para los estudiantes de un CSV existente (p. ej. data/student_dataset1.csv)."""
+    rng = np.random.default_rng(seed)
+    with _history_file(path, periods) as h:
+        _write_history(h, students, periods, rng, chunksize)
+    return history_path(path)
+
+
+@contextmanager
+def _history_file(path, periods):
+    if not periods:
+        yield None
+        return
+    with open(history_path(path), "wb") as h:
+        h.write((",".join(HISTORY_HEADER) + "\n").encode("utf-8-sig"))
+        yield h
+
+
+def _write_history(h, students, periods, rng, chunksize):
+    # Lotes de estudiantes de forma que cada lote de historial tenga unas ``chunksize`` filas
+    step = max(chunksize // len(periods), 1)
+    for start in range(0, len(students), step):
+        _write_chunk(h, generate_history(students.iloc[start:start + step], periods, rng)[HISTORY_HEADER])
+
+
+def _write_chunk(f, chunk):
+    if not _HAS_ARROW:
+        chunk.to_csv(f, header=False, index=False, lineterminator="\n", encoding="utf-8")
+        return
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    table = pa.Table.from_pandas(chunk.astype({c: str for c in chunk.select_dtypes("category")}),
+                                 preserve_index=False)
+    # Ningún valor lleva comas ni comillas: se escribe sin entrecomillar, como el original
+    pa_csv.write_csv(table, f, pa_csv.WriteOptions(include_header=False, quoting_style="none"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera un CSV sintético de estudiantes.")
+    parser.add_argument("filas", type=int, nargs="?", help="Número de estudiantes (p. ej. 10000, 1000000, 10000000)")
+    parser.add_argument("--salida", type=Path, default=None,
+                        help="Ruta del CSV (por defecto data/students_<filas>.csv)")
+    parser.add_argument("--meses", type=int, default=0,
+                        help="Meses de historial a generar en <salida>_historial.csv (0 = ninguno)")
+    parser.add_argument("--hasta", default=None, help="Último mes del historial, AAAA-MM (por defecto el actual)")
+    parser.add_argument("--base", type=Path, default=None,
+                        help="Generar solo el historial de los estudiantes de este CSV")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--faltantes", type=float, default=0.0,
+                        help="Fracción de notas y asistencias vacías")
+    parser.add_argument("--chunksize", type=int, default=500_000, help="Filas por lote")
+    args = parser.parse_args()
+    if args.filas is None and args.base is None:
+        parser.error("indica el número de filas o --base")
+
+    hasta = pd.Period(args.hasta or pd.Timestamp.today(), freq="M")
+    periods = list(pd.period_range(end=hasta, periods=args.meses, freq="M").strftime("%Y-%m"))
+    start = time.perf_counter()
+    if args.base is not None:
+        if not periods:
+            parser.error("--base requiere --meses")
+        students = pd.read_csv(args.base, encoding="utf-8-sig", usecols=["ID_Estudiante", "Asistencia_%"] + MATERIAS)
+        salida = write_history(args.base, students, periods, args.semilla, args.chunksize)
+        print(f"✅ Historial de {len(students)} estudiantes ({len(periods)} meses) escrito en {salida} "
+              f"en {time.perf_counter() - start:.2f}s.")
+    else:
+        salida = args.salida or PROJECT_ROOT / "data" / f"students_{args.filas}.csv"
+        write(salida, args.filas, args.semilla, args.chunksize, args.faltantes, periods)
+        size = salida.stat().st_size / 1e6
+        print(f"✅ {args.filas} estudiantes escritos en {salida} ({size:.1f} MB) en {time.perf_counter() - start:.2f}s.")
+        if periods:
+            print(f"✅ Historial de {len(periods)} meses en {history_path(salida)}.")
@@ -1,40 +1,306 @@
-# api/create_db_from_clean.py
+# api/init_db.py
+# Carga el CSV de estudiantes (y el historial mensual) en SQLite con sus agregados e índices.
+#
+# data/students.db y el historial no se versionan; se generan desde api/ con:
+#   python generate_data.py --base ../data/student_dataset1.csv --meses 24 --hasta 2024-12
+#   python init_db.py --historial ../data/student_dataset1_historial.csv
+#
+# Un ID_Estudiante repetido en el CSV, en el mismo lote o en lotes distintos, se
+# guarda una sola vez con los valores de su última aparición, en los tres modos.
+# La base queda en modo WAL tras la carga: los lectores de la API no se bloquean
+# mientras se carga, y volver a DELETE exigiría que ninguna conexión estuviera abierta.
+import argparse
+import json
+import sys
+import time
 import pandas as pd
 from pathlib import Path
 import sqlite3
 
+from app import aggregates, columnar, history, risk, search, shards
+from app.db import DB_FILE, bump_data_version
+from app.schema import COLUMN_TYPES, KEY, SCORE_COLUMN, TRUE_VALUES, create_indexes_sql, create_table_sql, normalize_column
+
 # --- RUTAS ---
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 csv_path = PROJECT_ROOT / "data" / "student_dataset1.csv"
-db_path = PROJECT_ROOT / "data" / "students.db"
+db_path = DB_FILE
 table_name = "students"
 
-print(f"📁 Cargando CSV desde: {csv_path}")
+NA_VALUES = ["", " ", "NaN", "nan", "N/A"]
+TEXT_COLUMNS = [c for c, t in COLUMN_TYPES.items() if t == "TEXT"]
+NUMBER_COLUMNS = [c for c, t in COLUMN_TYPES.items() if t in ("REAL", "INTEGER")]
+
+
+def read_header(path):
+    """Detecta el separador y devuelve los nombres de columna normalizados."""
+    with open(path, "r", encoding="utf-8-sig") as f:
+        head = f.readline().rstrip("\r\n")
+    sep = ";" if ";" in head else ","
+    return sep, [normalize_column(c) for c in head.split(sep)]
+
+
+def read_chunks(path, chunksize, engine="c"):
+    """Lee el CSV por lotes con tipos explícitos (memoria acotada por ``chunksize``)."""
+    sep, names = read_header(path)
+    print(f"➡️  Separador detectado: '{sep}'")
+    missing = [c for c in COLUMN_TYPES if c not in names]
+    if missing:
+        raise ValueError(f"Faltan columnas en el CSV: {missing}")
+
+    dtype = {c: "float64" for c in NUMBER_COLUMNS}
+    dtype.update({c: "str" for c in TEXT_COLUMNS + ["En_Riesgo"]})
+    dtype[KEY] = "int64"
+    # Con ';' como separador las cifras suelen venir con coma decimal
+    decimal = "," if sep == ";" else "."
+
+    if engine == "pyarrow":
+        # Lector en streaming de pyarrow (dependencia opcional)
+        from pyarrow import csv as pa_csv
+
+        reader = pa_csv.open_csv(
+            path,
+            read_options=pa_csv.ReadOptions(column_names=names, skip_rows=1, block_size=16 << 20),
+            parse_options=pa_csv.ParseOptions(delimiter=sep),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=list(COLUMN_TYPES), null_values=NA_VALUES, strings_can_be_null=True,
+                decimal_point=decimal,
+            ),
+        )
+        for batch in reader:
+            yield batch.to_pandas().astype(dtype)
+        return
+
+    yield from pd.read_csv(
+        path, sep=sep, encoding="utf-8-sig", header=0, names=names, usecols=list(COLUMN_TYPES),
+        dtype=dtype, na_values=NA_VALUES, keep_default_na=False, decimal=decimal,
+        chunksize=chunksize, engine="c",
+    )
+
+
+def read_history_chunks(path, chunksize):
+    """Lee por lotes un CSV de historial: Periodo (AAAA-MM o fecha), ID_Estudiante y las columnas que traiga."""
+    sep, names = read_header(path)
+    missing = [c for c in (history.PERIOD, KEY) if c not in names]
+    if missing:
+        raise ValueError(f"Faltan columnas en el historial: {missing}")
+    dtype = {c: "float64" for c in history.COLUMNS}
+    dtype.update({c: "str" for c in [history.PERIOD] + history.DIMENSIONS})
+    dtype[KEY] = "int64"
+    usecols = [c for c in names if c in history.FIELDS]
+    yield from pd.read_csv(
+        path, sep=sep, encoding="utf-8-sig", header=0, names=names, usecols=usecols,
+        dtype={c: dtype[c] for c in usecols}, na_values=NA_VALUES, keep_default_na=False,
+        decimal="," if sep == ";" else ".", chunksize=chunksize, engine="c",
+    )
+
+
+def prepare(chunk, weights=None):
+    """Ordena las columnas según el esquema, convierte En_Riesgo a booleano y puntúa el riesgo."""
+    chunk = chunk[list(COLUMN_TYPES)]
+    riesgo = chunk["En_Riesgo"].str.strip().str.lower()
+    chunk = chunk.assign(En_Riesgo=riesgo.isin(TRUE_VALUES).astype(float).where(riesgo.notna()))
+    # Puntaje de riesgo del lote en una sola pasada vectorizada
+    chunk[SCORE_COLUMN] = risk.score(chunk[risk.FEATURES].to_numpy(float), weights)
+    return chunk
+
+
+LOADED_TABLE = "temp.loaded_ids"
+
+
+class DuplicateIdError(ValueError):
+    """IDs del CSV que ya estaban en la tabla en una carga en modo append."""
+
+
+def insert_sql():
+    """INSERT que sustituye la fila si el ID ya existe: en un ID repetido gana la última aparición."""
+    columns = list(COLUMN_TYPES) + [SCORE_COLUMN]
+    cols = ", ".join(f'"{c}"' for c in columns)
+    updates = ", ".join(f'"{c}" = excluded."{c}"' for c in columns if c != KEY)
+    return (f'INSERT INTO "{table_name}" ({cols}) VALUES ({", ".join("?" * len(columns))}) '
+            f'ON CONFLICT ("{KEY}") DO UPDATE SET {updates}')
+
+
+def existing_ids(conn, ids, table=None):
+    """Cuántos de ``ids`` están ya en ``table`` (por defecto, la de estudiantes)."""
+    table = table or f'"{table_name}"'
+    q = f'SELECT COUNT(*) FROM json_each(?) j JOIN {table} s ON s."{KEY}" = j.value'
+    return conn.execute(q, (json.dumps(ids),)).fetchone()[0]
+
+
+def mark_loaded(conn, ids):
+    """Anota los IDs ya cargados en esta ejecución (tabla temporal de la conexión)."""
+    conn.execute(f'INSERT OR IGNORE INTO {LOADED_TABLE} ("{KEY}") SELECT value FROM json_each(?)',
+                 (json.dumps(ids),))
+
+
+def load(conn, chunks, mode):
+    """Carga todos los lotes en una sola transacción.
+
+    Devuelve (filas leídas, filas previas actualizadas, filas repetidas en el CSV).
+    En modo append un ID que ya estaba en la tabla antes de la carga es un error
+    (``DuplicateIdError``, sin escribir nada); en upsert se actualiza.
+    """
+    total = replaced = repeated = 0
+    overwritten = False
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("BEGIN")
+    try:
+        if mode == "replace":
+            conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+            conn.execute(f'DROP TABLE IF EXISTS "{search.FTS_TABLE}"')
+        conn.execute(create_table_sql(table_name))
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {LOADED_TABLE} ("{KEY}" INTEGER PRIMARY KEY)')
+        conn.execute(f"DELETE FROM {LOADED_TABLE}")
+        # Con el índice de búsqueda ya creado, sus triggers lo mantienen fila a fila;
+        # si no, se construye de una vez al final (mucho más rápido en cargas masivas)
+        searchable = search.exists(conn)
+        # Los pesos guardados en la base (score_risk.py): las filas nuevas se puntúan
+        # como las existentes; en la primera carga se guardan los de entorno
+        weights, threshold = risk.load_config(conn)
+        risk.save_config(conn, weights, threshold)
+        # Tablas creadas antes de Puntaje_Riesgo: añadir la columna y puntuar lo existente
+        if risk.ensure_column(conn, table_name):
+            risk.rescore(conn, table_name, weights)
+        # Agregados materializados (conteo, suma, suma de cuadrados, min, max por dimensión)
+        incremental = mode == "replace" or aggregates.exists(conn)
+        aggregates.create_tables(conn, drop=mode == "replace")
+        q = insert_sql()
+        for chunk in chunks:
+            first, total = total + 1, total + len(chunk)
+            # Repetidos dentro del lote: se queda la última aparición
+            unique = chunk.drop_duplicates(KEY, keep="last")
+            repeated += len(chunk) - len(unique)
+            chunk = prepare(unique, weights)
+            ids = chunk[KEY].tolist()
+            # Repetidos de lotes anteriores de esta carga frente a filas previas a la carga
+            again = existing_ids(conn, ids, LOADED_TABLE)
+            before = existing_ids(conn, ids) - again
+            if before and mode == "append":
+                raise DuplicateIdError(f"el CSV trae ID_Estudiante que ya existen en '{table_name}' "
+                                       f"({before} entre las filas {first} "
+                                       f"y {total}); usa --mode upsert para actualizarlos")
+            replaced += before
+            repeated += again
+            # Una fila sustituida invalida la suma acumulada: se recalcula al final
+            overwritten = overwritten or bool(before or again)
+            mark_loaded(conn, ids)
+            conn.executemany(q, zip(*(chunk[c].tolist() for c in chunk.columns)))
+            if incremental and not overwritten:
+                aggregates.accumulate(conn, chunk)
+            print(f"   … {total} filas")
+        # Filas sustituidas (no se pueden restar mínimos/máximos) o agregados
+        # inexistentes sobre datos previos: recalcular desde la tabla
+        if overwritten or not incremental:
+            aggregates.rebuild_from_table(conn, table_name)
+        # Índices después de la carga masiva (más rápido que mantenerlos fila a fila)
+        for statement in create_indexes_sql(table_name):
+            conn.execute(statement)
+        if not searchable:
+            search.rebuild(conn)
+        conn.execute("ANALYZE")
+        # Invalida las cachés de la API (ETag y resultados guardados)
+        bump_data_version(conn)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return total, replaced, repeated
+
+
+def load_history(conn, chunks):
+    """Anexa el historial en una transacción y recalcula los agregados de los meses cargados.
+
+    Devuelve (filas leídas, filas insertadas, meses).
+    """
+    total = inserted = 0
+    months = set()
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("BEGIN")
+    try:
+        history.create_tables(conn)
+        for chunk in chunks:
+            n, chunk_months = history.append(conn, chunk)
+            inserted += n
+            months |= chunk_months
+            total += len(chunk)
+            print(f"   … {total} filas de historial")
+        history.refresh_rollups(conn, months)
+        bump_data_version(conn)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return total, inserted, sorted(months)
 
-# --- CARGA CSV ---
-if not csv_path.exists():
-    raise FileNotFoundError(f"No se encontró el archivo CSV en: {csv_path}")
 
-# Detecta separador automáticamente
-with open(csv_path, "r", encoding="utf-8") as f:
-    head = f.readline()
-sep = ";" if ";" in head else ","
-print(f"➡️  Separador detectado: '{sep}'")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carga el CSV de estudiantes en SQLite.")
+    parser.add_argument("csv", nargs="?", type=Path, default=csv_path)
+    parser.add_argument("--mode", choices=["replace", "append", "upsert"], default="replace",
+                        help="replace: recrea la tabla; append: anexa filas nuevas (falla si un ID ya existe); "
+                             "upsert: inserta o actualiza por ID_Estudiante")
+    parser.add_argument("--chunksize", type=int, default=200_000, help="Filas por lote")
+    parser.add_argument("--engine", choices=["c", "pyarrow"], default="c", help="Lector de CSV")
+    parser.add_argument("--historial", type=Path, default=None,
+                        help="CSV de historial mensual (Periodo, ID_Estudiante, asistencia y notas) a anexar")
+    parser.add_argument("--solo-historial", action="store_true",
+                        help="Anexar solo el historial, sin recargar la tabla de estudiantes")
+    parser.add_argument("--columnar", action="store_true",
+                        help="Escribir también la instantánea columnar (.npy) que usa la API para los filtros "
+                             "combinados; si ya existe una, se reescribe en cada carga")
+    parser.add_argument("--escuela", default=None,
+                        help=f"Cargar en la base de esta escuela y registrarla en {shards.CATALOG_FILE.name}")
+    args = parser.parse_args()
 
-# Cargar y limpiar básico
-df = pd.read_csv(csv_path, sep=sep, encoding="utf-8", engine="python")
-print(f"🔍 Filas: {len(df)}, Columnas: {len(df.columns)}")
+    for path in [args.historial] + ([] if args.solo_historial else [args.csv]):
+        if path is not None and not path.exists():
+            raise FileNotFoundError(f"No se encontró el archivo CSV en: {path}")
 
-# Limpieza de columnas con nombres vacíos o espacios
-df.columns = [c.strip().replace(" ", "_").replace("(", "").replace(")", "") for c in df.columns]
+    if args.escuela:
+        # Una base por escuela: la del catálogo o <escuela>.db junto a él
+        db_path = shards.register(args.escuela, shards.db_path(args.escuela))
+        print(f"🏫 Escuela '{args.escuela}' registrada en: {shards.CATALOG_FILE}")
 
-# Reemplazar strings vacíos o 'NaN' por valores nulos reales
-df = df.replace(["", " ", "NaN", "nan", "N/A"], pd.NA)
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        # --- CARGA CSV ---
+        if not args.solo_historial:
+            print(f"📁 Cargando CSV desde: {args.csv}")
+            try:
+                total, replaced, repeated = load(conn, read_chunks(args.csv, args.chunksize, args.engine),
+                                                 args.mode)
+            except DuplicateIdError as e:
+                print(f"❌ Carga cancelada, la base no se modificó: {e}")
+                sys.exit(1)
+            count = conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+            print(f"✅ Base de datos creada correctamente en: {db_path}")
+            print(f"✅ {total} filas procesadas ({replaced} actualizadas, {repeated} repetidas en el CSV) "
+                  f"en {time.perf_counter() - start:.2f}s.")
+            print(f"✅ Tabla '{table_name}' con {count} registros.")
+            print(f"✅ Agregados actualizados en '{aggregates.STATS_TABLE}', '{aggregates.CROSS_TABLE}' "
+                  f"y '{aggregates.SKETCH_TABLE}'.")
+            print(f"✅ Índice de búsqueda por nombre en '{search.FTS_TABLE}'.")
 
-# Guardar en SQLite
-conn = sqlite3.connect(db_path)
-df.to_sql(table_name, conn, if_exists="replace", index=False)
-conn.close()
+        # --- HISTORIAL ---
+        if args.historial:
+            print(f"📁 Anexando historial desde: {args.historial}")
+            total, inserted, months = load_history(conn, read_history_chunks(args.historial, args.chunksize))
+            print(f"✅ {inserted} de {total} filas de historial anexadas ({total - inserted} ya existían), "
+                  f"{len(months)} meses ({months[0] if months else '-'} a {months[-1] if months else '-'}).")
+            print(f"✅ Tendencias recalculadas en '{history.ROLLUP_TABLE}'.")
 
-print(f"✅ Base de datos creada correctamente en: {db_path}")
-print(f"✅ Tabla '{table_name}' con {len(df)} registros.")
+        # --- INSTANTÁNEA COLUMNAR ---
+        # Con la versión ya incrementada: la API solo usa una instantánea de su misma versión
+        if args.columnar or columnar.exists(db_path):
+            directory = columnar.write(conn, db_path)
+            print(f"✅ Instantánea columnar publicada en: {directory}")
+    finally:
+        conn.close()
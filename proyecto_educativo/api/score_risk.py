@@ -0,0 +1,80 @@
+# api/score_risk.py
+# Recalcula el puntaje de riesgo de todos los estudiantes (p. ej. tras cambiar los pesos)
+import argparse
+import json
+import sqlite3
+import time
+
+from app import aggregates, columnar, risk, shards
+from app.db import DB_FILE, bump_data_version
+from app.schema import TABLE, create_indexes_sql
+
+
+def run(conn, weights=None, threshold=None, db_path=DB_FILE):
+    """Puntúa toda la tabla en una transacción; devuelve el número de filas.
+
+    ``weights`` sustituye a los pesos guardados en la base y el resultado se
+    guarda con el puntaje (ver ``risk.load_config``); con ``threshold`` se
+    reescribe también En_Riesgo y se guarda ese umbral. Si la base tiene
+    instantánea columnar, se vuelve a publicar con la nueva versión: la API no
+    usa una instantánea de otra versión y volvería a SQL.
+    """
+    conn.execute("BEGIN")
+    try:
+        stored, stored_threshold = risk.load_config(conn)
+        weights = {**stored, **(weights or {})}
+        # Sin el índice del puntaje la reescritura es mucho más rápida; se recrea al final
+        conn.execute('DROP INDEX IF EXISTS "idx_students_puntaje"')
+        total = risk.rescore(conn, TABLE, weights, threshold=threshold)
+        risk.save_config(conn, weights, stored_threshold if threshold is None else threshold)
+        if threshold is not None:
+            # En_Riesgo es una dimensión de los agregados
+            aggregates.rebuild_from_table(conn, TABLE)
+        for statement in create_indexes_sql(TABLE):
+            conn.execute(statement)
+        bump_data_version(conn)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    # Tras el COMMIT, como init_db.py: nunca se publica una versión que no llegó a confirmarse
+    if columnar.exists(db_path):
+        columnar.write(conn, db_path)
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalcula Puntaje_Riesgo en la base de estudiantes.")
+    parser.add_argument("--pesos", type=json.loads, default=None,
+                        help='Pesos en JSON, p. ej. \'{"Asistencia_%%": 6}\'; los que no se indiquen '
+                             "siguen como estaban guardados en la base (o RISK_WEIGHTS)")
+    parser.add_argument("--actualizar-en-riesgo", action="store_true",
+                        help="Reescribe En_Riesgo como Puntaje_Riesgo >= --umbral")
+    parser.add_argument("--umbral", type=float, default=None,
+                        help="Umbral de riesgo (por defecto el guardado en la base o RISK_THRESHOLD)")
+    parser.add_argument("--escuela", default=None,
+                        help=f"Puntuar la base de esta escuela de {shards.CATALOG_FILE.name}")
+    args = parser.parse_args()
+
+    db_path = DB_FILE
+    if args.escuela:
+        catalog = shards.load_catalog()
+        if args.escuela not in catalog:
+            parser.error(f"Escuela desconocida: {args.escuela} (en el catálogo: {', '.join(catalog)})")
+        db_path = catalog[args.escuela]
+
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        umbral = args.umbral if args.umbral is not None else risk.load_config(conn)[1]
+        total = run(conn, args.pesos, umbral if args.actualizar_en_riesgo else None, db_path)
+        weights, umbral = risk.load_config(conn)
+    finally:
+        conn.close()
+
+    print(f"✅ {total} estudiantes puntuados en {time.perf_counter() - start:.2f}s ({db_path}).")
+    print(f"✅ Pesos guardados en la base: {json.dumps(weights, ensure_ascii=False)}")
+    if columnar.exists(db_path):
+        print(f"✅ Instantánea columnar publicada en: {columnar.root(db_path)}")
+    if args.actualizar_en_riesgo:
+        print(f"✅ En_Riesgo recalculado con umbral {umbral} y agregados reconstruidos.")
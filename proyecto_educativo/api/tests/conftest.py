@@ -0,0 +1,55 @@
+import sqlite3
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import generate_data
+import init_db
+from app import cache, main
+from app.shards import Shards
+
+ROWS = 400
+
+
+def load_csv(db, csv, mode="replace", chunksize=150):
+    """Carga ``csv`` en ``db`` con init_db.py; con lotes pequeños cada carga pasa por varios."""
+    conn = sqlite3.connect(db, isolation_level=None)
+    try:
+        return init_db.load(conn, init_db.read_chunks(csv, chunksize), mode)
+    finally:
+        conn.close()
+
+
+def write_csv(path, rows, start=1, seed=0):
+    """CSV sintético con el formato de data/student_dataset1.csv e IDs desde ``start``."""
+    chunk = generate_data.generate(rows, start, np.random.default_rng(seed))
+    chunk[generate_data.HEADER].to_csv(path, index=False, encoding="utf-8-sig")
+    return path
+
+
+@pytest.fixture(scope="session")
+def csv_file(tmp_path_factory):
+    return write_csv(tmp_path_factory.mktemp("datos") / "students.csv", ROWS)
+
+
+@pytest.fixture
+def db(tmp_path, csv_file):
+    path = tmp_path / "students.db"
+    load_csv(path, csv_file)
+    return path
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Cliente de la API sobre un catálogo ``{escuela: base}``, con la caché vacía."""
+    monkeypatch.setattr(main, "WARMUP", False)
+    # La versión de los datos se consulta en cada petición
+    monkeypatch.setattr(cache, "VERSION_CHECK", 0)
+
+    def client(catalog):
+        monkeypatch.setattr(main, "shards", Shards(catalog))
+        monkeypatch.setattr(main, "results", cache.ResultCache())
+        return TestClient(main.app)
+
+    return client
@@ -0,0 +1,27 @@
+import numpy as np
+
+from app import aggregates
+
+
+def test_histogram_valores_sobre_los_bordes():
+    # Un valor por borde de 10 intervalos entre 0 y 1: cada uno cuenta en el
+    # intervalo que empieza en él y el máximo en el último
+    values = np.round(np.arange(11) * 0.1, 1)
+    edges, counts = aggregates.histogram(values, np.ones(11), 0.0, 1.0, 10)
+    assert counts.tolist() == [1] * 9 + [2]
+    assert edges.tolist() == values.tolist()
+
+
+def test_histogram_coincide_con_sus_bordes():
+    # Con un ancho no exacto en binario el cociente truncado caía un intervalo por debajo
+    values = np.round(np.linspace(1.0, 5.0, 401), 2)
+    edges, counts = aggregates.histogram(values, np.ones(values.size), 1.0, 5.0, 30)
+    expected = [int(((values >= lo) & (values < hi)).sum()) for lo, hi in zip(edges[:-1], edges[1:])]
+    expected[-1] += int((values == edges[-1]).sum())
+    assert counts.tolist() == expected
+
+
+def test_histogram_un_solo_valor():
+    edges, counts = aggregates.histogram(np.array([3.0]), np.array([5.0]), 3.0, 3.0, 4)
+    assert counts.tolist() == [5, 0, 0, 0]
+    assert edges[0] == 3.0
@@ -0,0 +1,129 @@
+import csv
+import gzip
+import io
+import json
+import unicodedata
+import zipfile
+
+import pandas as pd
+import pytest
+
+from app.schema import KEY
+from conftest import ROWS, load_csv, write_csv
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_students_paginacion_por_clave(api, db):
+    with api({"principal": db}) as client:
+        ids, after = [], None
+        while True:
+            params = {"limit": 150, "fields": "Nombre", **({"after": after} if after is not None else {})}
+            page = ndjson(client.get("/students", params=params))
+            ids += [r[KEY] for r in page]
+            if len(page) < 150:
+                break
+            after = page[-1][KEY]
+        assert ids == list(range(1, ROWS + 1))
+        # Filtros: solo sus filas, también en orden de ID
+        page = ndjson(client.get("/students", params={"grupo": "A", "limit": 1000}))
+        assert {r["Grupo"] for r in page} == {"A"}
+        assert [r[KEY] for r in page] == sorted(r[KEY] for r in page)
+        assert client.get("/students", params={"grupo": "A", "count": "true"}).json()["data"]["total"] == len(page)
+        assert client.get("/students", params={"after": "x"}).status_code == 422
+        assert client.get("/students", params={"fields": "Nope"}).status_code == 400
+
+
+def test_at_risk_cursor(api, db):
+    with api({"principal": db}) as client:
+        params = {"promedio": 3.5, "asistencia": 90}
+        full = client.get("/at-risk", params={**params, "limit": 1000}).json()
+        assert full["next"] is None
+        rows, cursor = [], None
+        while True:
+            extra = {"cursor": cursor} if cursor else {}
+            page = client.get("/at-risk", params={**params, "limit": 40, **extra}).json()
+            rows += page["data"]
+            cursor = page["next"]
+            if cursor is None:
+                break
+        assert rows == full["data"]
+        assert client.get("/at-risk", params={"cursor": "no-es-un-cursor"}).status_code == 400
+
+
+def test_etag_y_304(api, db, csv_file):
+    with api({"principal": db}) as client:
+        first = client.get("/stats/kpis")
+        tag = first.headers["ETag"]
+        again = client.get("/stats/kpis", headers={"If-None-Match": tag})
+        assert again.status_code == 304
+        assert again.content == b""
+        # Una carga nueva cambia la versión: la misma etiqueta ya no vale
+        load_csv(db, csv_file, "upsert")
+        after = client.get("/stats/kpis", headers={"If-None-Match": tag})
+        assert after.status_code == 200
+        assert after.headers["ETag"] != tag
+        assert after.json()["data"]["total_estudiantes"] == first.json()["data"]["total_estudiantes"]
+
+
+def plain(text):
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+
+
+@pytest.mark.parametrize("q", ["jose", "JOSÉ", "José"])
+def test_busqueda_sin_tildes(api, db, csv_file, q):
+    names = pd.read_csv(csv_file, encoding="utf-8-sig", index_col=KEY)["Nombre"]
+    expected = [i for i, name in names.items() if any(w.startswith("jose") for w in plain(name).split())]
+    assert expected
+    with api({"principal": db}) as client:
+        found, after = [], None
+        while True:
+            extra = {"after": after} if after else {}
+            body = client.get("/students/search", params={"q": q, "limit": 7, **extra}).json()
+            found += [r[KEY] for r in body["data"]]
+            after = body["next"]
+            if after is None:
+                break
+    assert found == expected
+
+
+def test_escuelas_combinadas(api, db, csv_file, tmp_path):
+    sur_csv = write_csv(tmp_path / "sur.csv", 250, seed=5)
+    load_csv(tmp_path / "sur.db", sur_csv)
+    with api({"norte": db, "sur": tmp_path / "sur.db"}) as client:
+        total = client.get("/stats/kpis").json()["data"]
+        describe = client.get("/stats/describe", params={"column": "Asistencia_%"}).json()["data"]
+        count = client.get("/students", params={"count": "true", "grupo": "B"}).json()["data"]["total"]
+        by_school = [
+            client.get("/students", params={"count": "true", "grupo": "B", "escuela": e}).json()["data"]["total"]
+            for e in ("norte", "sur")
+        ]
+    values = pd.concat([pd.read_csv(f, encoding="utf-8-sig")["Asistencia_%"] for f in (csv_file, sur_csv)])
+    assert total["total_estudiantes"] == ROWS + 250
+    assert count == sum(by_school) > 0
+    assert describe["n"] == values.count()
+    assert describe["media"] == pytest.approx(values.mean())
+    assert (describe["minimo"], describe["maximo"]) == (values.min(), values.max())
+
+
+def test_export_formatos(api, db):
+    with api({"principal": db}) as client:
+        response = client.get("/export", params={"formato": "csv", "grupo": "C"}, headers={"Accept-Encoding": "gzip"})
+        # Ya va comprimido: sin Content-Encoding
+        assert "content-encoding" not in response.headers
+        rows = list(csv.reader(io.StringIO(gzip.decompress(response.content).decode())))
+        assert rows[0][0] == KEY
+        assert {r[rows[0].index("Grupo")] for r in rows[1:]} == {"C"}
+        expected = len(rows) - 1
+
+        book = zipfile.ZipFile(io.BytesIO(client.get("/export", params={"formato": "xlsx", "grupo": "C"}).content))
+        sheet = book.read("xl/worksheets/sheet1.xml").decode()
+        assert sheet.count("<row>") == expected + 1
+        assert '<c t="b">' in sheet
+
+        pq = pytest.importorskip("pyarrow.parquet")
+        table = pq.read_table(io.BytesIO(client.get("/export", params={"formato": "parquet", "grupo": "C"}).content))
+        assert table.num_rows == expected
+        assert str(table.schema.field("En_Riesgo").type) == "bool"
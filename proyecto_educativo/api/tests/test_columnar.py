@@ -0,0 +1,29 @@
+import sqlite3
+from contextlib import closing
+
+import score_risk
+from app import columnar
+from app.db import read_connection
+
+SQL_COUNT = 'SELECT COUNT(*) FROM students WHERE "Grupo" = ? AND "Promedio_General" < ? AND "Asistencia_%" < ?'
+
+
+def test_instantanea_solo_con_su_version(db):
+    conn = sqlite3.connect(db, isolation_level=None)
+    columnar.write(conn, db)
+    with closing(read_connection(db)) as reader:
+        snapshot = columnar.current(reader)
+        assert snapshot is not None
+        thresholds = {"Promedio_General": 3.5, "Asistencia_%": 90.0}
+        expected = conn.execute(SQL_COUNT, ("B", 3.5, 90.0)).fetchone()[0]
+        assert snapshot.count_below(thresholds, {"Grupo": "B"}) == expected > 0
+
+        # Otra versión de los datos sin instantánea publicada: se vuelve a SQL
+        conn.execute("PRAGMA user_version = 99")
+        assert columnar.current(reader) is None
+        # score_risk.py la vuelve a publicar con la versión nueva
+        score_risk.run(conn, {"Asistencia_%": 6.0}, db_path=db)
+        snapshot = columnar.current(reader)
+        assert snapshot is not None
+        assert snapshot.version == reader.execute("PRAGMA user_version").fetchone()[0]
+    conn.close()
@@ -0,0 +1,79 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+import init_db
+import score_risk
+from app import aggregates, risk
+from app.schema import KEY, SCORE_COLUMN
+from conftest import ROWS, load_csv, write_csv
+
+
+def aggregate_tables(conn):
+    """Contenido de las tablas de agregados (sumas redondeadas: el orden de suma cambia)."""
+    tables = {}
+    for table in (aggregates.STATS_TABLE, aggregates.CROSS_TABLE, aggregates.SKETCH_TABLE):
+        rows = conn.execute(f'SELECT * FROM "{table}"').fetchall()
+        tables[table] = sorted(tuple(round(v, 6) if isinstance(v, float) else v for v in r) for r in rows)
+    return tables
+
+
+def recomputed(conn):
+    aggregates.create_tables(conn, drop=True)
+    aggregates.rebuild_from_table(conn, init_db.table_name)
+    return aggregate_tables(conn)
+
+
+@pytest.mark.parametrize("mode", ["append", "upsert"])
+def test_agregados_coinciden_con_recalculo(db, tmp_path, mode):
+    # append: IDs nuevos (se acumula); upsert: los mismos IDs con otros valores (se recalcula)
+    start = ROWS + 1 if mode == "append" else 1
+    total, replaced, _ = load_csv(db, write_csv(tmp_path / "nuevos.csv", 150, start, seed=1), mode)
+    assert (total, replaced) == (150, 0 if mode == "append" else 150)
+    conn = sqlite3.connect(db)
+    assert aggregate_tables(conn) == recomputed(conn)
+
+
+def test_id_repetido_gana_la_ultima_aparicion(tmp_path):
+    csv = write_csv(tmp_path / "repetidos.csv", 200, seed=2)
+    header, *rows = csv.read_text(encoding="utf-8-sig").splitlines()
+
+    def copy(student_id, name):
+        fields = rows[student_id - 1].split(",")
+        return ",".join(fields[:1] + [name] + fields[2:])
+
+    # Con lotes de 150: el ID 5 se repite en su mismo lote y el ID 7 en el siguiente
+    rows = rows[:10] + [copy(5, "Copia Cinco")] + rows[10:] + [copy(7, "Copia Siete")]
+    csv.write_text("\n".join([header] + rows) + "\n", encoding="utf-8")
+    db = tmp_path / "students.db"
+    assert load_csv(db, csv, chunksize=150) == (202, 0, 2)
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT COUNT(*) FROM students").fetchone()[0] == 200
+    names = dict(conn.execute(f'SELECT "{KEY}", Nombre FROM students WHERE "{KEY}" IN (5, 7)'))
+    assert names == {5: "Copia Cinco", 7: "Copia Siete"}
+    assert aggregate_tables(conn) == recomputed(conn)
+
+
+def test_append_rechaza_ids_existentes(db, tmp_path):
+    version = sqlite3.connect(db).execute("PRAGMA user_version").fetchone()[0]
+    with pytest.raises(init_db.DuplicateIdError):
+        load_csv(db, write_csv(tmp_path / "solapados.csv", 50, ROWS - 10), "append")
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT COUNT(*) FROM students").fetchone()[0] == ROWS
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == version
+
+
+def test_pesos_guardados_puntuan_las_altas(db, tmp_path):
+    conn = sqlite3.connect(db, isolation_level=None)
+    score_risk.run(conn, {"Asistencia_%": 8.0}, db_path=db)
+    weights, _ = risk.load_config(conn)
+    assert weights["Asistencia_%"] == 8.0
+    conn.close()
+
+    load_csv(db, write_csv(tmp_path / "altas.csv", 100, ROWS + 1, seed=3), "append")
+    conn = sqlite3.connect(db)
+    columns = ", ".join(f'"{c}"' for c in risk.FEATURES + [SCORE_COLUMN])
+    rows = np.array(conn.execute(f"SELECT {columns} FROM students", ()).fetchall(), dtype=float)
+    # Antiguas y nuevas, todas con los pesos guardados
+    assert np.allclose(rows[:, -1], risk.score(rows[:, :-1], weights))
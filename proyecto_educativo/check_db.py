@@ -1,25 +1,133 @@
-import sqlite3, os
+import sqlite3, os, sys
+from pathlib import Path
 
 path = "data/students.db"
 print("Ruta absoluta:", os.path.abspath(path))
 print("Existe:", os.path.exists(path))
 
 if not os.path.exists(path):
-    print("El archivo students.db NO existe en data/. Termina el script.")
-else:
-    try:
-        conn = sqlite3.connect(path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
-        print("Tablas encontradas:", tables)
-        # Mostrar hasta 3 filas de ejemplo de la primera tabla si existe
-        if tables:
-            tbl = tables[0][0]
-            print(f"\nPrimeras 3 filas de la tabla '{tbl}':")
-            cursor.execute(f"SELECT * FROM \"{tbl}\" LIMIT 3;")
-            for row in cursor.fetchall():
-                print(row)
-        conn.close()
-    except Exception as e:
-        print("Error al abrir la DB:", e)
+    print("El archivo students.db NO existe en data/ (se genera con: cd api && python init_db.py). "
+          "Termina el script.")
+    sys.exit(1)
+
+try:
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    tables = cursor.fetchall()
+    print("Tablas encontradas:", tables)
+    # Mostrar hasta 3 filas de ejemplo de la primera tabla si existe
+    if tables:
+        tbl = tables[0][0]
+        print(f"\nPrimeras 3 filas de la tabla '{tbl}':")
+        cursor.execute(f"SELECT * FROM \"{tbl}\" LIMIT 3;")
+        for row in cursor.fetchall():
+            print(row)
+except Exception as e:
+    print("Error al abrir la DB:", e)
+    sys.exit(1)
+
+# --- PLAN DE CONSULTAS DE LA API ---
+# Se ejecutan las funciones de app/crud.py capturando el SQL real que envían a
+# SQLite y se revisa su EXPLAIN QUERY PLAN: ninguna consulta puede recorrer una
+# tabla completa (SCAN) salvo los agregados que por definición leen toda la
+# población ("completo"), que solo se informan.
+sys.path.insert(0, str(Path(__file__).resolve().parent / "api"))
+from sqlalchemy import event  # noqa: E402
+from app import crud  # noqa: E402
+from app.db import get_engine, read_connection  # noqa: E402
+
+captured = []
+engine = get_engine()
+
+@event.listens_for(engine, "connect")
+def _trace(dbapi_conn, _):
+    dbapi_conn.set_trace_callback(captured.append)
+
+# Conexión de solo lectura como las del pool de la API
+ro = read_connection()
+ro.set_trace_callback(captured.append)
+
+def raw(sql):
+    with engine.connect() as c:
+        c.exec_driver_sql(sql).fetchall()
+
+PROF = cursor.execute('SELECT "Profesor" FROM students LIMIT 1').fetchone()[0]
+GRUPO = cursor.execute('SELECT "Grupo" FROM students LIMIT 1').fetchone()[0]
+MAT = "Calificación_Matemáticas"
+
+# (descripción, llamada, completo)
+CATALOGO = [
+    ("Búsqueda por ID", lambda: raw('SELECT * FROM students WHERE "ID_Estudiante" = 42'), False),
+    ("Filtro por profesor", lambda: raw(f"SELECT * FROM students WHERE \"Profesor\" = '{PROF}'"), False),
+    ("Filtro por grupo", lambda: raw(f"SELECT * FROM students WHERE \"Grupo\" = '{GRUPO}'"), False),
+    ("/students paginado", lambda: ro.execute(*crud.students_query(after=500, limit=10)[1:]).fetchall(), False),
+    ("/students?profesor&grupo paginado",
+     lambda: ro.execute(*crud.students_query(500, 10, filters={"profesor": PROF, "grupo": GRUPO})[1:]).fetchall(),
+     False),
+    ("/students?grupo paginado", lambda: ro.execute(*crud.students_query(500, 10, filters={"grupo": GRUPO})[1:]).fetchall(),
+     False),
+    ("/students?count&profesor", lambda: crud.count_students(ro, {"profesor": PROF}), False),
+    ("/export?riesgo&profesor",
+     lambda: ro.execute(*crud.export_query({"profesor": PROF}, 3.0, 75.0)[1:]).fetchmany(10), False),
+    ("/export?q=nombre", lambda: ro.execute(*crud.export_query(q="mar gon")[1:]).fetchmany(10), False),
+    ("/students/search?q=nombre", lambda: crud.search_students(ro, "mar gon"), False),
+    ("/students/search?q=id", lambda: crud.search_students(ro, "42"), False),
+    ("/students/search?q&profesor", lambda: crud.search_students(ro, "mar", filters={"profesor": PROF}), False),
+    ("/at-risk", lambda: crud.get_at_risk(ro, 3.0, 75.0, cursor="2.5:70.0:1"), False),
+    ("/at-risk?count", lambda: crud.count_at_risk(ro, 3.0, 75.0), False),
+    ("/at-risk?profesor", lambda: crud.get_at_risk(ro, 3.0, 75.0, {"profesor": PROF}), False),
+    ("/risk/score/{id}", lambda: crud.get_risk_score(ro, 42), False),
+    ("/risk/ranking", lambda: crud.get_risk_ranking(ro, 100, 0.4), False),
+    ("/stats/kpis", lambda: crud.get_kpis(ro), False),
+    ("/stats/distribution", lambda: crud.get_distribution(ro, "Profesor"), False),
+    ("/stats/subjects", lambda: crud.get_subjects_averages(ro), False),
+    ("/stats/scatter", lambda: crud.get_scatter(ro, budget=200), True),
+    ("/stats/scatter?profesor", lambda: crud.get_scatter(ro, filters={"profesor": PROF}, budget=100), False),
+    ("/stats/correlation", lambda: crud.get_correlation(ro), False),
+    ("/stats/correlation?profesor&grupo",
+     lambda: crud.get_correlation(ro, None, {"profesor": PROF, "grupo": GRUPO}), False),
+    ("/stats/regression?by", lambda: crud.get_regression(ro, MAT, by="Grupo"), False),
+    ("/stats/regression?by&profesor",
+     lambda: crud.get_regression(ro, MAT, by="Grupo", filters={"profesor": PROF}), False),
+    ("/stats/breakdown", lambda: crud.get_breakdown(ro, "Género", MAT), True),
+    ("/stats/breakdown?profesor", lambda: crud.get_breakdown(ro, "Género", MAT, {"profesor": PROF}), False),
+    ("/stats/histogram", lambda: crud.get_histogram(ro, MAT), True),
+    ("/stats/histogram?grupo", lambda: crud.get_histogram(ro, MAT, 20, {"grupo": GRUPO}), False),
+    ("/stats/describe", lambda: crud.get_describe(ro, MAT), True),
+    ("/stats/quantiles?by", lambda: crud.get_quantiles(ro, MAT, "Género", bins=30), False),
+    ("/stats/quantiles?profesor&grupo",
+     lambda: crud.get_quantiles(ro, MAT, None, {"profesor": PROF, "grupo": GRUPO}), False),
+    ("/stats/describe?profesor&grupo",
+     lambda: crud.get_describe(ro, MAT, {"profesor": PROF, "grupo": GRUPO}), False),
+    ("/trends", lambda: crud.get_trends(ro), False),
+    ("/trends?escala&by", lambda: crud.get_trends(ro, MAT, "trimestral", by="Grupo"), False),
+    ("/trends?profesor&desde", lambda: crud.get_trends(ro, desde="2024-01", filters={"profesor": PROF}), False),
+    ("/trends?profesor&grupo&desde&hasta",
+     lambda: crud.get_trends(ro, MAT, "anual", "2024-01", "2024-12", filters={"profesor": PROF, "grupo": GRUPO}), False),
+]
+
+real_tables = {t[0] for t in tables}
+failures = 0
+print("\n🔎 Plan de consultas de la API:")
+for name, call, full in CATALOGO:
+    captured.clear()
+    call()
+    for sql in captured:
+        if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+            continue
+        plan = [row[3] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        # Una tabla virtual (FTS5) con restricciones (INDEX distinto de 0) usa su propio índice
+        scans = [p for p in plan if p.startswith("SCAN ") and p.split()[1] in real_tables
+                 and not ("VIRTUAL TABLE INDEX" in p and "INDEX 0:" not in p)]
+        bad = [p for p in scans if not (full and p.split()[1] == "students")]
+        status = "❌" if bad else ("⚠️ " if scans else "✅")
+        failures += bool(bad)
+        print(f"{status} {name}: {' | '.join(plan)}")
+
+ro.close()
+conn.close()
+if failures:
+    print(f"\n❌ {failures} consulta(s) recorren una tabla completa.")
+    sys.exit(1)
+print("\n✅ Todas las consultas selectivas usan índices.")
@@ -2,14 +2,19 @@
 import streamlit as st
 import requests
 import pandas as pd
-import numpy as np
-import re
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from urllib.parse import urlencode
+from urllib3.util.retry import Retry
 from io import StringIO
 from pathlib import Path
 
+import charts
+from charts import add_trendlines
+
 st.set_page_config(page_title="Dashboard Escolar", layout="wide")
 
 # ----- CARGAR ESTILOS PERSONALIZADOS -----
@@ -30,19 +35,23 @@ try:
 except Exception:
     import os
     API_BASE = os.environ.get("API_BASE", "http://127.0.0.1:8000")
+# URL de la API vista desde el navegador, para las descargas directas de /export
+try:
+    API_PUBLIC = st.secrets["API_PUBLIC"]
+except Exception:
+    import os
+    API_PUBLIC = os.environ.get("API_PUBLIC", API_BASE)
 
 
 # --- ENCABEZADO PRINCIPAL ---
-from PIL import Image
-
 # Carga tu logo (ajusta la ruta a tu archivo, por ejemplo en /frontend/static/logo.png)
 logo_path = "frontend/static/logo2.png"  # cambia la ruta si tu logo está en otra carpeta
 
-try:
-    logo = Image.open(logo_path)
+# st.image recibe la ruta directamente: no hace falta cargar PIL al arrancar
+if Path(logo_path).is_file():
     col1, col2 = st.columns([1, 6])
     with col1:
-        st.image(logo, width=150)
+        st.image(logo_path, width=150)
     with col2:
         st.markdown(
             """
@@ -51,7 +60,7 @@ try:
             """,
             unsafe_allow_html=True
         )
-except FileNotFoundError:
+else:
     st.markdown(
         """
         <h1 style='font-size:36px; color:#2ecc71; margin-bottom:-10px;'>Portal Escolar</h1>
@@ -69,23 +78,183 @@ TAB_TITLES = [
     "Analisis de Grupo y Cursos"
 ]
 
-tabs = st.tabs(TAB_TITLES)
-
+# Solo se ejecuta la vista elegida: con st.tabs se calcularían las seis en cada interacción
+vista = st.radio("Vista", TAB_TITLES, horizontal=True, label_visibility="collapsed", key="vista")
 # ----- HELPERS -----
+ARROW = "application/vnd.apache.arrow.stream"
+
+# (conexión, lectura) en segundos
+TIMEOUT = (3.05, 10)
+RETRIES = 2
+MAX_PARALLEL = 8
+STALE_ENTRIES = 256
+
+@st.cache_resource
+def http_session():
+    """Sesión HTTP compartida por todas las sesiones del dashboard.
+
+    Mantiene las conexiones abiertas con la API (keep-alive) en lugar de abrir
+    una por petición, acepta respuestas comprimidas y reintenta con espera
+    exponencial los GET que fallan al conectar o con 502/503/504. Una lectura
+    que supera el timeout no se reintenta: se muestran los datos anteriores.
+    """
+    session = requests.Session()
+    retry = Retry(total=RETRIES, read=0, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                  allowed_methods=("GET",), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_PARALLEL * 2, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def api_get(path, params=None, **kwargs):
+    r = http_session().get(f"{API_BASE}{path}", params=params, timeout=TIMEOUT, **kwargs)
+    r.raise_for_status()
+    return r
+
 def fetch(path, params=None):
-    """Obtiene datos desde la API."""
+    """Obtiene datos desde la API (lanza la excepción si falla)."""
+    return api_get(path, params).json().get("data")
+
+@st.cache_data(ttl=15, show_spinner=False)
+def data_version():
+    """Versión de los datos en la API (/health); cambia con cada carga de init_db.py."""
     try:
-        r = requests.get(f"{API_BASE}{path}", params=params, timeout=12)
-        r.raise_for_status()
-        return r.json().get("data")
-    except Exception as e:
-        st.error(f"Error conectando API: {e}")
+        return api_get("/health").json().get("version")
+    except Exception:
         return None
 
-@st.cache_data(ttl=300)
-def load_preview(limit=1001):
-    data = fetch("/preview", params={"limit": limit})
-    return pd.DataFrame(data) if data else pd.DataFrame()
+@st.cache_resource
+def last_good():
+    """Últimas respuestas correctas por llamada, para mostrarlas si la API falla o tarda demasiado."""
+    return OrderedDict(), threading.Lock()
+
+# Llamadas servidas con datos antiguos en esta ejecución de la sesión (se avisa una sola vez)
+st.session_state["stale_served"] = []
+
+def settle(key, call, default=None):
+    """Resultado de ``call()``; si falla, la última respuesta correcta de esa llamada o ``default``."""
+    stale, lock = last_good()
+    try:
+        result = call()
+    except Exception as e:
+        with lock:
+            result = stale.get(key, default)
+        if key in stale:
+            served = st.session_state.setdefault("stale_served", [])
+            if not served:
+                st.warning(f"La API no respondió a tiempo ({e.__class__.__name__}); "
+                           "se muestran los últimos datos obtenidos.")
+            served.append(key)
+        else:
+            st.error(f"Error conectando API: {e}")
+        return result
+    with lock:
+        stale[key] = result
+        stale.move_to_end(key)
+        while len(stale) > STALE_ENTRIES:
+            stale.popitem(last=False)
+    return result
+
+def api_call(fn, *args, default=None, **kwargs):
+    """Llama a una función cacheada pasándole la versión de los datos como primer argumento.
+
+    Las cachés quedan indexadas por versión, así que una recarga de datos las
+    invalida sin esperar a un TTL. Los errores no se cachean.
+    """
+    key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+    return settle(key, lambda: fn(data_version(), *args, **kwargs), default)
+
+def load_stats(path, **params):
+    """Agregados calculados por la API (unos pocos KB, sin importar el tamaño de la tabla)."""
+    return api_call(_stats, path, **{k: v for k, v in {"escuela": ESCUELA, **params}.items() if v is not None})
+
+def load_stats_many(*calls):
+    """Varias llamadas ``(path, params)`` a load_stats en paralelo, en el mismo orden.
+
+    Las vistas piden de una vez los agregados independientes que necesitan: la
+    carga tarda lo que la petición más lenta y no la suma de todas.
+    """
+    calls = [
+        (path, {k: v for k, v in {"escuela": ESCUELA, **params}.items() if v is not None}) for path, params in calls
+    ]
+    version = data_version()
+    ctx = get_script_run_ctx()
+    init = lambda: add_script_run_ctx(threading.current_thread(), ctx)
+    with ThreadPoolExecutor(max_workers=min(len(calls), MAX_PARALLEL), initializer=init) as pool:
+        futures = [pool.submit(_stats, version, path, **params) for path, params in calls]
+    return [
+        settle((_stats.__name__, (path,), tuple(sorted(params.items()))), future.result)
+        for (path, params), future in zip(calls, futures)
+    ]
+
+@st.cache_data(ttl=3600, max_entries=500, show_spinner=False)
+def _stats(version, path, **params):
+    return fetch(path, params=params)
+
+STUDENTS_PAGE = 200
+
+def load_students(after=None, **filtros):
+    """Una página de /students con los filtros de la vista y el cursor de la siguiente (o None).
+
+    La API filtra y pagina por clave: el dashboard nunca descarga ni guarda la
+    tabla completa, solo páginas de ``STUDENTS_PAGE`` filas.
+    """
+    return api_call(_students, after, default=(pd.DataFrame(), None), escuela=ESCUELA, **filtros)
+
+@st.cache_data(ttl=600, max_entries=200, show_spinner=False)
+def _students(version, after=None, **filtros):
+    """Se pide en Arrow IPC: las columnas llegan tipadas y se cargan en pandas sin
+    volver a interpretar texto. Si la API no lo ofrece, responde en NDJSON.
+    """
+    params = {"after": after, "limit": STUDENTS_PAGE, **{k: v for k, v in filtros.items() if v is not None}}
+    r = api_get("/students", params, headers={"Accept": ARROW})
+    if r.headers.get("content-type", "").startswith(ARROW):
+        import pyarrow as pa
+        df = pa.ipc.open_stream(r.content).read_pandas()
+    elif r.text:
+        df = pd.read_json(StringIO(r.text), lines=True, convert_dates=False)
+    else:
+        df = pd.DataFrame()
+    siguiente = int(df[C_ID].iloc[-1]) if len(df) == STUDENTS_PAGE else None
+    return riesgo_label(df), siguiente
+
+SEARCH_LIMIT = 100
+
+def search_students(q, **filtros):
+    """Busca en la API (/students/search) por inicio de palabras del nombre o por ID exacto.
+
+    Devuelve la primera página de resultados y si hay más.
+    """
+    return api_call(_search, q, default=(pd.DataFrame(), False), escuela=ESCUELA, **filtros)
+
+@st.cache_data(ttl=600, max_entries=200, show_spinner=False)
+def _search(version, q, **filtros):
+    params = {"q": q, "limit": SEARCH_LIMIT, **{k: v for k, v in filtros.items() if v is not None}}
+    body = api_get("/students/search", params).json()
+    return riesgo_label(pd.DataFrame(body["data"])), body["next"] is not None
+
+EXPORT_FORMATS = {"CSV (gzip)": "csv", "Excel (XLSX)": "xlsx", "Parquet": "parquet"}
+
+def export_button(label, key, **filtros):
+    """Enlace de descarga a /export con los filtros de la vista.
+
+    El navegador descarga directamente de la API, que genera el archivo por
+    lotes con todas las filas: el dashboard no lo construye ni lo guarda en memoria.
+    """
+    c1, c2 = st.columns([1, 3])
+    formato = c1.selectbox("Formato", list(EXPORT_FORMATS), key=key, label_visibility="collapsed")
+    params = {"formato": EXPORT_FORMATS[formato], "escuela": ESCUELA, **filtros}
+    c2.link_button(label, f"{API_PUBLIC}/export?" + urlencode({k: v for k, v in params.items() if v is not None}))
+
+def riesgo_label(df):
+    """En_Riesgo se guarda como booleano (0/1); se muestra como Sí/No."""
+    if "En_Riesgo" in df.columns:
+        df["En_Riesgo"] = df["En_Riesgo"].map({1: "Sí", 0: "No"})
+    return df
+
+def chart(kind, *args, **kwargs):
+    """Figura de charts.py desde su caché en disco (clave: tipo, versión de los datos y parámetros)."""
+    return charts.render(kind, data_version(), *args, **kwargs)
 
 # ----- Columnas -----
 C_ID = "ID_Estudiante"
@@ -100,33 +269,42 @@ C_LECT = "Calificación_Lectura"
 C_CIEN = "Calificación_Ciencias"
 C_HIST = "Calificación_Historia"
 C_ARTE = "Calificación_Arte"
-C_EDF = "Calificación_Educación Física"
+C_EDF = "Calificación_Educación_Física"
 C_PROM = "Promedio_General"
 C_ASIS = "Asistencia_%"
 C_RIESGO = "En_Riesgo"
 C_PREP = "Nivel_Preparación"
 
-num_cols = [C_MAT, C_LECT, C_CIEN, C_HIST, C_ARTE, C_EDF, C_PROM, C_ASIS, C_PREP]
+MATERIAS = [C_MAT, C_LECT, C_CIEN, C_HIST, C_ARTE, C_EDF]
+RISK_PAGE = 1000
 
-def try_numeric_column(df, col):
-    if col in df.columns:
-        ser = df[col].astype(str).replace({"": None, "nan": None, "NaN": None}).str.strip()
-        ser = ser.str.replace("%", "", regex=False).str.replace(",", ".", regex=False)
-        df[col] = pd.to_numeric(ser, errors="coerce")
-    return df
+# ----- Escuela -----
+TODAS = "Todas"
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_schools():
+    """Escuelas del catálogo de la API (/schools); una sola si la API trabaja con una única base."""
+    try:
+        return [s["escuela"] for s in fetch("/schools") or []]
+    except Exception:
+        return []
+
+escuelas = load_schools()
+# Con varias escuelas, "Todas" combina los agregados de todas en la API; las filas de estudiantes son por escuela
+escuela_sel = st.sidebar.selectbox("Escuela", [TODAS] + escuelas) if len(escuelas) > 1 else TODAS
+ESCUELA = None if escuela_sel == TODAS else escuela_sel
+filas_por_escuela = ESCUELA is not None or len(escuelas) <= 1
+SOLO_POR_ESCUELA = "La lista de estudiantes es por escuela: elige una en la barra lateral."
 
 # ----- Cargar datos -----
-df = load_preview(limit=1000)
-if not df.empty:
-    for c in num_cols:
-        df = try_numeric_column(df, c)
+kpis = load_stats("/stats/kpis")
 
 # ----- VISTAS -----
-with tabs[0]:
+if vista == TAB_TITLES[0]:
     st.title("📊 Resumen Ejecutivo")
 
-    if df.empty:
-        st.info("No se han cargado datos. Verifica que la API (/preview) esté disponible.")
+    if not kpis or not kpis["total_estudiantes"]:
+        st.info("No se han cargado datos. Verifica que la API (/stats/kpis) esté disponible.")
     else:
         st.markdown("""
         Este panel muestra una visión general del desempeño académico y la asistencia de los estudiantes,
@@ -134,115 +312,94 @@ with tabs[0]:
         """)
 
         # --- KPI principales ---
-        n_estudiantes = len(df)
-        tasa_asistencia = df["Asistencia_%"].mean() if "Asistencia_%" in df.columns else np.nan
-        promedio_general = df["Promedio_General"].mean() if "Promedio_General" in df.columns else np.nan
+        n_estudiantes = kpis["total_estudiantes"]
+        tasa_asistencia = kpis["asistencia_promedio"]
+        promedio_general = kpis["promedio_general"]
+        # Agregados de la vista, pedidos en paralelo
+        socio, bins = load_stats_many(
+            ("/stats/distribution", {"column": C_NSE}),
+            ("/stats/histogram", {"column": C_PROM, "bins": 20}),
+        )
 
         # --- KPI visuales ---
         k1, k2, k3 = st.columns(3)
         k1.metric(" Total de Estudiantes", n_estudiantes)
-        k2.metric(" Tasa Promedio de Asistencia", f"{tasa_asistencia:.2f}%" if not np.isnan(tasa_asistencia) else "N/A")
-        k3.metric(" Calificación Promedio General", f"{promedio_general:.2f}" if not np.isnan(promedio_general) else "N/A")
+        k2.metric(" Tasa Promedio de Asistencia", f"{tasa_asistencia:.2f}%" if tasa_asistencia is not None else "N/A")
+        k3.metric(" Calificación Promedio General", f"{promedio_general:.2f}" if promedio_general is not None else "N/A")
 
         # --- Distribución del nivel socioeconómico ---
-# --- Distribución del nivel socioeconómico ---
-    if "Nivel_Socioeconómico" in df.columns:
-     st.subheader("Distribución por Nivel Socioeconómico")
-
-    # Calcular proporciones correctamente
-    socio_dist = (
-        df["Nivel_Socioeconómico"]
-        .value_counts(normalize=True)
-        .mul(100)
-        .reset_index()
-        .rename(columns={"index": "Nivel_Socioeconómico", "Nivel_Socioeconómico": "Porcentaje"})
-    )
-
-    # Aseguramos nombres correctos
-    socio_dist.columns = ["Nivel_Socioeconómico", "Porcentaje"]
-
-    fig = px.pie(
-        socio_dist,
-        names="Nivel_Socioeconómico",
-        values="Porcentaje",
-        color="Nivel_Socioeconómico",
-        title="Proporción de Estudiantes por Nivel Socioeconómico",
-        hole=0.4
-    )
-    st.plotly_chart(fig, use_container_width=True)
-
+        if socio:
+            st.subheader("Distribución por Nivel Socioeconómico")
+            fig = chart("pie", socio, C_NSE, "Proporción de Estudiantes por Nivel Socioeconómico")
+            st.plotly_chart(fig, use_container_width=True)
 
         # --- Gráfico complementario (distribución de promedio) ---
-    if "Promedio_General" in df.columns:
+        if bins:
             st.subheader("Distribución de Calificaciones Generales")
-            fig_hist = px.histogram(
-                df,
-                x="Promedio_General",
-                nbins=20,
-                title="Distribución de Calificaciones Promedio",
-                color_discrete_sequence=["#4C78A8"]
-            )
+            fig_hist = chart("histogram", bins, "Distribución de Calificaciones Promedio", C_PROM)
             st.plotly_chart(fig_hist, use_container_width=True)
 
 
-with tabs[1]:
+elif vista == TAB_TITLES[1]:
     st.title("📚 Rendimiento por Materia")
-    if df.empty:
+    subjects, corr_data = load_stats_many(("/stats/subjects", {}), ("/stats/correlation", {}))
+    if not subjects:
         st.info("No hay datos.")
     else:
-        materias = [C_MAT, C_LECT, C_CIEN, C_HIST, C_ARTE, C_EDF]
-        materias = [c for c in materias if c in df.columns]
-
-        if materias:
-            st.markdown("### Promedio por Materia")
-            prom = df[materias].mean().rename("Promedio").reset_index()
-            prom.columns = ["Materia", "Promedio"]
-            st.bar_chart(prom.set_index("Materia")["Promedio"])
-
-            st.markdown("### Correlación entre Materias (Mapa de Calor)")
-            corr = df[materias].corr().round(2)
-            fig, ax = plt.subplots(figsize=(6, 4))
-            sns.heatmap(corr, annot=True, cmap="coolwarm", fmt=".2f", vmin=-1, vmax=1)
-            ax.set_title("Correlación entre Calificaciones por Materia")
-            st.pyplot(fig)
-        else:
-            st.warning("No se detectaron columnas de materias.")
+        st.markdown("### Promedio por Materia")
+        prom = pd.DataFrame(subjects).rename(columns={"materia": "Materia", "promedio": "Promedio"})
+        st.bar_chart(prom.set_index("Materia")["Promedio"])
 
-with tabs[2]:
+        st.markdown("### Correlación entre Materias (Mapa de Calor)")
+        if corr_data:
+            st.image(chart("heatmap", corr_data))
+
+elif vista == TAB_TITLES[2]:
     st.title("📈 Tendencias Académicas")
 
-    if df.empty:
+    if not kpis or not kpis["total_estudiantes"]:
         st.info("No hay datos para mostrar.")
     else:
-        st.markdown("### Tendencia de Asistencia Promedio a lo Largo del Año")
-        # Generamos un eje temporal simulado si no hay fechas
-        meses = [
-            "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio",
-            "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"
-        ]
-        # Simular fluctuaciones de asistencia
-        np.random.seed(42)
-        asistencia_prom = np.clip(np.random.normal(df[C_ASIS].mean(), 3, 12), 60, 100)
-        trend_df = pd.DataFrame({"Mes": meses, "Asistencia Promedio (%)": asistencia_prom})
-        st.line_chart(trend_df.set_index("Mes")["Asistencia Promedio (%)"])
+        # Series del historial mensual agregadas por la API (un punto por periodo)
+        c1, c2, c3 = st.columns(3)
+        escala = c1.radio("Escala", ["mensual", "trimestral", "anual"], horizontal=True, key="tend_escala")
+        segmentar = c2.selectbox("Comparar por", ["Total", C_GRUPO, C_PROF], key="tend_by")
+        materia = c3.selectbox("Materia", MATERIAS, key="tend_materia")
+        by = None if segmentar == "Total" else segmentar
+        asistencia, notas = load_stats_many(
+            ("/trends", {"column": C_ASIS, "escala": escala, "by": by}),
+            ("/trends", {"column": materia, "escala": escala, "by": by}),
+        )
+        if not asistencia:
+            st.info("Aún no hay historial cargado. Cárgalo con: python init_db.py --solo-historial --historial <csv>")
+        else:
+            st.markdown(f"### Tendencia de Asistencia Promedio ({escala})")
+            fig_asis = chart("trend", asistencia, "Asistencia Promedio (%)", by)
+            st.plotly_chart(fig_asis, use_container_width=True)
+            if notas:
+                st.markdown(f"### Tendencia de {materia.replace('Calificación_', '').replace('_', ' ')}")
+                fig_notas = chart("trend", notas, "Calificación Promedio", by)
+                st.plotly_chart(fig_notas, use_container_width=True)
 
         st.markdown("---")
         st.markdown("### 🎯 Relación entre Asistencia y Promedio General")
-        if C_ASIS in df.columns and C_PROM in df.columns:
-            fig2 = px.scatter(
-                df, x=C_ASIS, y=C_PROM, color=C_GRUPO if C_GRUPO in df.columns else None,
-                title="Correlación entre Asistencia y Promedio General",
-                labels={C_ASIS: "Asistencia (%)", C_PROM: "Promedio General"},
-                trendline="ols"
-            )
+        # Puntos acotados por la API y rectas por grupo ajustadas con las sumas precalculadas
+        dispersion, lineas = load_stats_many(
+            ("/stats/scatter", {"x": C_ASIS, "y": C_PROM, "color": C_GRUPO}),
+            ("/stats/regression", {"y": C_PROM, "x": C_ASIS, "by": C_GRUPO}),
+        )
+        if dispersion and dispersion["n"]:
+            fig2 = chart("scatter", dispersion, C_ASIS, C_PROM, C_GRUPO,
+                         "Correlación entre Asistencia y Promedio General",
+                         {C_ASIS: "Asistencia (%)", C_PROM: "Promedio General"}, lineas)
             st.plotly_chart(fig2, use_container_width=True)
         else:
             st.warning("No se encontraron columnas de asistencia y promedio general para el gráfico de correlación.")
 
-with tabs[3]:
+elif vista == TAB_TITLES[3]:
     st.title("🎯 Estudiantes en Riesgo - Intervención Temprana")
 
-    if df.empty:
+    if not kpis:
         st.info("No hay datos para analizar.")
     else:
         st.markdown("""
@@ -254,20 +411,30 @@ with tabs[3]:
         col1, col2 = st.columns(2)
         umbral_promedio = col1.slider("Umbral de calificación mínima", 0.0, 5.0, 3.0, 0.1)
         umbral_asistencia = col2.slider("Umbral mínimo de asistencia (%)", 0.0, 100.0, 75.0, 1.0)
+        umbrales = {"promedio": umbral_promedio, "asistencia": umbral_asistencia}
+
+        # --- Filtro de riesgo (en la API, ordenado por índice) ---
+        # Total, primera página (los casos con menor promedio y asistencia) y tendencias, en paralelo
+        conteo, lineas, *pagina = load_stats_many(
+            ("/at-risk", {"count": True, **umbrales}),
+            ("/stats/regression", {"y": "Promedio_General", "x": "Asistencia_%", "by": "Grupo"}),
+            *([("/at-risk", {"limit": RISK_PAGE, **umbrales})] if filas_por_escuela else []),
+        )
+        conteo = conteo or {"total": 0}
 
-        # --- Filtro de riesgo ---
-        riesgo = df[
-            (df["Promedio_General"] < umbral_promedio) &
-            (df["Asistencia_%"] < umbral_asistencia)
-        ].copy()
-
-        st.subheader(f"🧾 Estudiantes en riesgo detectados: {len(riesgo)}")
+        st.subheader(f"🧾 Estudiantes en riesgo detectados: {conteo['total']}")
 
-        if riesgo.empty:
+        if not conteo["total"]:
             st.success("No se detectaron estudiantes en riesgo según los criterios actuales.")
+        elif not filas_por_escuela:
+            st.info(SOLO_POR_ESCUELA)
+        elif not pagina[0]:
+            # La página no llegó y no hay una copia anterior (el error ya se mostró)
+            st.info("La lista de casos no está disponible en este momento; inténtalo de nuevo.")
         else:
-            # Ordenar por promedio y asistencia
-            riesgo = riesgo.sort_values(by=["Promedio_General", "Asistencia_%"], ascending=[True, True])
+            riesgo = riesgo_label(pd.DataFrame(pagina[0]))
+            if conteo["total"] > len(riesgo):
+                st.caption(f"Mostrando los {len(riesgo)} casos más críticos de {conteo['total']}.")
 
             # Mostrar tabla dinámica
             st.dataframe(
@@ -279,6 +446,7 @@ with tabs[3]:
 
             # Gráfico de riesgo
             st.subheader("📊 Visualización de Riesgo (Asistencia vs Promedio)")
+            import plotly.express as px
             fig = px.scatter(
                 riesgo,
                 x="Asistencia_%",
@@ -287,125 +455,109 @@ with tabs[3]:
                 hover_data=["Nombre"],
                 title="Relación entre Asistencia y Promedio General",
                 labels={"Asistencia_%": "Asistencia (%)", "Promedio_General": "Promedio General"},
-                trendline="ols"
             )
-            st.plotly_chart(fig, use_container_width=True)
+            # Tendencia de cada grupo sobre toda la población, como referencia
+            st.plotly_chart(add_trendlines(fig, lineas, riesgo["Asistencia_%"]), use_container_width=True)
 
-            # Botón de descarga
-            csv = riesgo.to_csv(index=False).encode("utf-8")
-            st.download_button("⬇️ Descargar lista de riesgo (CSV)", csv, "estudiantes_en_riesgo.csv")
+            # Descarga de todos los casos (no solo los de la tabla), generada por la API
+            export_button("⬇️ Descargar lista de riesgo", "export_riesgo",
+                          fields=",".join(riesgo.columns), **umbrales)
 
-with tabs[4]:
-        st.title("🔎 Análisis Demográfico")
+elif vista == TAB_TITLES[4]:
+    st.title("🔎 Análisis Demográfico")
 
-        if df.empty:
-         st.info("No hay datos.")
-        else:
-         st.markdown("Analiza cómo varía el rendimiento por género, etnia y nivel de preparación.")
+    if not kpis or not kpis["total_estudiantes"]:
+        st.info("No hay datos.")
+    else:
+        st.markdown("Analiza cómo varía el rendimiento por género, etnia y nivel de preparación.")
+
+        # Controles
+        col1, col2, col3 = st.columns([1,1,1])
+        materia_sel = col1.selectbox("Selecciona materia", MATERIAS, index=0)
+        demografia = col2.selectbox("Desglosar por", options=[C_GENERO, C_ETNIA, C_PREP])
+        tipo_grafico = col3.selectbox("Tipo de gráfico", options=["Boxplot (distribución)", "Violin (distribución)", "Bar (promedios)"])
+
+        st.markdown("---")
 
-        # Materias disponibles en el dataset
-        materias = [c for c in [C_MAT, C_LECT, C_CIEN, C_HIST, C_ARTE, C_EDF] if c in df.columns]
-        if not materias:
-            st.warning("No se detectaron columnas de materias para analizar.")
+        # Agregados calculados en la API, pedidos en paralelo
+        violin = tipo_grafico == "Violin (distribución)"
+        breakdown, cuantiles, dispersion, lineas = load_stats_many(
+            ("/stats/breakdown", {"by": demografia, "column": materia_sel}),
+            ("/stats/quantiles", {"column": materia_sel, "by": demografia, "bins": 30 if violin else None}),
+            ("/stats/scatter", {"x": C_ASIS, "y": materia_sel, "color": demografia}),
+            ("/stats/regression", {"y": materia_sel, "x": C_ASIS, "by": demografia}),
+        )
+        if not breakdown:
+            st.warning("No hay datos válidos para la materia/segmento seleccionado.")
         else:
-            # Controles
-            col1, col2, col3 = st.columns([1,1,1])
-            materia_sel = col1.selectbox("Selecciona materia", materias, index=0)
-            demografia = col2.selectbox("Desglosar por", options=[C_GENERO, C_ETNIA, C_PREP])
-            tipo_grafico = col3.selectbox("Tipo de gráfico", options=["Boxplot (distribución)", "Violin (distribución)", "Bar (promedios)"])
+            agg = pd.DataFrame(breakdown).rename(columns={"segmento": demografia})
+            st.subheader("Resumen por segmento")
+            st.dataframe(agg.rename(columns={"conteo":"Conteo","media":"Media","mediana":"Mediana"}).round(2))
 
-            st.markdown("---")
+            if tipo_grafico == "Bar (promedios)":
+                st.plotly_chart(chart("bar", breakdown, demografia, materia_sel), use_container_width=True)
+            else:
+                # Cuartiles e histogramas por segmento precalculados en la API
+                if not cuantiles:
+                    st.info("No hay datos para la distribución.")
+                elif violin:
+                    st.plotly_chart(chart("violin", cuantiles, f"Violin plot de {materia_sel} por {demografia}",
+                                          demografia, "Calificación"), use_container_width=True)
+                else:
+                    st.plotly_chart(chart("box", cuantiles, f"Boxplot de {materia_sel} por {demografia}",
+                                          demografia, "Calificación"), use_container_width=True)
 
-            # Filtrar datos limpios para la materia seleccionada
-            df_plot = df[[materia_sel, demografia]].dropna(subset=[materia_sel, demografia]).copy()
-            # Asegurar columna numérica
-            df_plot[materia_sel] = pd.to_numeric(df_plot[materia_sel], errors="coerce")
-            df_plot = df_plot.dropna(subset=[materia_sel])
-            if df_plot.empty:
-                st.warning("No hay datos válidos para la materia/segmento seleccionado.")
+            st.markdown("---")
+            # Opcional: scatter entre asistencia y materia coloreado por demografía
+            st.subheader(f"Scatter: Asistencia vs {materia_sel} (coloreado por {demografia})")
+            if dispersion and dispersion["n"]:
+                fig2 = chart("scatter", dispersion, C_ASIS, materia_sel, demografia,
+                             f"Asistencia vs {materia_sel} por {demografia}",
+                             {C_ASIS: "Asistencia (%)", materia_sel: "Calificación"}, lineas)
+                st.plotly_chart(fig2, use_container_width=True)
             else:
-                # Mostrar resumen rápido (tabla agregada)
-                agg = df_plot.groupby(demografia)[materia_sel].agg(["count", "mean", "median"]).reset_index().sort_values("mean", ascending=False)
-                st.subheader("Resumen por segmento")
-                st.dataframe(agg.rename(columns={"count":"Conteo","mean":"Media","median":"Mediana"}).round(2))
-
-                # Gráficos interactivos con Plotly
-                import plotly.express as px
-
-                if tipo_grafico == "Boxplot (distribución)":
-                    fig = px.box(
-                        df_plot, x=demografia, y=materia_sel, points="outliers",
-                        title=f"Boxplot de {materia_sel} por {demografia}",
-                        labels={demografia: demografia, materia_sel: "Calificación"}
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-
-                elif tipo_grafico == "Violin (distribución)":
-                    fig = px.violin(
-                        df_plot, x=demografia, y=materia_sel, box=True, points="all",
-                        title=f"Violin plot de {materia_sel} por {demografia}",
-                        labels={demografia: demografia, materia_sel: "Calificación"}
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-
-                else:  # Bar (promedios)
-                    mean_df = df_plot.groupby(demografia)[materia_sel].mean().reset_index().sort_values(materia_sel, ascending=False)
-                    fig = px.bar(
-                        mean_df, x=demografia, y=materia_sel, text=round(mean_df[materia_sel],2),
-                        title=f"Promedio de {materia_sel} por {demografia}",
-                        labels={demografia: demografia, materia_sel: "Promedio"}
-                    )
-                    fig.update_traces(textposition='outside')
-                    st.plotly_chart(fig, use_container_width=True)
-
-                st.markdown("---")
-                # Opcional: scatter entre asistencia y materia coloreado por demografía
-                if C_ASIS in df.columns:
-                    st.subheader(f"Scatter: Asistencia vs {materia_sel} (coloreado por {demografia})")
-                    df_sc = df[[C_ASIS, materia_sel, demografia]].dropna().copy()
-                    df_sc[C_ASIS] = pd.to_numeric(df_sc[C_ASIS], errors="coerce")
-                    df_sc[materia_sel] = pd.to_numeric(df_sc[materia_sel], errors="coerce")
-                    df_sc = df_sc.dropna()
-                    if not df_sc.empty:
-                        fig2 = px.scatter(
-                            df_sc, x=C_ASIS, y=materia_sel, color=demografia,
-                            hover_data=[demografia, C_ASIS, materia_sel],
-                            trendline="ols",
-                            title=f"Asistencia vs {materia_sel} por {demografia}",
-                            labels={C_ASIS: "Asistencia (%)", materia_sel: "Calificación"}
-                        )
-                        st.plotly_chart(fig2, use_container_width=True)
-                    else:
-                        st.info("No hay datos suficientes para el scatter de asistencia.")
-
-with tabs[5]:
+                st.info("No hay datos suficientes para el scatter de asistencia.")
+
+elif vista == TAB_TITLES[5]:
     st.title("🔍 Detalle por Curso / Profesor")
 
-    if df.empty:
+    if not kpis or not kpis["total_estudiantes"]:
         st.info("No hay datos.")
     else:
         st.markdown("Selecciona un **Profesor** o un **Curso / Grupo** para ver estadísticas y la lista de estudiantes asociados.")
 
         # controles: Profesor y Grupo (curso)
         colp, colg, cols = st.columns([1,1,1])
-        profesor_list = sorted(df[C_PROF].dropna().unique().tolist()) if C_PROF in df.columns else []
-        grupo_list = sorted(df[C_GRUPO].dropna().unique().tolist()) if C_GRUPO in df.columns else []
+        profesores, grupos = load_stats_many(
+            ("/stats/distribution", {"column": C_PROF}), ("/stats/distribution", {"column": C_GRUPO}),
+        )
+        profesor_list = sorted(d["valor"] for d in profesores or [])
+        grupo_list = sorted(d["valor"] for d in grupos or [])
 
         profesor_sel = colp.selectbox("Filtrar por Profesor (opcional)", ["(Todos)"] + profesor_list, index=0)
         grupo_sel = colg.selectbox("Filtrar por Grupo/Curso (opcional)", ["(Todos)"] + grupo_list, index=0)
 
         # elegir materia para ver estadísticas
-        materias = [c for c in [C_MAT, C_LECT, C_CIEN, C_HIST, C_ARTE, C_EDF] if c in df.columns]
-        materia_sel = cols.selectbox("Selecciona materia para estadísticas", ["(Ninguna)"] + materias, index=0)
+        materia_sel = cols.selectbox("Selecciona materia para estadísticas", ["(Ninguna)"] + MATERIAS, index=0)
 
-        # aplicar filtros
-        df_filtered = df.copy()
-        if profesor_sel and profesor_sel != "(Todos)":
-            df_filtered = df_filtered[df_filtered[C_PROF] == profesor_sel]
-        if grupo_sel and grupo_sel != "(Todos)":
-            df_filtered = df_filtered[df_filtered[C_GRUPO] == grupo_sel]
+        # filtros que se envían a la API
+        filtros = {
+            "profesor": profesor_sel if profesor_sel != "(Todos)" else None,
+            "grupo": grupo_sel if grupo_sel != "(Todos)" else None,
+        }
 
-        st.markdown(f"**Registros encontrados:** {len(df_filtered)}")
+        # Filas de los estudiantes: solo esta vista las descarga
+        if not filas_por_escuela:
+            st.info(SOLO_POR_ESCUELA)
+            st.stop()
+        conteo = load_stats("/students", count=True, **filtros) or {"total": 0}
+
+        # Paginación por clave: cursores de las páginas ya vistas, por combinación de filtros
+        paginas = st.session_state.setdefault("paginas_detalle", {})
+        cursores = paginas.setdefault((ESCUELA, *filtros.values()), [None])
+        df_filtered, siguiente = load_students(cursores[-1], **filtros)
+
+        st.markdown(f"**Registros encontrados:** {conteo['total']}")
 
         if len(df_filtered) == 0:
             st.warning("No existen registros con los filtros seleccionados.")
@@ -416,65 +568,69 @@ with tabs[5]:
             query_name = search_col1.text_input("Buscar por nombre (parcial)", "")
             query_id = search_col2.text_input("Buscar por ID (exacto)", "")
 
-            table_df = df_filtered.copy()
-            if query_name:
-                table_df = table_df[table_df[C_NAME].astype(str).str.contains(query_name, case=False, na=False)]
-            if query_id:
-                table_df = table_df[table_df[C_ID].astype(str) == str(query_id)]
+            # La búsqueda usa el índice de la API (sin distinguir mayúsculas ni tildes);
+            # el ID, si se indica, tiene prioridad sobre el nombre
+            consulta = query_id.strip() or query_name.strip()
+            id_invalido = query_id.strip() and not query_id.strip().isdigit()
+            if id_invalido:
+                st.warning("El ID debe ser numérico.")
+                table_df = df_filtered.iloc[0:0]
+            elif consulta:
+                table_df, hay_mas = search_students(consulta, **filtros)
+                if hay_mas:
+                    st.caption(f"Se muestran los primeros {SEARCH_LIMIT} resultados; escribe más para acotar.")
+            else:
+                table_df = df_filtered
+                desde = (len(cursores) - 1) * STUDENTS_PAGE
+                st.caption(f"Estudiantes {desde + 1}–{desde + len(df_filtered)} de {conteo['total']}, en orden de ID.")
+                nav1, nav2, _ = st.columns([1, 1, 4])
+                if nav1.button("◀ Anterior", disabled=len(cursores) == 1):
+                    cursores.pop()
+                    st.rerun()
+                if nav2.button("Siguiente ▶", disabled=siguiente is None):
+                    cursores.append(siguiente)
+                    st.rerun()
 
             # columnas a mostrar
             show_cols = [C_ID, C_NAME, C_GENERO, C_ETNIA, C_GRUPO, C_PROF, C_PROM, C_ASIS, C_RIESGO]
             show_cols = [c for c in show_cols if c in table_df.columns]
             st.dataframe(table_df[show_cols].reset_index(drop=True), use_container_width=True)
 
-            # Estadísticas por materia seleccionada
+            # Estadísticas por materia seleccionada (calculadas en la API con los filtros)
             if materia_sel and materia_sel != "(Ninguna)":
                 st.subheader(f"Estadísticas de {materia_sel} (filtro aplicado)")
-                # asegurar tipo numérico
-                table_df[materia_sel] = pd.to_numeric(table_df[materia_sel], errors="coerce")
-                table_df[C_ASIS] = pd.to_numeric(table_df[C_ASIS], errors="coerce") if C_ASIS in table_df.columns else None
+                stats, bins, dispersion, lineas = load_stats_many(
+                    ("/stats/describe", {"column": materia_sel, **filtros}),
+                    ("/stats/histogram", {"column": materia_sel, "bins": 20, **filtros}),
+                    ("/stats/scatter", {"x": C_ASIS, "y": materia_sel, "color": C_GRUPO, **filtros}),
+                    ("/stats/regression", {"y": materia_sel, "x": C_ASIS, "by": C_GRUPO, **filtros}),
+                )
+                stats = stats or {}
 
-                n = int(table_df[materia_sel].count())
-                mean = float(table_df[materia_sel].mean()) if n>0 else np.nan
-                median = float(table_df[materia_sel].median()) if n>0 else np.nan
-                std = float(table_df[materia_sel].std()) if n>1 else np.nan
-                minv = float(table_df[materia_sel].min()) if n>0 else np.nan
-                maxv = float(table_df[materia_sel].max()) if n>0 else np.nan
+                def fmt(v):
+                    return f"{v:.2f}" if v is not None else "N/A"
 
                 c1, c2, c3, c4 = st.columns(4)
-                c1.metric("Registros válidos", f"{n}")
-                c2.metric("Media", f"{mean:.2f}" if not np.isnan(mean) else "N/A")
-                c3.metric("Mediana", f"{median:.2f}" if not np.isnan(median) else "N/A")
-                c4.metric("Desviación estándar", f"{std:.2f}" if not np.isnan(std) else "N/A")
+                c1.metric("Registros válidos", f"{stats.get('n', 0)}")
+                c2.metric("Media", fmt(stats.get("media")))
+                c3.metric("Mediana", fmt(stats.get("mediana")))
+                c4.metric("Desviación estándar", fmt(stats.get("desviacion")))
 
                 # Histograma de la materia
                 st.markdown("**Distribución de calificaciones**")
-                try:
-                    fig_hist = px.histogram(table_df, x=materia_sel, nbins=20, title=f"Distribución de {materia_sel}")
-                    st.plotly_chart(fig_hist, use_container_width=True)
-                except Exception:
-                    st.write(table_df[materia_sel].describe())
+                if bins:
+                    st.plotly_chart(chart("histogram", bins, f"Distribución de {materia_sel}", materia_sel),
+                                    use_container_width=True)
 
                 # Scatter: Asistencia vs Nota (si hay Asistencia)
-                if C_ASIS in table_df.columns and table_df[C_ASIS].notna().sum() > 0:
+                if dispersion and dispersion["n"]:
                     st.markdown("**Asistencia vs Calificación (scatter)**")
-                    df_sc = table_df.dropna(subset=[materia_sel, C_ASIS]).copy()
-                    if not df_sc.empty:
-                        try:
-                            fig_sc = px.scatter(
-                                df_sc,
-                                x=C_ASIS,
-                                y=materia_sel,
-                                color=C_GRUPO if C_GRUPO in df_sc.columns else None,
-                                hover_data=[C_NAME, C_ID],
-                                trendline="ols",
-                                title=f"Asistencia (%) vs {materia_sel}"
-                            )
-                            st.plotly_chart(fig_sc, use_container_width=True)
-                        except Exception:
-                            st.write(df_sc[[C_ASIS, materia_sel]].head(50))
-                # descargar filtrado
-                csv = table_df.to_csv(index=False).encode("utf-8")
-                st.download_button("⬇️ Descargar datos filtrados (CSV)", csv, "detalle_filtrado.csv")
+                    fig_sc = chart("scatter", dispersion, C_ASIS, materia_sel, C_GRUPO,
+                                   f"Asistencia (%) vs {materia_sel}",
+                                   {C_ASIS: "Asistencia (%)", materia_sel: "Calificación"}, lineas)
+                    st.plotly_chart(fig_sc, use_container_width=True)
+                # descargar filtrado (mismos filtros y búsqueda, generado por la API)
+                if not id_invalido:
+                    export_button("⬇️ Descargar datos filtrados", "export_detalle", q=consulta or None, **filtros)
             else:
                 st.info("Selecciona una materia para ver estadísticas y gráficos específicos de ese grupo.")
@@ -0,0 +1,271 @@
+"""Figuras del dashboard y caché en disco de las ya dibujadas.
+
+Todas se construyen a partir de respuestas de la API (agregados de unos KB).
+``render`` guarda cada figura en disco con una clave de tipo de gráfico,
+versión de los datos y parámetros (incluidos los datos recibidos): PNG o SVG
+para el mapa de calor de matplotlib y JSON de plotly para el resto. Repetir
+una vista cuesta leer un archivo en lugar de volver a dibujar, también entre
+sesiones, procesos de Streamlit y reinicios.
+
+matplotlib, seaborn y plotly.express se importan al dibujar la primera figura
+que los usa: solo importarlos tarda más de un segundo, y con la caché llena
+muchas vistas no los necesitan (reconstruir una figura basta con plotly.io).
+
+``CHART_CACHE_DIR`` fija el directorio (por defecto uno temporal) y
+``CHART_CACHE_MB`` su tamaño máximo: al superarlo se borran los archivos
+usados hace más tiempo.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from io import BytesIO
+from pathlib import Path
+
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+CACHE_DIR = Path(os.environ.get("CHART_CACHE_DIR") or Path(tempfile.gettempdir()) / "dashboard-charts")
+CACHE_MAX_BYTES = int(os.environ.get("CHART_CACHE_MB", "128")) * 1024 * 1024
+# Al desalojar se baja hasta esta fracción del máximo para no desalojar en cada escritura
+EVICT_TO = 0.9
+
+C_ID = "ID_Estudiante"
+C_NAME = "Nombre"
+
+
+# ----- CACHÉ EN DISCO -----
+class ChartCache:
+    """Archivos ``<clave>.<formato>`` con tamaño total acotado (LRU por fecha de modificación).
+
+    Las escrituras son atómicas (archivo temporal y ``os.replace``): otro
+    proceso nunca lee una figura a medias, y un archivo borrado al desalojar
+    mientras se lee cuenta como un fallo de caché.
+    """
+
+    def __init__(self, path=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.path, self.max_bytes = Path(path), max_bytes
+        self._lock = threading.Lock()
+
+    def get(self, key, ext):
+        file = self.path / f"{key}.{ext}"
+        try:
+            data = file.read_bytes()
+            # La fecha de modificación marca el último uso
+            os.utime(file)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key, ext, data):
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            tmp = self.path / f".{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+            tmp.write_bytes(data)
+            os.replace(tmp, self.path / f"{key}.{ext}")
+            with self._lock:
+                self._evict()
+        except OSError:
+            # Sin disco escribible la figura se dibuja igual, solo que no se guarda
+            pass
+
+    def _evict(self):
+        files = []
+        for entry in os.scandir(self.path):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes * EVICT_TO:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for entry in os.scandir(self.path) if self.path.exists() else ():
+            if entry.is_file():
+                os.remove(entry.path)
+
+
+cache = ChartCache()
+
+
+# ----- FIGURAS -----
+def correlation_heatmap(corr_data, fmt="png"):
+    """Mapa de calor de /stats/correlation como imagen (PNG o SVG)."""
+    import seaborn as sns
+    from matplotlib.figure import Figure
+    corr = pd.DataFrame(corr_data["matriz"], index=corr_data["columnas"],
+                        columns=corr_data["columnas"]).astype(float).round(2)
+    # Figure sin pyplot: no comparte estado global entre los hilos de Streamlit
+    fig = Figure(figsize=(6, 4))
+    ax = fig.subplots()
+    sns.heatmap(corr, annot=True, cmap="coolwarm", fmt=".2f", vmin=-1, vmax=1, ax=ax)
+    ax.set_title("Correlación entre Calificaciones por Materia")
+    buf = BytesIO()
+    fig.savefig(buf, format=fmt, dpi=200, bbox_inches="tight")
+    return buf.getvalue()
+
+def pie_figure(distribution, column, title):
+    """Proporciones de /stats/distribution."""
+    import plotly.express as px
+    dist = pd.DataFrame(distribution).rename(columns={"valor": column, "porcentaje": "Porcentaje"})
+    return px.pie(dist, names=column, values="Porcentaje", color=column, title=title, hole=0.4)
+
+def bar_figure(breakdown, by, column):
+    """Media por segmento de /stats/breakdown."""
+    import plotly.express as px
+    agg = pd.DataFrame(breakdown).rename(columns={"segmento": by})
+    fig = px.bar(
+        agg, x=by, y="media", text=agg["media"].round(2),
+        title=f"Promedio de {column} por {by}",
+        labels={by: by, "media": "Promedio"}
+    )
+    fig.update_traces(textposition="outside")
+    return fig
+
+def trend_figure(trends, y_label, by=None):
+    """Serie por periodo de /trends (una línea por segmento si se desglosa)."""
+    import plotly.express as px
+    return px.line(pd.DataFrame(trends), x="periodo", y="media", color="segmento" if by else None,
+                   markers=True, labels={"periodo": "Periodo", "media": y_label, "segmento": by or "Total"})
+
+def histogram_figure(bins, title, x_label):
+    """Dibuja como barras contiguas los bins que devuelve /stats/histogram."""
+    import plotly.express as px
+    hist = pd.DataFrame(bins)
+    hist["centro"] = (hist["desde"] + hist["hasta"]) / 2
+    fig = px.bar(hist, x="centro", y="conteo", title=title,
+                 labels={"centro": x_label, "conteo": "Estudiantes"},
+                 color_discrete_sequence=["#4C78A8"])
+    fig.update_traces(width=float(hist["hasta"].iloc[0] - hist["desde"].iloc[0]))
+    fig.update_layout(bargap=0)
+    return fig
+
+def add_trendlines(fig, lines, x_values):
+    """Añade las rectas de /stats/regression (una por segmento) sobre el rango de x del gráfico."""
+    x = pd.Series(x_values).dropna()
+    if x.empty or not lines:
+        return fig
+    x0, x1 = float(x.min()), float(x.max())
+    colores = {str(t.name): t.marker.color for t in fig.data if t.type == "scatter"}
+    for r in lines:
+        if r["pendiente"] is None:
+            continue
+        seg = str(r["segmento"])
+        fig.add_trace(go.Scatter(
+            x=[x0, x1], y=[r["intercepto"] + r["pendiente"] * x0, r["intercepto"] + r["pendiente"] * x1],
+            mode="lines", line=dict(color=colores.get(seg)), showlegend=False,
+            name=f"Tendencia {seg}" if seg != "*" else "Tendencia",
+            hovertemplate=f"pendiente={r['pendiente']:.4f}<br>R²={r['r2'] or 0:.3f}<extra>{seg}</extra>",
+        ))
+    return fig
+
+def scatter_figure(scatter, x, y, color, title, labels, lines=None):
+    """Dispersión de /stats/scatter: rejilla de densidad más los puntos individuales.
+
+    Con pocos estudiantes la API devuelve todos los puntos; con muchos, los
+    conteos por celda y solo los atípicos y los de mayor riesgo, así que el
+    navegador recibe como mucho el presupuesto de puntos.
+    """
+    puntos = pd.DataFrame(scatter["puntos"])
+    if color and not puntos.empty:
+        puntos[color] = puntos[color].astype(str)
+    hover = [c for c in (C_NAME, C_ID, "tipo") if c in puntos.columns]
+    if puntos.empty:
+        fig = go.Figure()
+    else:
+        import plotly.express as px
+        fig = px.scatter(puntos, x=x, y=y, color=color, hover_data=hover, labels=labels)
+    xs = list(puntos[x]) if not puntos.empty else []
+    if scatter["celdas"]:
+        celdas = pd.DataFrame(scatter["celdas"])
+        fig.add_trace(go.Heatmap(
+            x=celdas["x"], y=celdas["y"], z=celdas["conteo"], colorscale="Greys", opacity=0.6,
+            colorbar=dict(title="Estudiantes"), hovertemplate="Estudiantes: %{z}<extra></extra>",
+        ))
+        fig.data = fig.data[-1:] + fig.data[:-1]
+        xs += list(celdas["x"])
+        title += f" ({scatter['n']:,} estudiantes; densidad + atípicos y en riesgo)"
+    fig.update_layout(title=title, xaxis_title=labels.get(x, x), yaxis_title=labels.get(y, y))
+    return add_trendlines(fig, lines, xs)
+
+def box_figure(quantiles, title, x_label, y_label):
+    """Boxplot a partir de los cuartiles y bigotes de /stats/quantiles (sin filas individuales)."""
+    q = pd.DataFrame(quantiles)
+    fig = go.Figure(go.Box(
+        x=q["segmento"], q1=q["q1"], median=q["mediana"], q3=q["q3"],
+        lowerfence=q["bigote_inferior"], upperfence=q["bigote_superior"],
+        marker_color="#4C78A8", name=y_label,
+    ))
+    fig.update_layout(title=title, xaxis_title=x_label, yaxis_title=y_label)
+    return fig
+
+def violin_figure(quantiles, title, x_label, y_label):
+    """Violín dibujado con el histograma de cada segmento, reflejado a ambos lados."""
+    fig = go.Figure()
+    for i, seg in enumerate(quantiles):
+        hist = pd.DataFrame(seg["histograma"])
+        centro = (hist["desde"] + hist["hasta"]) / 2
+        ancho = 0.4 * hist["conteo"] / max(hist["conteo"].max(), 1)
+        fig.add_trace(go.Scatter(
+            x=list(i - ancho) + list(i + ancho[::-1]), y=list(centro) + list(centro[::-1]),
+            fill="toself", mode="lines", line_shape="spline", name=str(seg["segmento"]),
+        ))
+        fig.add_trace(go.Scatter(
+            x=[i, i], y=[seg["q1"], seg["q3"]], mode="lines", line=dict(color="black", width=4),
+            showlegend=False, hoverinfo="skip",
+        ))
+        fig.add_trace(go.Scatter(
+            x=[i], y=[seg["mediana"]], mode="markers", marker=dict(color="white", line=dict(width=1)),
+            showlegend=False, hovertext=f"Mediana: {seg['mediana']:.2f}",
+        ))
+    fig.update_layout(
+        title=title, yaxis_title=y_label, xaxis_title=x_label,
+        xaxis=dict(tickvals=list(range(len(quantiles))), ticktext=[str(s["segmento"]) for s in quantiles]),
+    )
+    return fig
+
+# Tipos de gráfico de ``render``; las imágenes devuelven bytes y el resto figuras de plotly
+FIGURES = {
+    "heatmap": correlation_heatmap,
+    "pie": pie_figure,
+    "bar": bar_figure,
+    "trend": trend_figure,
+    "histogram": histogram_figure,
+    "scatter": scatter_figure,
+    "box": box_figure,
+    "violin": violin_figure,
+}
+IMAGES = {"heatmap"}
+
+
+def cache_key(kind, version, args, kwargs):
+    raw = json.dumps([kind, version, args, kwargs], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def render(kind, version, *args, **kwargs):
+    """Figura ``FIGURES[kind](*args, **kwargs)`` desde la caché en disco o recién dibujada.
+
+    ``version`` es la versión de los datos de la API (/health). Las imágenes
+    se devuelven como bytes (``fmt="png"`` o ``"svg"``); el resto, como figura
+    de plotly reconstruida a partir de su JSON.
+    """
+    image = kind in IMAGES
+    ext = kwargs.get("fmt", "png") if image else "json"
+    key = cache_key(kind, version, args, kwargs)
+    data = cache.get(key, ext)
+    if data is not None:
+        return data if image else pio.from_json(data.decode())
+    result = FIGURES[kind](*args, **kwargs)
+    cache.put(key, ext, result if image else result.to_json().encode())
+    return result